@@ -0,0 +1,67 @@
+"""Benchmark of applying chained transformations one after the other and as a single composed operator.
+
+Usage: python benchmarks/benchmark_fused_transformations.py
+"""
+import time
+
+import torch
+
+from lifesimmc.util.operators import BlockDiagonalOperator, DenseOperator, compose_operators
+
+
+def apply_sequentially(operators, templates):
+    """Apply the transformations to the templates one after the other (previous implementation)."""
+    for operator in operators:
+        templates = operator.apply_to_templates(templates)
+
+    return templates
+
+
+def apply_fused(operators, templates):
+    """Compose the transformations and apply them to the templates at once."""
+    return compose_operators(operators).apply_to_templates(templates)
+
+
+def time_function(function, *args, repeats=3, **kwargs):
+    """Return the best wall time of several calls of a function in seconds."""
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def get_operators(nk, nl, n_operators):
+    """Return a chain of a dense whitening followed by block diagonal normalizations."""
+    operators = [DenseOperator(torch.rand(nk * nl, nk * nl))]
+    operators += [BlockDiagonalOperator(torch.diag_embed(torch.rand(nk, nl))) for _ in range(n_operators - 1)]
+
+    return operators
+
+
+def main(nk=2, nl=30, nt=200, grid_sizes=(10, 20, 40), chain_lengths=(2, 3)):
+    print(f'{"grid size":>10}{"chain":>8}{"sequential (s)":>17}{"fused (s)":>12}{"speedup":>10}')
+
+    for ng in grid_sizes:
+        templates = torch.rand(nk, nl, nt, ng, ng)
+
+        for n_operators in chain_lengths:
+            operators = get_operators(nk, nl, n_operators)
+
+            t_sequential = time_function(apply_sequentially, operators, templates)
+            t_fused = time_function(apply_fused, operators, templates)
+
+            assert torch.allclose(
+                apply_sequentially(operators, templates),
+                apply_fused(operators, templates),
+                rtol=1e-4
+            )
+
+            print(f'{ng:>10}{n_operators:>8}{t_sequential:>17.3f}{t_fused:>12.3f}{t_sequential / t_fused:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
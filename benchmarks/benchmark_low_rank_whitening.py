@@ -0,0 +1,52 @@
+"""Benchmark of the dense and the low-rank plus diagonal whitening for increasing numbers of spectral channels.
+
+Usage: python benchmarks/benchmark_low_rank_whitening.py
+"""
+import time
+
+import torch
+
+from lifesimmc.core.modules.processing.zca_whitening_module import ZCAWhiteningModule
+from lifesimmc.util.operators import DenseOperator
+
+
+def whiten_dense(noise_ref, data):
+    """Whiten the data with the symmetric inverse square root of the sample covariance (previous implementation)."""
+    U, S, _ = torch.linalg.svd(torch.cov(noise_ref))
+    return DenseOperator(U @ torch.diag(1 / torch.sqrt(S)) @ U.T).apply_batch(data)
+
+
+def whiten_low_rank(module, noise_ref, data):
+    """Whiten the data with the whitening transformation of a low-rank plus diagonal covariance."""
+    return module._get_low_rank_whitening(noise_ref).apply_batch(data)
+
+
+def time_function(function, *args, repeats=3, **kwargs):
+    """Return the best wall time of several calls of a function in seconds."""
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main(nk=3, nt=1000, rank=10, channel_counts=(100, 400, 1600)):
+    module = ZCAWhiteningModule('setup', 'data', 'data_white', 'zca', covariance='low_rank', rank=rank)
+    print(f'{"channels":>10}{"dense (s)":>12}{"low rank (s)":>15}{"speedup":>10}')
+
+    for nl in channel_counts:
+        factor = torch.randn(nk * nl, rank)
+        noise_ref = factor @ torch.randn(rank, nt) + torch.randn(nk * nl, nt)
+        data = (factor @ torch.randn(rank, nt) + torch.randn(nk * nl, nt)).reshape(nk, nl, nt)
+
+        t_dense = time_function(whiten_dense, noise_ref, data, repeats=1)
+        t_low_rank = time_function(whiten_low_rank, module, noise_ref, data)
+
+        print(f'{nk * nl:>10}{t_dense:>12.3f}{t_low_rank:>15.3f}{t_dense / t_low_rank:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
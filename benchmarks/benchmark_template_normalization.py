@@ -0,0 +1,56 @@
+"""Benchmark of the per-pixel and the batched normalization of templates.
+
+Usage: python benchmarks/benchmark_template_normalization.py
+"""
+import time
+from itertools import product
+
+import torch
+
+from lifesimmc.util.matrix import apply_matrices_to_templates
+
+
+def normalize_per_pixel(matrices, templates):
+    """Normalize the templates with one matrix multiplication per grid pixel (previous implementation)."""
+    templates_out = torch.zeros(templates.shape, dtype=templates.dtype, device=templates.device)
+
+    for k in range(templates.shape[0]):
+        for i, j in product(range(templates.shape[-2]), range(templates.shape[-1])):
+            templates_out[k, :, :, i, j] = matrices[k] @ templates[k, :, :, i, j]
+
+    return templates_out
+
+
+def time_function(function, *args, repeats=3, **kwargs):
+    """Return the best wall time of several calls of a function in seconds."""
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main(nk=2, nl=30, nt=200, grid_sizes=(10, 20, 40, 60)):
+    print(f'{"grid size":>10}{"per pixel (s)":>16}{"batched (s)":>14}{"chunked (s)":>14}{"speedup":>10}')
+
+    for ng in grid_sizes:
+        templates = torch.rand(nk, nl, nt, ng, ng)
+        matrices = torch.diag_embed(torch.rand(nk, nl))
+
+        t_loop = time_function(normalize_per_pixel, matrices, templates, repeats=1)
+        t_batched = time_function(apply_matrices_to_templates, matrices, templates)
+        t_chunked = time_function(apply_matrices_to_templates, matrices, templates, chunk_size=max(1, ng // 4))
+
+        assert torch.allclose(
+            normalize_per_pixel(matrices, templates),
+            apply_matrices_to_templates(matrices, templates)
+        )
+
+        print(f'{ng:>10}{t_loop:>16.3f}{t_batched:>14.3f}{t_chunked:>14.3f}{t_loop / t_batched:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
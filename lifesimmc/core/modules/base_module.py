@@ -3,6 +3,10 @@ from typing import Union
 
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.resource_collection import ResourceCollection
+from lifesimmc.core.resources.spilled_resource import SpilledResource
+from lifesimmc.util.cache import LRUCache
+from lifesimmc.util.hashing import get_fingerprint
+from lifesimmc.util.template_store import TemplateStore
 
 
 class BaseModule(ABC):
@@ -20,7 +24,12 @@ class BaseModule(ABC):
         The size of the time step.
     device : str or None
         The device to use.
+    uses_random_numbers : bool
+        Whether the module draws from the global random number generators. The pipeline runs such modules in the
+        order in which they have been added, so that results are reproducible when independent modules run
+        concurrently.
     """
+    uses_random_numbers = False
 
     def __init__(self):
         """Constructor method."""
@@ -31,6 +40,94 @@ class BaseModule(ABC):
         self.device = None
         self.resources = None
 
+    def _get_resource_names(self, suffix: str) -> list[str]:
+        """Get the resource names declared by the attributes n_*_<suffix> of the module.
+
+        Parameters
+        ----------
+        suffix : str
+            The suffix of the attributes, i.e. 'in' or 'out'.
+
+        Returns
+        -------
+        list[str]
+            The resource names.
+        """
+        names = []
+
+        for attribute, value in vars(self).items():
+            if not attribute.startswith('n_') or not attribute.endswith(f'_{suffix}'):
+                continue
+
+            values = value if isinstance(value, (tuple, list)) else [value]
+            names.extend(value for value in values if isinstance(value, str))
+
+        return names
+
+    def get_input_names(self) -> list[str]:
+        """Get the names of the input resources of the module, as declared by its n_*_in attributes.
+
+        Returns
+        -------
+        list[str]
+            The names of the input resources.
+        """
+        return self._get_resource_names('in')
+
+    def get_output_names(self) -> list[str]:
+        """Get the names of the output resources of the module, as declared by its n_*_out attributes.
+
+        Returns
+        -------
+        list[str]
+            The names of the output resources.
+        """
+        return self._get_resource_names('out')
+
+    def estimate_output_bytes(self, input_bytes: dict[str, Union[int, None]]) -> dict[str, Union[int, None]]:
+        """Estimate the sizes of the output resources before the module is run, e.g. for a dry run of the pipeline.
+
+        By default, each output is assumed to be as large as the largest input, which holds for most processing
+        modules. Modules whose outputs are much larger or smaller than their inputs should override this method.
+
+        Parameters
+        ----------
+        input_bytes : dict[str, int or None]
+            The sizes of the input resources in bytes or None if they are unknown.
+
+        Returns
+        -------
+        dict[str, int or None]
+            The estimated sizes of the output resources in bytes or None if they are unknown.
+        """
+        sizes = list(input_bytes.values())
+        size = max(sizes) if sizes and None not in sizes else None
+
+        return {name: size for name in self.get_output_names()}
+
+    def get_fingerprint(self, input_fingerprints: list[str]) -> str:
+        """Get a fingerprint of the module that identifies its outputs.
+
+        The fingerprint depends on the class of the module, its parameters, including the seed, and the fingerprints
+        of its inputs. Caches and stores do not change the outputs of a module and are therefore not included.
+
+        Parameters
+        ----------
+        input_fingerprints : list[str]
+            The fingerprints of the input resources.
+
+        Returns
+        -------
+        str
+            The fingerprint of the module.
+        """
+        parameters = {
+            key: value for key, value in vars(self).items()
+            if key != 'resources' and not isinstance(value, (LRUCache, TemplateStore))
+        }
+
+        return get_fingerprint(type(self).__module__, type(self).__qualname__, parameters, input_fingerprints)
+
     def get_resource_from_name(self, name: str) -> Union[BaseResource, None]:
         """Get the resource from the name.
 
@@ -48,6 +145,12 @@ class BaseModule(ABC):
 
         if resource is None:
             raise ValueError(f"Resource '{name}' not found in {self.__class__.__name__}.")
+
+        # Load resources that have been spilled to disk by the pipeline
+        if isinstance(resource, SpilledResource):
+            resource = resource.load()
+            self.resources[name] = resource
+
         return resource
 
     @abstractmethod
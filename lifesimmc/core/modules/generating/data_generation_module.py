@@ -1,8 +1,12 @@
+from typing import Union
+
+import torch
 from rich.console import Console
 
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.setup_resource import SetupResource
 
 
 class DataGenerationModule(BaseModule):
@@ -16,9 +20,13 @@ class DataGenerationModule(BaseModule):
             The name of the output data resource.
         kernels : bool
             Whether to use kernels or not.
+        n_realizations : int
+            The number of realizations that are generated and stacked along a new first axis. If None, a single
+            realization is generated.
     """
+    uses_random_numbers = True
 
-    def __init__(self, n_setup_in: str, n_data_out: str, kernels: bool = True):
+    def __init__(self, n_setup_in: str, n_data_out: str, kernels: bool = True, n_realizations: int = None):
         """Constructor method.
 
         Parameters
@@ -29,11 +37,44 @@ class DataGenerationModule(BaseModule):
             The name of the output data resource.
         kernels : bool
             Whether to use kernels or not.
+        n_realizations : int, optional
+            The number of realizations that are generated and stacked along a new first axis, resulting in data of
+            shape (n_realizations x n_diff_out x n_wavelengths x n_time_steps). If None, a single realization is
+            generated.
         """
         super().__init__()
         self.n_setup_in = n_setup_in
         self.n_data_out = n_data_out
         self.kernels = kernels
+        self.n_realizations = n_realizations
+
+    def estimate_output_bytes(self, input_bytes: dict[str, Union[int, None]]) -> dict[str, Union[int, None]]:
+        """Estimate the size of the data from the setup resource if it is already in the pipeline.
+
+        Parameters
+        ----------
+        input_bytes : dict[str, int or None]
+            The sizes of the input resources in bytes or None if they are unknown.
+
+        Returns
+        -------
+        dict[str, int or None]
+            The estimated size of the output data resource in bytes or None if it is unknown.
+        """
+        r_setup_in = self.resources.get(self.n_setup_in) if self.resources is not None else None
+
+        if not isinstance(r_setup_in, SetupResource):
+            return {self.n_data_out: None}
+
+        phringe = r_setup_in.phringe
+        n_counts = (
+                len(phringe._instrument._response_kernels_torch)
+                * len(phringe.get_wavelength_bin_centers())
+                * len(phringe.simulation_time_steps)
+                * (self.n_realizations or 1)
+        )
+
+        return {self.n_data_out: n_counts * torch.get_default_dtype().itemsize}
 
     def run(self, pipeline_resources: list[BaseResource]) -> tuple[DataResource]:
         """Use PHRINGE to generate synthetic data.
@@ -54,7 +95,12 @@ class DataGenerationModule(BaseModule):
             r_config_in = self.get_resource_from_name(name=self.n_setup_in)
             r_data_out = DataResource(name=self.n_data_out)
 
-            counts = r_config_in.phringe.get_counts(kernels=self.kernels)
+            if self.n_realizations is None:
+                counts = r_config_in.phringe.get_counts(kernels=self.kernels)
+            else:
+                counts = torch.stack(
+                    [r_config_in.phringe.get_counts(kernels=self.kernels) for _ in range(self.n_realizations)]
+                )
             r_data_out.set_data(counts)
 
         print('Done')
@@ -0,0 +1,267 @@
+from dataclasses import dataclass
+from typing import Union
+
+import torch
+from torch import Tensor
+
+from lifesimmc.core.modules.base_module import BaseModule
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.setup_resource import SetupResource
+from lifesimmc.util.noise import get_noise_reference_counts
+
+
+@dataclass
+class SurrogateNoiseSampler:
+    """Class representation of the sampler of the noise realizations of the surrogate noise model.
+
+    The realizations are generated in blocks of batch_size realizations, each drawn from its own generator seeded with
+    the base seed plus the index of the block, so that the same realizations are returned on every access. The sampler
+    only holds tensors and numbers, so that the data resource using it can be pickled.
+
+    Parameters
+    ----------
+    mean : Tensor
+        The mean of shape (n_diff_out * n_wavelengths x 1).
+    factor : Tensor
+        The factor F of shape (n_diff_out * n_wavelengths x n_factors).
+    diagonal : Tensor or None
+        The standard deviations of the diagonal part of shape (n_diff_out * n_wavelengths x 1) or None, so that the
+        covariance is F @ F.T + diag(d ** 2).
+    base_seed : int
+        The seed of the first block.
+    batch_size : int
+        The number of realizations per block.
+    n_realizations : int
+        The total number of realizations.
+    shape : tuple[int, int, int]
+        The shape (n_diff_out x n_wavelengths x n_time_steps) of a realization.
+    """
+    mean: Tensor
+    factor: Tensor
+    diagonal: Union[Tensor, None]
+    base_seed: int
+    batch_size: int
+    n_realizations: int
+    shape: tuple[int, int, int]
+
+    def __call__(self, start: int, stop: int) -> Tensor:
+        """Get the realizations from start to stop from the blocks containing them.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first realization.
+        stop : int
+            The index after the last realization.
+
+        Returns
+        -------
+        Tensor
+            The realizations of shape (stop - start x n_diff_out x n_wavelengths x n_time_steps).
+        """
+        first, last = start // self.batch_size, (stop - 1) // self.batch_size
+        noise = torch.cat([self._get_block(index) for index in range(first, last + 1)])
+
+        return noise[start - first * self.batch_size:stop - first * self.batch_size]
+
+    def _get_block(self, index: int) -> Tensor:
+        """Sample the realizations of a block.
+
+        Parameters
+        ----------
+        index : int
+            The index of the block.
+
+        Returns
+        -------
+        Tensor
+            The realizations of shape (n_block x n_diff_out x n_wavelengths x n_time_steps).
+        """
+        nk, nl, nt = self.shape
+        n_block = min(self.batch_size, self.n_realizations - index * self.batch_size)
+        generator = torch.Generator(device=self.mean.device).manual_seed(self.base_seed + index)
+        noise = self.factor @ torch.randn(
+            (n_block, self.factor.shape[-1], nt),
+            generator=generator,
+            device=self.mean.device,
+            dtype=self.mean.dtype
+        )
+
+        if self.diagonal is not None:
+            noise += self.diagonal * torch.randn(
+                (n_block, nk * nl, nt),
+                generator=generator,
+                device=self.mean.device,
+                dtype=self.mean.dtype
+            )
+
+        return (noise + self.mean).reshape(n_block, nk, nl, nt)
+
+
+class SurrogateNoiseModule(BaseModule):
+    """Class representation of the surrogate noise module.
+
+    This module fits a Gaussian noise model to one or a few noise-only PHRINGE reference runs, like the one used by the
+    ZCA whitening module, and samples new noise realizations from it at a fraction of the cost of the full simulation.
+    As for the whitening, the noise of each time step is modelled as an independent sample with the covariance of the
+    differential outputs and wavelengths. The covariance is either used in full through its Cholesky factor or
+    approximated by a low-rank plus diagonal factorization, which reduces the cost of sampling from quadratic to linear
+    in the number of spectral channels.
+
+    The realizations are returned as a stack of shape (n_realizations x n_diff_out x n_wavelengths x n_time_steps) in
+    a streaming data resource, i.e. they are generated on demand in batches and reproduced exactly on every access.
+
+    Parameters
+    ----------
+    n_setup_in : str
+        The name of the input setup resource.
+    n_data_out : str
+        The name of the output data resource.
+    n_realizations : int
+        The number of noise realizations.
+    n_reference_runs : int
+        The number of PHRINGE reference runs the noise model is fitted to.
+    rank : int
+        The rank of the low-rank part of the covariance. If None, the full covariance is used.
+    batch_size : int
+        The number of realizations that are generated at once. If None, all realizations are generated at once.
+    """
+    uses_random_numbers = True
+
+    def __init__(
+            self,
+            n_setup_in: str,
+            n_data_out: str,
+            n_realizations: int,
+            n_reference_runs: int = 1,
+            rank: int = None,
+            batch_size: int = None
+    ):
+        """Constructor method.
+
+        Parameters
+        ----------
+        n_setup_in : str
+            The name of the input setup resource.
+        n_data_out : str
+            The name of the output data resource.
+        n_realizations : int
+            The number of noise realizations.
+        n_reference_runs : int, optional
+            The number of PHRINGE reference runs the noise model is fitted to. Default is 1.
+        rank : int, optional
+            The rank of the low-rank part of the covariance. If None, the full covariance is used. Default is None.
+        batch_size : int, optional
+            The number of realizations that are generated at once. If None, all realizations are generated at once.
+            Default is None.
+        """
+        super().__init__()
+        self.n_setup_in = n_setup_in
+        self.n_data_out = n_data_out
+        self.n_realizations = n_realizations
+        self.n_reference_runs = n_reference_runs
+        self.rank = rank
+        self.batch_size = batch_size
+
+    def _get_noise_model(self, r_setup_in: SetupResource) -> tuple[Tensor, Tensor, Union[Tensor, None]]:
+        """Fit the noise model to the reference runs.
+
+        Parameters
+        ----------
+        r_setup_in : SetupResource
+            The input setup resource.
+
+        Returns
+        -------
+        tuple[Tensor, Tensor, Tensor or None]
+            The mean of shape (n_diff_out * n_wavelengths x 1), the factor F of shape
+            (n_diff_out * n_wavelengths x n_factors) and the standard deviations of the diagonal part of shape
+            (n_diff_out * n_wavelengths x 1) or None, so that the covariance is F @ F.T + diag(d ** 2).
+        """
+        # Each reference run is a different noise realization of the same observation
+        noise_refs = [
+            get_noise_reference_counts(
+                self,
+                r_setup_in.phringe,
+                seed=self.seed + index if self.seed is not None else None
+            )
+            for index in range(self.n_reference_runs)
+        ]
+        nk, nl, nt = noise_refs[0].shape
+        noise_ref = torch.cat([noise.reshape(nk * nl, nt) for noise in noise_refs], dim=-1).to(self.device)
+
+        return self._fit_noise_model(noise_ref)
+
+    def _fit_noise_model(self, noise_ref: Tensor) -> tuple[Tensor, Tensor, Union[Tensor, None]]:
+        """Fit the noise model to the time steps of the reference runs.
+
+        Parameters
+        ----------
+        noise_ref : Tensor
+            The reference runs of shape (n_diff_out * n_wavelengths x n_samples), where each column is a sample.
+
+        Returns
+        -------
+        tuple[Tensor, Tensor, Tensor or None]
+            The mean, the factor and the standard deviations of the diagonal part of the covariance.
+        """
+        mean = noise_ref.mean(dim=-1, keepdim=True)
+        cov = torch.cov(noise_ref)
+
+        if self.rank is None:
+            factor, info = torch.linalg.cholesky_ex(cov)
+
+            # Covariances estimated from fewer time steps than channels are singular and have no Cholesky factor
+            if info > 0:
+                eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+                factor = eigenvectors * eigenvalues.clamp(min=0).sqrt()
+
+            return mean, factor, None
+
+        eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+        factor = eigenvectors[:, -self.rank:] * eigenvalues[-self.rank:].clamp(min=0).sqrt()
+        diagonal = (torch.diag(cov) - (factor ** 2).sum(dim=-1)).clamp(min=0).sqrt()
+
+        return mean, factor, diagonal[:, None]
+
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[DataResource]:
+        """Fit the noise model and set up the sampling of the noise realizations.
+
+        Parameters
+        ----------
+        pipeline_resources : list[BaseResource]
+            List of resources to be used in the module.
+
+        Returns
+        -------
+        tuple[DataResource]
+            Tuple containing the output data resource.
+        """
+        print('Fitting surrogate noise model...')
+
+        r_setup_in = self.get_resource_from_name(self.n_setup_in)
+        phringe = r_setup_in.phringe
+        nk = len(phringe._instrument._response_kernels_torch)
+        nl = len(phringe.get_wavelength_bin_centers())
+        nt = len(phringe.simulation_time_steps)
+
+        mean, factor, diagonal = self._get_noise_model(r_setup_in)
+        batch_size = self.batch_size or self.n_realizations
+
+        # Each batch is drawn from its own generator, so that it is the same on every access
+        sampler = SurrogateNoiseSampler(
+            mean=mean,
+            factor=factor,
+            diagonal=diagonal,
+            base_seed=self.seed if self.seed is not None else torch.randint(2 ** 31, (1,)).item(),
+            batch_size=batch_size,
+            n_realizations=self.n_realizations,
+            shape=(nk, nl, nt)
+        )
+
+        r_data_out = DataResource(self.n_data_out)
+        r_data_out.set_batch_function(sampler, self.n_realizations, batch_size)
+
+        print('Done')
+        return r_data_out,
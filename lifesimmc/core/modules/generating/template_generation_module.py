@@ -1,8 +1,14 @@
+from typing import Union
+
+import torch
 from phringe.util.grid import get_meshgrid
+from torch import Tensor
 
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.setup_resource import SetupResource
 from lifesimmc.core.resources.template_resource import TemplateResource
+from lifesimmc.util.template_store import TemplateStore
 
 
 class TemplateGenerationModule(BaseModule):
@@ -16,9 +22,21 @@ class TemplateGenerationModule(BaseModule):
         The name of the output template resource collection
     fov : float
         The field of view for which to generate the templates in radians
+    tile_size : int
+        The number of grid rows per tile in streaming mode. If None, all templates are generated at once.
+    store : TemplateStore
+        The store from which the templates are loaded if they have been generated before and to which they are saved
+        otherwise.
     """
 
-    def __init__(self, n_setup_in: str, n_template_out: str, fov: float):
+    def __init__(
+            self,
+            n_setup_in: str,
+            n_template_out: str,
+            fov: float,
+            tile_size: int = None,
+            store: TemplateStore = None
+    ):
         """Constructor method.
 
         Parameters
@@ -29,11 +47,81 @@ class TemplateGenerationModule(BaseModule):
             The name of the output template resource collection
         fov : float
             The field of view for which to generate the templates in radians
+        tile_size : int, optional
+            The number of grid rows per tile. If given, the templates are not generated at once, but on demand in tiles
+            of grid rows whenever they are accessed (streaming mode). If None, all templates are generated at once.
+        store : TemplateStore, optional
+            The store from which the templates are loaded if they have been generated for the same setup before. New
+            templates are generated tile by tile into the store. The returned templates are memory-mapped from the
+            store, which takes precedence over the streaming mode. If None, the templates are not stored.
         """
         super().__init__()
         self.n_setup_in = n_setup_in
         self.n_template_out = n_template_out
         self.fov = fov
+        self.tile_size = tile_size
+        self.store = store
+
+    def _get_templates(self, r_setup_in: SetupResource, x_coordinates: Tensor, y_coordinates: Tensor) -> Tensor:
+        """Get the templates of a planet with unit flux at the given sky coordinates.
+
+        Parameters
+        ----------
+        r_setup_in : SetupResource
+            The input setup resource.
+        x_coordinates : Tensor
+            The x sky coordinates of shape (n_rows x n_grid).
+        y_coordinates : Tensor
+            The y sky coordinates of shape (n_rows x n_grid).
+
+        Returns
+        -------
+        Tensor
+            The templates of shape (n_diff_out x n_wavelengths x n_time_steps x n_rows x n_grid).
+        """
+        phringe = r_setup_in.phringe
+
+        response = phringe._instrument.get_response(
+            kernels=True,
+            times=phringe.simulation_time_steps[None, :, None, None],
+            wavelength_bin_centers=phringe._instrument.wavelength_bin_centers[:, None, None, None],
+            x_sky_coordinates=x_coordinates[None, None, :, :],
+            y_sky_coordinates=y_coordinates[None, None, :, :],
+            modulation_period=torch.tensor(phringe._observation.modulation_period, device=phringe._device),
+            nulling_baseline=torch.tensor(phringe.get_nulling_baseline(), device=phringe._device)
+        )
+
+        return (
+                response
+                * phringe._observation.detector_integration_time
+                * phringe.get_wavelength_bin_widths()[None, :, None, None, None]
+        )
+
+    def estimate_output_bytes(self, input_bytes: dict[str, Union[int, None]]) -> dict[str, Union[int, None]]:
+        """Estimate the size of the templates from the setup resource if it is already in the pipeline.
+
+        In streaming mode, only a single tile is held in memory at a time.
+
+        Parameters
+        ----------
+        input_bytes : dict[str, int or None]
+            The sizes of the input resources in bytes or None if they are unknown.
+
+        Returns
+        -------
+        dict[str, int or None]
+            The estimated size of the output template resource in bytes or None if it is unknown.
+        """
+        r_setup_in = self.resources.get(self.n_setup_in) if self.resources is not None else None
+
+        if not isinstance(r_setup_in, SetupResource):
+            return {self.n_template_out: None}
+
+        n_rows = self.tile_size if self.tile_size is not None and self.store is None else self.grid_size
+        coordinates = torch.zeros((1, 1), device=self.device)
+        template = self._get_templates(r_setup_in, coordinates, coordinates)
+
+        return {self.n_template_out: template.numel() * template.element_size() * n_rows * self.grid_size}
 
     def run(self, pipeline_resources: list[BaseResource]) -> tuple[TemplateResource]:
         """Generate templates for a planet at each point in the grid.
@@ -51,24 +139,38 @@ class TemplateGenerationModule(BaseModule):
         print('Generating templates...')
 
         r_setup_in = self.get_resource_from_name(self.n_setup_in)
-
-        response = r_setup_in.phringe.get_instrument_response(
-            fov=self.fov,
-            kernels=True,
-            perturbations=False
-        )
-
-        model_counts = (
-                response
-                * r_setup_in.phringe._observation.detector_integration_time
-                * r_setup_in.phringe.get_wavelength_bin_widths()[None, :, None, None, None]
-        )
+        grid_coordinates = get_meshgrid(self.fov, self.grid_size, self.device)
 
         r_template_out = TemplateResource(
             name=self.n_template_out,
-            grid_coordinates=get_meshgrid(self.fov, self.grid_size, self.device),
+            grid_coordinates=grid_coordinates,
         )
-        r_template_out.set_data(model_counts)
+
+        def get_tile(start: int, stop: int) -> Tensor:
+            """Generate the templates of the grid rows from start to stop."""
+            return self._get_templates(
+                r_setup_in,
+                grid_coordinates[0][start:stop],
+                grid_coordinates[1][start:stop]
+            )
+
+        if self.store is not None:
+            key = self.store.get_key(r_setup_in.phringe, self.fov, self.grid_size)
+            template_data = self.store.load(key)
+
+            if template_data is None:
+                tile_size = self.tile_size or self.grid_size
+                template_tiles = (
+                    get_tile(start, min(start + tile_size, self.grid_size))
+                    for start in range(0, self.grid_size, tile_size)
+                )
+                template_data = self.store.save(key, template_tiles, self.grid_size)
+
+            r_template_out.set_data(template_data.to(self.device))
+        elif self.tile_size is None:
+            r_template_out.set_data(get_tile(0, self.grid_size))
+        else:
+            r_template_out.set_tile_function(get_tile, self.tile_size)
 
         print('Done')
         return r_template_out,
@@ -28,6 +28,7 @@ class SetupModule(BaseModule):
     scene : Scene
         Scene object.
     """
+    uses_random_numbers = True
 
     @overload
     def __init__(
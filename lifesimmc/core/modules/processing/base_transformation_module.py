@@ -52,6 +52,27 @@ class BaseTransformationModule(BaseModule):
         self.n_template_out = n_template_out
         self.n_transformation_out = n_transformation_out
 
+    def estimate_output_bytes(self, input_bytes: dict[str, Union[int, None]]) -> dict[str, Union[int, None]]:
+        """Estimate the sizes of the output resources, which are as large as the corresponding input resources.
+
+        Parameters
+        ----------
+        input_bytes : dict[str, int or None]
+            The sizes of the input resources in bytes or None if they are unknown.
+
+        Returns
+        -------
+        dict[str, int or None]
+            The estimated sizes of the output resources in bytes or None if they are unknown.
+        """
+        output_bytes = {
+            self.n_data_out: input_bytes.get(getattr(self, 'n_data_in', None)),
+            self.n_template_out: input_bytes.get(self.n_template_in),
+            self.n_transformation_out: None
+        }
+
+        return {name: size for name, size in output_bytes.items() if name is not None}
+
     def run(self, pipeline_resources: list[BaseResource]) -> Union[None, BaseResource, tuple]:
         """Apply the module.
 
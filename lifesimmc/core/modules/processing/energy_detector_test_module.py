@@ -1,16 +1,35 @@
 from typing import Union
 
+import torch
 from scipy.stats import ncx2, chi2
+from torch import Tensor
 
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.setup_resource import SetupResource
 from lifesimmc.core.resources.test_resource import TestResource
-from lifesimmc.util.resources import get_transformations_from_resource_name
+from lifesimmc.core.resources.test_result_batch import TestResultBatch
+from lifesimmc.util.noise import get_noise_reference_counts
+from lifesimmc.util.operators import LinearOperator
+from lifesimmc.util.resources import get_transformation_from_resource_name
+from lifesimmc.util.statistics import TailQuantileEstimator, sample_energy_statistics
 
 
 class EnergyDetectorTestModule(BaseModule):
     """Class representation of an energy detector test module.
 
+    If the input data contains a stack of realizations of shape
+    (n_realizations x n_diff_out x n_wavelengths x n_time_steps), all realizations are tested at once and the results
+    are returned as a TestResultBatch.
+
+    The analytic threshold is only valid for perfectly whitened Gaussian data. If a number of calibration samples is
+    given, the threshold is instead calibrated empirically from test statistics of noise-only data, which are drawn in
+    batches with the covariance of a noise reference data set and streamed into a tail quantile estimator. The
+    detection probability is then the fraction of test statistics of data with the same noise and the model of the
+    planet that exceed the calibrated threshold, which are drawn in the same way. The p-value is not computed, since
+    the estimator only keeps the largest noise-only test statistics, so that the tail probability of a test statistic
+    below the calibrated threshold is unknown.
+
     Parameters
     ----------
     n_setup_in : str
@@ -25,6 +44,12 @@ class EnergyDetectorTestModule(BaseModule):
         Name of the output test resource.
     pfa : float
         Probability of false alarm.
+    n_calibration_samples : int
+        Number of noise-only test statistics drawn to calibrate the threshold. If None, the analytic threshold is used.
+    calibration_batch_size : int
+        Number of noise-only test statistics drawn at once.
+    confidence_level : float
+        Confidence level of the confidence interval of the calibrated threshold.
     """
 
     def __init__(
@@ -35,6 +60,9 @@ class EnergyDetectorTestModule(BaseModule):
             n_test_out: str,
             pfa: float,
             n_transformation_in: Union[str, tuple[str], None] = None,
+            n_calibration_samples: int = None,
+            calibration_batch_size: int = 1000000,
+            confidence_level: float = 0.95
     ):
         """Constructor method.
 
@@ -48,6 +76,13 @@ class EnergyDetectorTestModule(BaseModule):
             Name of the input planet parameters resource.
         n_transformation_in : str or tuple[str]
             Name of the input transformation resource.
+        n_calibration_samples : int, optional
+            Number of noise-only test statistics drawn to calibrate the threshold. If None, the analytic threshold is
+            used. Default is None.
+        calibration_batch_size : int, optional
+            Number of noise-only test statistics drawn at once. Default is 1000000.
+        confidence_level : float, optional
+            Confidence level of the confidence interval of the calibrated threshold. Default is 0.95.
         """
         self.n_data_in = n_data_in
         self.n_test_out = n_test_out
@@ -55,8 +90,58 @@ class EnergyDetectorTestModule(BaseModule):
         self.n_config_in = n_setup_in
         self.n_planet_params_in = n_planet_params_in
         self.n_transformation_in = n_transformation_in
+        self.n_calibration_samples = n_calibration_samples
+        self.calibration_batch_size = calibration_batch_size
+        self.confidence_level = confidence_level
+
+        # The calibration simulates a noise reference data set and draws noise-only test statistics
+        self.uses_random_numbers = n_calibration_samples is not None
+
+    def _calibrate_threshold(
+            self,
+            r_config_in: SetupResource,
+            transformation: LinearOperator,
+            model: Tensor
+    ) -> tuple[float, tuple[float, float], float]:
+        """Calibrate the threshold empirically from noise-only test statistics and estimate the detection probability
+        at the calibrated threshold from test statistics of noisy models.
+
+        Parameters
+        ----------
+        r_config_in : SetupResource
+            The input setup resource.
+        transformation : LinearOperator
+            The transformation that has been applied to the data.
+        model : Tensor
+            The transformed model of shape (n_diff_out x n_wavelengths x n_time_steps).
+
+        Returns
+        -------
+        tuple[float, tuple[float, float], float]
+            The threshold, its confidence interval and the detection probability.
+        """
+        noise_ref = transformation(get_noise_reference_counts(self, r_config_in.phringe))
+        nk, nl, nt = noise_ref.shape
 
-    def run(self, pipeline_resources: list[BaseResource]) -> TestResource:
+        # The covariance of the transformed noise is the same for all batches
+        covariance = torch.cov(noise_ref.reshape(nk * nl, nt).to(self.device, torch.float64))
+        estimator = TailQuantileEstimator(self.pfa, self.n_calibration_samples, self.confidence_level)
+
+        for start in range(0, self.n_calibration_samples, self.calibration_batch_size):
+            n_samples = min(self.calibration_batch_size, self.n_calibration_samples - start)
+            estimator.add(sample_energy_statistics(covariance, nt, n_samples))
+
+        xsi = estimator.get_quantile()
+        model = model.reshape(nk * nl, nt).to(covariance)
+        n_detections = 0
+
+        for start in range(0, self.n_calibration_samples, self.calibration_batch_size):
+            n_samples = min(self.calibration_batch_size, self.n_calibration_samples - start)
+            n_detections += (sample_energy_statistics(covariance, nt, n_samples, model) > xsi).sum().item()
+
+        return xsi, estimator.get_confidence_interval(), n_detections / self.n_calibration_samples
+
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[Union[TestResource, TestResultBatch]]:
         """Apply the energy detector test.
 
         Parameters
@@ -66,14 +151,15 @@ class EnergyDetectorTestModule(BaseModule):
 
         Returns
         -------
-        TestResource
-            The test resource.
+        tuple[TestResource or TestResultBatch]
+            Tuple containing the test resource or the test results of all realizations if the data contains a stack of
+            realizations.
         """
         print("Performing energy detector test...")
 
         # Extract all inputs
         r_config_in = self.get_resource_from_name(self.n_config_in) if self.n_config_in is not None else None
-        transformations = get_transformations_from_resource_name(self, self.n_transformation_in)
+        transformation = get_transformation_from_resource_name(self, self.n_transformation_in)
         r_planet_params_in = self.get_resource_from_name(
             self.n_planet_params_in) if self.n_planet_params_in is not None else None
 
@@ -81,22 +167,21 @@ class EnergyDetectorTestModule(BaseModule):
         wavelengths = r_config_in.phringe.get_wavelength_bin_centers().cpu().numpy()
         wavelength_bin_widths = r_config_in.phringe.get_wavelength_bin_widths().cpu().numpy()
 
-        # Prepare data
-        data = self.get_resource_from_name(self.n_data_in).get_data()
-        dataf = data.flatten()
-        ndim = dataf.numel()
-        dataf = dataf.cpu().numpy()
+        # Prepare data, where stacks of realizations are processed batch by batch below
+        r_data_in = self.get_resource_from_name(self.n_data_in)
+        is_batch = r_data_in.is_streaming or r_data_in.view().ndim == 4
 
-        # Get test results under H1 (planet is present)
-        test_h1 = (dataf.T @ dataf)
-        xsi = ncx2.ppf(1 - self.pfa, df=ndim, nc=0)
+        if not is_batch:
+            dataf = r_data_in.view().flatten()
+            ndim = dataf.numel()
+            dataf = dataf.cpu().numpy()
 
         # TODO: handle mutiple planets
-        flux = r_planet_params_in.params[0].sed.cpu().numpy()
+        flux = r_planet_params_in.collection[0].sed.cpu().numpy()
 
         # TODO: Handle orbital motion
-        posx = r_planet_params_in.params[0].pos_x
-        posy = r_planet_params_in.params[0].pos_y
+        posx = r_planet_params_in.collection[0].pos_x
+        posy = r_planet_params_in.collection[0].pos_y
 
         model = r_config_in.phringe.get_model_counts(
             spectral_energy_distribution=flux,
@@ -104,16 +189,54 @@ class EnergyDetectorTestModule(BaseModule):
             y_position=posy,
             kernels=True
         )
-        for transf in transformations:
-            model = transf(model)
+        model = transformation(model)
         modelf = model.flatten()
 
+        if self.n_calibration_samples is not None:
+            xsi, xsi_interval, pdet = self._calibrate_threshold(r_config_in, transformation, torch.as_tensor(model))
+        else:
+            xsi, xsi_interval, pdet = None, None, None
+
+        # The model is the same for all realizations, so the test statistics of all realizations are computed at once
+        if is_batch:
+            modelf = torch.as_tensor(modelf)
+            test_h1, test_h0 = [], []
+
+            for batch in r_data_in.get_batches():
+                batchf = batch.flatten(start_dim=1)
+                batchf_h0 = batchf - modelf.to(batchf)
+                test_h1.append(torch.einsum('ri, ri->r', batchf, batchf).cpu())
+                test_h0.append(torch.einsum('ri, ri->r', batchf_h0, batchf_h0).cpu())
+
+            r_test_out = TestResultBatch.from_energy_detector(
+                name=self.n_test_out,
+                test_statistic_h1=torch.cat(test_h1).numpy(),
+                test_statistic_h0=torch.cat(test_h0).numpy(),
+                model_length_xtx=(modelf @ modelf).item(),
+                dimensions=modelf.numel(),
+                probability_false_alarm=self.pfa,
+                threshold_xsi=xsi,
+                threshold_xsi_interval=xsi_interval,
+                detection_probability=pdet
+            )
+
+            print('Done')
+            return r_test_out,
+
+        # Get test results under H1 (planet is present)
+        test_h1 = (dataf.T @ dataf)
+
         # Get test result under H0 (planet is not present)
         data_h0 = dataf - modelf
         test_h0 = (data_h0.T @ data_h0)
         xtx = (modelf @ modelf)
-        pdet = ncx2.sf(xsi, df=ndim, nc=xtx)
-        p = chi2.sf(test_h1, df=ndim)
+
+        if xsi is None:
+            xsi = ncx2.ppf(1 - self.pfa, df=ndim, nc=0)
+            pdet = ncx2.sf(xsi, df=ndim, nc=xtx)
+            p = chi2.sf(test_h1, df=ndim)
+        else:
+            p = None
 
         r_test_out = TestResource(
             name=self.n_test_out,
@@ -125,7 +248,8 @@ class EnergyDetectorTestModule(BaseModule):
             detection_probability=pdet,
             probability_false_alarm=self.pfa,
             p_value=p,
+            threshold_xsi_interval=xsi_interval,
         )
 
         print('Done')
-        return r_test_out
+        return r_test_out,
@@ -37,6 +37,9 @@ class MatchedFilterModule(BaseModule):
     def run(self, pipeline_resources: list[BaseResource]) -> tuple[ImageResource]:
         """Create a correlation map of the templates with the data.
 
+        For a stack of realizations of shape (n_realizations x n_diff_out x n_wavelengths x n_time_steps), a stack of
+        correlation maps of shape (n_realizations x n_grid x n_grid) is created.
+
         Parameters
         ----------
         pipeline_resources : list[BaseResource]
@@ -49,34 +52,27 @@ class MatchedFilterModule(BaseModule):
         """
         print('Calculating correlation map...')
 
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
-        template_data_in = self.get_resource_from_name(self.n_template_in).get_data()
-
-        # y = data_in.flatten()
-        # x = template_data_in.reshape(
-        #     -1,
-        #     template_data_in.shape[-1],
-        #     template_data_in.shape[-1]
-        # )
-        #
-        # image = (
-        #         torch.einsum('i,ijk->jk', y, x)
-        #         # / torch.sqrt(torch.einsum('i, i->', y, y))
-        #         / torch.sqrt(torch.einsum('ijk,ijk->', x, x))
-        # )
-
-        y = data_in.flatten()
-
-        x = template_data_in.reshape(
-            -1,
-            template_data_in.shape[-1],
-            template_data_in.shape[-1],
-        )
-
-        numerator = torch.einsum("i,ijk->jk", y, x)
-        template_norm = torch.sqrt(torch.einsum("ijk,ijk->jk", x, x))
-
-        image = numerator / template_norm
+        r_data_in = self.get_resource_from_name(self.n_data_in)
+        r_template_in = self.get_resource_from_name(self.n_template_in)
+
+        # The template norms are computed once and cached alongside the templates
+        template_norm = r_template_in.get_norms()
+
+        # Stacks of realizations are correlated with each tile at once, which gives a stack of correlation maps
+        if r_data_in.is_streaming or r_data_in.view().ndim == 4:
+            y = torch.cat([batch.flatten(1) for batch in r_data_in.get_batches()])
+        else:
+            y = r_data_in.view().flatten()
+
+        # Correlate the data with the templates tile by tile
+        image = []
+
+        for template_tile in r_template_in.get_tiles():
+            x = template_tile.reshape(-1, template_tile.shape[-2] * template_tile.shape[-1])
+            numerator = (y @ x).reshape(*y.shape[:-1], template_tile.shape[-2], template_tile.shape[-1])
+            image.append(numerator)
+
+        image = torch.cat(image, dim=-2) / template_norm
 
         r_image_out = ImageResource(self.n_image_out)
         r_image_out.set_image(image)
@@ -1,12 +1,17 @@
 import numpy as np
 import torch
 from lmfit import minimize, Parameters
+from phringe.main import PHRINGE
 from rich.console import Console
 
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.planet_resource import PlanetResource
 from lifesimmc.core.resources.resource_collection import ResourceCollection
+from lifesimmc.util.cost_map import get_cost_map_from_tiles
+from lifesimmc.util.fitting import fit_sed_variable_projection
+from lifesimmc.util.model import get_unit_model_counts
+from lifesimmc.util.operators import IdentityOperator
 
 
 class MLSEDEstimationModule(BaseModule):
@@ -24,6 +29,14 @@ class MLSEDEstimationModule(BaseModule):
         Name of the input transformation resource. If None, no transformation is applied.
     n_template_in : str, optional
         Name of the input template resource. If None, no template is used.
+    analytical_jacobian : bool, optional
+        If True, the Jacobian of the fit is calculated analytically for the flux parameters, using that the counts are
+        linear in the flux, and with central differences of a single batched model evaluation for the positions.
+        Otherwise, lmfit calculates the full Jacobian with finite differences. Default is False.
+    solver : str, optional
+        The solver used for the fit. Either 'lmfit' or 'torch'. The 'torch' solver solves for the fluxes in closed form
+        and only optimizes the positions with a Levenberg-Marquardt algorithm on the device of the setup. It does not
+        support bounds. Default is 'lmfit'.
     """
 
     def __init__(
@@ -34,7 +47,9 @@ class MLSEDEstimationModule(BaseModule):
             n_transformation_in: str = None,
             n_template_in: str = None,
             n_planets_in: str = None,
-            bounds: bool = False
+            bounds: bool = False,
+            analytical_jacobian: bool = False,
+            solver: str = 'lmfit'
     ):
         """Constructor method.
 
@@ -50,6 +65,14 @@ class MLSEDEstimationModule(BaseModule):
             Name of the input transformation resource. If None, no transformation is applied.
         n_template_in : str, optional
             Name of the input template resource. If None, no template is used. # TODO: handle no templates
+        analytical_jacobian : bool, optional
+            If True, the Jacobian of the fit is calculated analytically for the flux parameters, using that the counts
+            are linear in the flux, and with central differences of a single batched model evaluation for the
+            positions. Otherwise, lmfit calculates the full Jacobian with finite differences. Default is False.
+        solver : str, optional
+            The solver used for the fit. Either 'lmfit' or 'torch'. The 'torch' solver solves for the fluxes in closed
+            form and only optimizes the positions with a Levenberg-Marquardt algorithm on the device of the setup. It
+            does not support bounds. Default is 'lmfit'.
         """
         super().__init__()
         self.n_setup_in = n_setup_in
@@ -59,92 +82,265 @@ class MLSEDEstimationModule(BaseModule):
         self.n_planets_out = n_planets_out
         self.n_planets_in = n_planets_in
         self.bounds = bounds
+        self.analytical_jacobian = analytical_jacobian
+        self.solver = solver
 
-    def _get_analytical_initial_guess(self, data, template_data, grid_coordinates):
-        # Normalize template data with their variance along axis 2
-        # template_data = template_data / torch.var(template_data, axis=2, keepdim=True) ** 0.5
+        if solver not in ('lmfit', 'torch'):
+            raise ValueError(f"Unknown solver '{solver}'. Use 'lmfit' or 'torch'.")
 
-        # Calculate matrix C according to equation B.2
-        data_variance = torch.var(data, axis=0)
-        sum = torch.sum(torch.einsum('ij, ijkl->ijkl', data, template_data), axis=0)
-        vector_c = torch.einsum('ijk, i->ijk', sum, 1 / data_variance)
+        if solver == 'torch' and bounds:
+            raise ValueError("The 'torch' solver does not support bounds.")
 
-        # Calculate matrix B according to equation B.3
-        sum = torch.sum(template_data ** 2, axis=0)
-        vector_b = torch.nan_to_num(torch.einsum('ijk, i->ijk', sum, 1 / data_variance), 1)
+    def _get_analytical_initial_guess(self, data, r_templates_in):
+        """Get the initial guess of the SED and position from the maximum of the cost map.
 
-        # Create diagonal matrix B
-        b_shape = vector_b.shape
-        eye = torch.eye(b_shape[0], device=self.device).unsqueeze(-1).unsqueeze(-1)
-        x_diag = vector_b.unsqueeze(1)
-        matrix_b = eye * x_diag
+        For a stack of data realizations, the cost maps of all realizations are calculated at once and the initial guess
+        is taken at the maximum of the cost map of each realization.
 
-        # Calculate the optimum flux according to equation B.6 and set positivity constraint
-        b_perm = matrix_b.permute(2, 3, 0, 1)
-        b_inv = torch.linalg.inv(b_perm).permute(2, 3, 0, 1)
-
-        optimum_flux = torch.einsum('ijkl, jkl->ikl', b_inv, vector_c)
-
-        # Calculate the cost function according to equation B.8
-        optimum_flux = torch.where(optimum_flux >= 0, optimum_flux, 0)
-        cost_function = optimum_flux * vector_c
-        cost_function = torch.sum(torch.nan_to_num(cost_function, 0), axis=0)
+        Parameters
+        ----------
+        data : Tensor
+            The data of shape (n_diff_out x n_wavelengths x n_time_steps) or a stack of data realizations of shape
+            (n_realizations x n_diff_out x n_wavelengths x n_time_steps).
+        r_templates_in : TemplateResource
+            The template resource, whose templates are processed tile by tile.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            The optimum flux, x coordinate and y coordinate at the maximum of the cost map, with a leading axis of size
+            n_realizations for a stack of data realizations.
+        """
+        # Calculate the optimum flux and cost function for all template positions
+        # Precomputed Gram matrices of the templates are reused for all realizations
+        optimum_flux, cost_function = get_cost_map_from_tiles(
+            data,
+            r_templates_in.get_tiles(),
+            template_gram=r_templates_in.get_gram() if r_templates_in.has_gram else None
+        )
+        grid_coordinates = r_templates_in.grid_coordinates
+        cost_function = torch.sum(torch.nan_to_num(cost_function, 0), axis=-3)
 
         # plt.imshow(cost_function.cpu().numpy(), cmap='magma')
         # plt.colorbar()
         # plt.show()
 
         # Get the optimum flux at the position of the maximum of the cost function
-        flat_idx = cost_function.argmax()  # scalar
-        row = flat_idx // cost_function.shape[1]
-        col = flat_idx % cost_function.shape[1]
-        optimum_flux_at_maximum = optimum_flux[:, row.item(), col.item()].cpu().numpy()  # TODO: fix this scaling
+        flat_idx = cost_function.flatten(-2).argmax(-1)  # scalar or one index per realization
+        optimum_flux_at_maximum = torch.take_along_dim(
+            optimum_flux.flatten(-2),
+            flat_idx[..., None, None],
+            dim=-1
+        )[..., 0].cpu().numpy()  # TODO: fix this scaling
 
         # plt.plot(optimum_flux_at_maximum)
         # plt.show()
 
         # Get the coordinates of the maximum
-        x_coord = grid_coordinates[0][row.item(), col.item()].cpu().numpy()
-        y_coord = grid_coordinates[1][row.item(), col.item()].cpu().numpy()
+        x_coord = grid_coordinates[0].flatten()[flat_idx.to(grid_coordinates[0].device)].cpu().numpy()
+        y_coord = grid_coordinates[1].flatten()[flat_idx.to(grid_coordinates[1].device)].cpu().numpy()
 
         return optimum_flux_at_maximum, x_coord, y_coord
 
+    def _get_parameters(self, sed_init, posx_init, posy_init, hfov_max: float) -> Parameters:
+        """Get the lmfit parameters of the fluxes and positions.
+
+        Parameters
+        ----------
+        sed_init : np.ndarray
+            The initial fluxes of shape (n_wavelengths).
+        posx_init : float
+            The initial x position in radians.
+        posy_init : float
+            The initial y position in radians.
+        hfov_max : float
+            The maximum half field of view in radians, which bounds the positions.
+
+        Returns
+        -------
+        Parameters
+            The parameters, where the fluxes are bounded to be positive if bounds are enabled.
+        """
+        params = Parameters()
+
+        for j in range(len(sed_init)):
+            if self.bounds:
+                params.add(f'flux_{j}', value=sed_init[j], min=0)
+            else:
+                params.add(f'flux_{j}', value=sed_init[j])
+        params.add('pos_x', value=posx_init, min=-hfov_max, max=hfov_max)
+        params.add('pos_y', value=posy_init, min=-hfov_max, max=hfov_max)
+
+        return params
+
+    @staticmethod
+    def _get_residuals(params: Parameters, target: np.ndarray, phringe: PHRINGE, transformation) -> np.ndarray:
+        """Get the residuals of the model of the parameters.
+
+        Parameters
+        ----------
+        params : Parameters
+            The parameters of the fluxes and positions.
+        target : np.ndarray
+            The data of shape (n_diff_out * n_time_steps x n_wavelengths).
+        phringe : PHRINGE
+            The PHRINGE instance of the setup.
+        transformation : Callable
+            The transformation that has been applied to the data.
+
+        Returns
+        -------
+        np.ndarray
+            The residuals of the same shape as the data.
+        """
+        posx = params['pos_x'].value
+        posy = params['pos_y'].value
+        flux = np.array([params[f'flux_{z}'].value for z in range(target.shape[1])])
+        model = phringe.get_model_counts(
+            spectral_energy_distribution=flux,
+            x_position=posx,
+            y_position=posy,
+            kernels=True
+        )
+        model = transformation(model)
+        model = np.transpose(model, (0, 2, 1))
+        model = model.reshape(target.shape)
+
+        return model - target
+
+    @staticmethod
+    def _get_jacobian(params: Parameters, target: np.ndarray, phringe: PHRINGE, transformation) -> np.ndarray:
+        """Get the Jacobian of the residuals with respect to the values of the parameters.
+
+        The derivatives with respect to the fluxes are given by the unit model counts, since the counts are linear in
+        the flux, and the derivatives with respect to the positions by central differences. For bounded parameters,
+        lmfit scales the columns with the derivatives of the values with respect to its internal unbounded variables.
+
+        Parameters
+        ----------
+        params : Parameters
+            The parameters of the fluxes and positions.
+        target : np.ndarray
+            The data of shape (n_diff_out * n_time_steps x n_wavelengths).
+        phringe : PHRINGE
+            The PHRINGE instance of the setup.
+        transformation : Callable
+            The transformation that has been applied to the data.
+
+        Returns
+        -------
+        np.ndarray
+            The Jacobian of shape (n_diff_out * n_time_steps * n_wavelengths x n_wavelengths + 2).
+        """
+        n_wavelengths = target.shape[1]
+        posx = params['pos_x'].value
+        posy = params['pos_y'].value
+        flux = np.array([params[f'flux_{z}'].value for z in range(n_wavelengths)])
+        position_step = 1e-5 * phringe.get_field_of_view()[-1].item() / 2
+
+        # Evaluate the unit model counts at the position and the shifted positions in a single call
+        unit_counts = get_unit_model_counts(
+            phringe,
+            [posx, posx + position_step, posx - position_step, posx, posx],
+            [posy, posy, posy, posy + position_step, posy - position_step]
+        )
+
+        # The counts are linear in the flux, so the derivative with respect to the flux of a wavelength bin is given
+        # by the unit model counts of that bin
+        columns = []
+
+        for z in range(n_wavelengths):
+            column = np.zeros_like(unit_counts[0])
+            column[:, z] = unit_counts[0][:, z]
+            columns.append(column)
+
+        columns.append((unit_counts[1] - unit_counts[2]) * flux[None, :, None] / (2 * position_step))
+        columns.append((unit_counts[3] - unit_counts[4]) * flux[None, :, None] / (2 * position_step))
+
+        return np.stack(
+            [np.transpose(transformation(column), (0, 2, 1)).ravel() for column in columns],
+            axis=1
+        )
+
+    def _fit_torch(
+            self,
+            r_setup_in,
+            data,
+            posx_init,
+            posy_init,
+            transformation,
+            max_iterations: int = 100,
+            batch_size: int = None
+    ) -> ResourceCollection[PlanetResource]:
+        """Fit the SEDs and positions of one or several data sets with the torch variable projection solver.
+
+        Parameters
+        ----------
+        r_setup_in : SetupResource
+            The input setup resource.
+        data : Tensor
+            The (transformed) data of shape (n_data_sets x n_diff_out x n_wavelengths x n_time_steps).
+        posx_init : Tensor
+            The initial x positions in radians of shape (n_data_sets).
+        posy_init : Tensor
+            The initial y positions in radians of shape (n_data_sets).
+        transformation : Callable
+            The transformation that has been applied to the data or None.
+        max_iterations : int, optional
+            The maximum number of solver iterations.
+        batch_size : int, optional
+            Number of data sets that are fitted at once. If None, all data sets are fitted at once.
+
+        Returns
+        -------
+        ResourceCollection[PlanetResource]
+            The collection containing the estimated planet parameters of every data set.
+        """
+        sed, std, cov, posx, posy = fit_sed_variable_projection(
+            r_setup_in.phringe,
+            data,
+            posx_init,
+            posy_init,
+            transformation=transformation,
+            max_iterations=max_iterations,
+            batch_size=batch_size
+        )
+
+        r_planets_out = ResourceCollection[PlanetResource](
+            name=self.n_planets_out,
+        )
+
+        for i in range(len(data)):
+            r_planets_out.collection.append(PlanetResource(
+                name='',
+                planet=None,
+                sed=sed[i].cpu().numpy(),
+                std=std[i].cpu().numpy(),
+                cov=cov[i].cpu().numpy(),
+                pos_x=posx[i].item(),
+                pos_y=posy[i].item()
+            ))
+        return r_planets_out
+
     def run(self, pipeline_resources: list[BaseResource | ResourceCollection]) -> tuple[
         ResourceCollection[PlanetResource]]:
         console = Console()
 
         with console.status("Estimating SED using numerical maximum likelihood estimation...", spinner="dots"):
             r_setup_in = self.get_resource_from_name(self.n_setup_in)
-            r_templates_in = self.get_resource_from_name(self.n_template_in)
+            r_templates_in = self.get_resource_from_name(self.n_template_in) if self.n_template_in else None
             r_transformation_in = self.get_resource_from_name(self.n_transformation_in) \
                 if self.n_transformation_in \
                 else None
             planets_in = self.get_resource_from_name(self.n_planets_in) if self.n_planets_in else None
 
-            transf_in = r_transformation_in.transformation if r_transformation_in else lambda x: x
-            data_in = self.get_resource_from_name(self.n_data_in).get_data()
-            template_data_in = r_templates_in.get_data()
-            grid_coordinates = r_templates_in.grid_coordinates
-
-            # Flatten data along differential outputs and times axes
-            nk, nl, nt = data_in.shape
-            _, _, _, ng, _ = template_data_in.shape
-
-            data_in = data_in.permute(0, 2, 1).reshape(nk * nt, nl)
-
-            template_data_in = (
-                template_data_in
-                .permute(0, 2, 1, 3, 4)
-                .reshape(nk * nt, nl, ng, ng)
-            )
+            transf_in = r_transformation_in.transformation if r_transformation_in else IdentityOperator()
+            data_in = self.get_resource_from_name(self.n_data_in).view()
+            data_cube_in = data_in
 
             # Set up parameters and initial conditions
             if planets_in is None:
-                sed_init, posx_init, posy_init = self._get_analytical_initial_guess(
-                    data_in,
-                    template_data_in,
-                    grid_coordinates
-                )
+                sed_init, posx_init, posy_init = self._get_analytical_initial_guess(data_cube_in, r_templates_in)
             # If planet_params_in is provided, use its values as initial conditions
             else:
                 # TODO: implement for multiple planets
@@ -152,37 +348,34 @@ class MLSEDEstimationModule(BaseModule):
                 posx_init = planets_in.collection[0].planet.sky_coordinates[0, 0, 0, 0, 0].cpu().numpy()
                 posy_init = planets_in.collection[0].planet.sky_coordinates[1, 0, 0, 0, 0].cpu().numpy()
 
+            if self.solver == 'torch':
+                r_planets_out = self._fit_torch(
+                    r_setup_in,
+                    data_cube_in[None],
+                    torch.tensor([float(posx_init)]),
+                    torch.tensor([float(posy_init)]),
+                    r_transformation_in.transformation if r_transformation_in else None
+                )
+                print('Done')
+                return r_planets_out,
+
+            # Flatten data along differential outputs and times axes
+            nk, nl, nt = data_in.shape
+            data_in = data_in.permute(0, 2, 1).reshape(nk * nt, nl)
+
             data_in = data_in.cpu().numpy()
             hfov_max = r_setup_in.phringe.get_field_of_view()[-1].cpu().numpy() / 2
 
-            params = Parameters()
-
-            for j in range(len(sed_init)):
-                if self.bounds:
-                    params.add(f'flux_{j}', value=sed_init[j], min=0)
-                else:
-                    params.add(f'flux_{j}', value=sed_init[j])
-            params.add('pos_x', value=posx_init, min=-hfov_max, max=hfov_max)
-            params.add('pos_y', value=posy_init, min=-hfov_max, max=hfov_max)
+            params = self._get_parameters(sed_init, posx_init, posy_init, hfov_max)
 
             # Perform MLE
-            def residual_data(params, target):
-                posx = params['pos_x'].value
-                posy = params['pos_y'].value
-                flux = np.array([params[f'flux_{z}'].value for z in range(len(sed_init))])
-                model = r_setup_in.phringe.get_model_counts(
-                    spectral_energy_distribution=flux,
-                    x_position=posx,
-                    y_position=posy,
-                    kernels=True
-                )
-                model = transf_in(model)
-                model = np.transpose(model, (0, 2, 1))
-                model = model.reshape(data_in.shape)
-
-                return model - target
-
-            out = minimize(residual_data, params, args=(data_in,), method='leastsq')
+            out = minimize(
+                self._get_residuals,
+                params,
+                args=(data_in, r_setup_in.phringe, transf_in),
+                method='leastsq',
+                Dfun=self._get_jacobian if self.analytical_jacobian else None
+            )
             cov_out = out.covar
 
             fluxes = np.array([out.params[f'flux_{k}'].value for k in range(len(sed_init))])
@@ -216,3 +409,116 @@ class MLSEDEstimationModule(BaseModule):
 
         print('Done')
         return r_planets_out,
+
+
+class MLSEDBatchEstimationModule(MLSEDEstimationModule):
+    """Class representation of a module that performs maximum likelihood estimation (MLE) of the planet's SED for a
+    stack of data realizations at once.
+
+    All realizations are fitted simultaneously with the torch variable projection solver and share the same templates
+    and transformation.
+
+    Parameters
+    ----------
+    n_setup_in : str
+        Name of the input configuration resource.
+    n_data_in : str
+        Name of the input data resource containing data of shape (n_realizations x n_diff_out x n_wavelengths x
+        n_time_steps).
+    n_planets_out : str
+        Name of the output planet parameters resource. It contains one planet resource per realization.
+    n_transformation_in : str, optional
+        Name of the input transformation resource. If None, no transformation is applied.
+    n_template_in : str, optional
+        Name of the input template resource used for the initial guesses.
+    n_planets_in : str, optional
+        Name of the input planet resource. If given, its position is used as initial guess for all realizations.
+    max_iterations : int, optional
+        The maximum number of solver iterations. Default is 100.
+    batch_size : int, optional
+        Number of realizations that are fitted at once. If None, all realizations are fitted at once.
+    """
+
+    def __init__(
+            self,
+            n_setup_in: str,
+            n_data_in: str,
+            n_planets_out: str,
+            n_transformation_in: str = None,
+            n_template_in: str = None,
+            n_planets_in: str = None,
+            max_iterations: int = 100,
+            batch_size: int = None
+    ):
+        """Constructor method.
+
+        Parameters
+        ----------
+        n_setup_in : str
+            Name of the input configuration resource.
+        n_data_in : str
+            Name of the input data resource containing data of shape (n_realizations x n_diff_out x n_wavelengths x
+            n_time_steps).
+        n_planets_out : str
+            Name of the output planet parameters resource. It contains one planet resource per realization.
+        n_transformation_in : str, optional
+            Name of the input transformation resource. If None, no transformation is applied.
+        n_template_in : str, optional
+            Name of the input template resource used for the initial guesses.
+        n_planets_in : str, optional
+            Name of the input planet resource. If given, its position is used as initial guess for all realizations.
+        max_iterations : int, optional
+            The maximum number of solver iterations. Default is 100.
+        batch_size : int, optional
+            Number of realizations that are fitted at once. If None, all realizations are fitted at once.
+        """
+        super().__init__(
+            n_setup_in=n_setup_in,
+            n_data_in=n_data_in,
+            n_planets_out=n_planets_out,
+            n_transformation_in=n_transformation_in,
+            n_template_in=n_template_in,
+            n_planets_in=n_planets_in,
+            solver='torch'
+        )
+        self.max_iterations = max_iterations
+        self.batch_size = batch_size
+
+    def run(self, pipeline_resources: list[BaseResource | ResourceCollection]) -> tuple[
+        ResourceCollection[PlanetResource]]:
+        console = Console()
+
+        with console.status("Estimating SEDs of all realizations using maximum likelihood estimation...",
+                            spinner="dots"):
+            r_setup_in = self.get_resource_from_name(self.n_setup_in)
+            r_transformation_in = self.get_resource_from_name(self.n_transformation_in) \
+                if self.n_transformation_in \
+                else None
+            planets_in = self.get_resource_from_name(self.n_planets_in) if self.n_planets_in else None
+            data_in = self.get_resource_from_name(self.n_data_in).view()
+
+            n_realizations = len(data_in)
+
+            # Set up the initial positions
+            if planets_in is None:
+                r_templates_in = self.get_resource_from_name(self.n_template_in)
+                _, posx_init, posy_init = self._get_analytical_initial_guess(data_in, r_templates_in)
+                posx_init = torch.tensor(posx_init, dtype=torch.get_default_dtype())
+                posy_init = torch.tensor(posy_init, dtype=torch.get_default_dtype())
+            else:
+                planet = planets_in.collection[0].planet
+                posx_init = torch.full((n_realizations,), planet.sky_coordinates[0, 0, 0, 0, 0].item())
+                posy_init = torch.full((n_realizations,), planet.sky_coordinates[1, 0, 0, 0, 0].item())
+
+            r_planets_out = self._fit_torch(
+                r_setup_in,
+                data_in,
+                posx_init,
+                posy_init,
+                r_transformation_in.transformation if r_transformation_in else None,
+                max_iterations=self.max_iterations,
+                batch_size=self.batch_size
+            )
+
+        print('Done')
+        return r_planets_out,
@@ -72,7 +72,7 @@ class ModelSubtractionModule(BaseModule):
         r_config_in = self.get_resource_from_name(self.n_setup_in) if self.n_setup_in is not None else None
         r_planet_params_in = self.get_resource_from_name(
             self.n_planet_params_in) if self.n_planet_params_in is not None else None
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
+        data_in = self.get_resource_from_name(self.n_data_in).view()
 
         r_data_out = DataResource(self.n_data_out)
 
@@ -1,17 +1,24 @@
 from typing import Union
 
 import numpy as np
+import torch
 from scipy.stats import norm
 
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.test_resource import TestResource
-from lifesimmc.util.resources import get_transformations_from_resource_name
+from lifesimmc.core.resources.test_result_batch import TestResultBatch
+from lifesimmc.util.resources import get_transformation_from_resource_name
 
 
 class NeymanPearsonTestModule(BaseModule):
     """Class representation of a Neyman-Pearson test module.
 
+    If the input data contains a stack of realizations of shape
+    (n_realizations x n_diff_out x n_wavelengths x n_time_steps), the model is only computed once and the test
+    statistics of all realizations are evaluated with a single matrix-vector product. The results are then returned as
+    a TestResultBatch.
+
     Parameters
     ----------
     n_setup_in : str
@@ -68,7 +75,7 @@ class NeymanPearsonTestModule(BaseModule):
         self.pfa = pfa
         self.pdet = pdet
 
-    def run(self, pipeline_resources: list[BaseResource]) -> tuple[TestResource]:
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[Union[TestResource, TestResultBatch]]:
         """Apply the Neyman-Pearson test.
 
         Parameters
@@ -78,22 +85,26 @@ class NeymanPearsonTestModule(BaseModule):
 
         Returns
         -------
-        TestResource
-            The test resource.
+        TestResource or TestResultBatch
+            The test resource or the test results of all realizations if the data contains a stack of realizations.
         """
         print("Performing Neyman-Pearson test...")
 
         r_setup_in = self.get_resource_from_name(self.n_setup_in) if self.n_setup_in is not None else None
-        transformations = get_transformations_from_resource_name(self, self.n_transformation_in)
+        transformation = get_transformation_from_resource_name(self, self.n_transformation_in)
         # r_planets_est_in = self.get_resource_from_name(
         #     self.n_planets_est_in) if self.n_planets_est_in is not None else None
         r_planet_params_true_in = self.get_resource_from_name(self.n_planets_true_in)
 
         # Prepare data
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
-        data_in_flat = data_in.flatten()
-        ndim = data_in_flat.numel()
-        data_in_flat = data_in_flat.cpu().numpy()
+        r_data_in = self.get_resource_from_name(self.n_data_in)
+        is_batch = r_data_in.is_streaming or r_data_in.view().ndim == 4
+
+        # Stacks of realizations are processed batch by batch below
+        if not is_batch:
+            data_in_flat = r_data_in.view().flatten()
+            ndim = data_in_flat.numel()
+            data_in_flat = data_in_flat.cpu().numpy()
 
         # TODO: handle mutiple planets
         # flux_est = r_planets_est_in.collection[0].sed
@@ -125,14 +136,35 @@ class NeymanPearsonTestModule(BaseModule):
 
         # print(t @ t)
 
-        for transf in transformations:
-            # model_est = transf(model_est)
-            model_true = transf(model_true)
+        # model_est = transformation(model_est)
+        model_true = transformation(model_true)
 
         # modelf_est = model_est.flatten()
         modelf_true = model_true.flatten()
         modelf_est = model_true.flatten()
 
+        # The model is the same for all realizations, so the test statistics of all realizations are given by a single
+        # matrix-vector product and the test statistics under H0 follow from them in closed form
+        if is_batch:
+            modelf = torch.as_tensor(modelf_true)
+            test_h1 = torch.cat(
+                [batch.flatten(start_dim=1) @ modelf.to(batch) for batch in r_data_in.get_batches()]
+            ).cpu().numpy()
+            ndim = modelf.numel()
+            xtx = (modelf @ modelf).item()
+
+            r_test_out = TestResultBatch.from_neyman_pearson(
+                name=self.n_test_out,
+                test_statistic_h1=test_h1,
+                test_statistic_h0=test_h1 - xtx,
+                model_length_xtx=xtx,
+                dimensions=ndim,
+                probability_false_alarm=self.pfa
+            )
+
+            print('Done')
+            return r_test_out,
+
         # Get test under H1 (planet present) and H0 (planet absent)
         test_h1 = (data_in_flat @ modelf_est)
         data_h0 = data_in_flat - modelf_true
@@ -4,6 +4,7 @@ import torch
 from lifesimmc.core.modules.base_module import BaseModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.image_resource import ImageResource
+from lifesimmc.util.cost_map import get_cost_map_from_tiles
 
 
 class RGBImageModule(BaseModule):
@@ -53,7 +54,7 @@ class RGBImageModule(BaseModule):
         self.n_image_out = n_image_out
         self.metric = metric
 
-    def run(self, pipeline_resources: list[BaseResource]) -> ImageResource:
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[ImageResource]:
         """Apply the RGB image module to generate a false color RGB image of the scene.
 
         Parameters
@@ -63,7 +64,7 @@ class RGBImageModule(BaseModule):
 
         Returns
         -------
-        ImageResource
+        tuple[ImageResource]
             The generated RGB image resource.
         """
         print('Generating RGB image...')
@@ -106,8 +107,7 @@ class RGBImageModule(BaseModule):
 
         r_config_in = self.get_resource_from_name(self.n_config_in)
         r_templates_in = self.get_resource_from_name(self.n_template_in)
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
-        template_data = r_templates_in.get_data()
+        data_in = self.get_resource_from_name(self.n_data_in).view()
 
         frac_red = 0.3
         frac_blue = 0.6
@@ -123,6 +123,8 @@ class RGBImageModule(BaseModule):
         i_2_3 = min(range(len(wl)), key=lambda i: abs(wl[i] - wl_2_3))
 
         if self.metric == 0:
+            template_data = r_templates_in.view()
+
             datab = data_in[:, i_min:i_1_2, :]
             datag = data_in[:, i_1_2:i_2_3, :]
             datar = data_in[:, i_2_3:i_max, :]
@@ -180,36 +182,12 @@ class RGBImageModule(BaseModule):
 
         elif self.metric == 1:
 
-            # Flatten data along differential outputs and times axes
-            data_in = data_in.permute(0, 2, 1)
-            data_in = data_in.reshape((-1,) + data_in.shape[2:])
-            template_data = template_data.permute(0, 2, 1, 3, 4)
-            template_data = template_data.reshape((-1,) + template_data.shape[2:])
-
-            # Calculate matrix C according to equation B.2
-            data_variance = torch.var(data_in, axis=0)
-            sum = torch.sum(torch.einsum('ij, ijkl->ijkl', data_in, template_data), axis=0)
-            vector_c = torch.einsum('ijk, i->ijk', sum, 1 / data_variance)
-
-            # Calculate matrix B according to equation B.3
-            sum = torch.sum(template_data ** 2, axis=0)
-            vector_b = torch.nan_to_num(torch.einsum('ijk, i->ijk', sum, 1 / data_variance), 1)
-
-            # Create diagonal matrix B
-            b_shape = vector_b.shape
-            eye = torch.eye(b_shape[0], device=self.device).unsqueeze(-1).unsqueeze(-1)
-            x_diag = vector_b.unsqueeze(1)
-            matrix_b = eye * x_diag
-
-            # Calculate the optimum flux according to equation B.6 and set positivity constraint
-            b_perm = matrix_b.permute(2, 3, 0, 1)
-            b_inv = torch.linalg.inv(b_perm).permute(2, 3, 0, 1)
-
-            optimum_flux = torch.einsum('ijkl, jkl->ikl', b_inv, vector_c)
-
-            # Calculate the cost function according to equation B.8
-            optimum_flux = torch.where(optimum_flux >= 0, optimum_flux, 0)
-            cost_function = optimum_flux * vector_c
+            # Calculate the optimum flux and cost function for all template positions
+            optimum_flux, cost_function = get_cost_map_from_tiles(
+                data_in,
+                r_templates_in.get_tiles(),
+                template_gram=r_templates_in.get_gram() if r_templates_in.has_gram else None
+            )
 
             # Map wavelengths
             image = np.zeros(
@@ -241,4 +219,4 @@ class RGBImageModule(BaseModule):
         r_image_out.set_image(torch.tensor(rgb_image))
 
         print('Done')
-        return r_image_out
+        return r_image_out,
@@ -0,0 +1,78 @@
+from lifesimmc.core.modules.base_module import BaseModule
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.template_resource import TemplateResource
+
+
+class TemplatePrecomputationModule(BaseModule):
+    """Class representation of the template precomputation module.
+
+    This module computes the data-independent parts of the detection maps once, i.e. the per-pixel template norms of
+    the matched filter and, optionally, the per-pixel Gram matrices of the wavelengths of the cost maps. The output
+    template resource shares the templates of the input resource without copying them and carries the precomputed
+    quantities, so that every subsequent detection map of a realization only costs the inner products of the data with
+    the templates. It should be placed after the last transformation of the templates, since the precomputed
+    quantities are only valid for the templates they were computed from.
+
+    Parameters
+    ----------
+    n_template_in : str
+        The name of the input template resource.
+    n_template_out : str
+        The name of the output template resource.
+    gram : bool
+        Whether to precompute the per-pixel Gram matrices in addition to the norms.
+    """
+
+    def __init__(self, n_template_in: str, n_template_out: str, gram: bool = False):
+        """Constructor method.
+
+        Parameters
+        ----------
+        n_template_in : str
+            The name of the input template resource.
+        n_template_out : str
+            The name of the output template resource.
+        gram : bool, optional
+            Whether to precompute the per-pixel Gram matrices in addition to the norms. Default is False.
+        """
+        super().__init__()
+        self.n_template_in = n_template_in
+        self.n_template_out = n_template_out
+        self.gram = gram
+
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[TemplateResource]:
+        """Precompute the template norms and Gram matrices.
+
+        Parameters
+        ----------
+        pipeline_resources : list[BaseResource]
+            List of resources to be used in the module.
+
+        Returns
+        -------
+        tuple[TemplateResource]
+            Tuple containing the output template resource.
+        """
+        print('Precomputing template norms...')
+
+        r_template_in = self.get_resource_from_name(self.n_template_in)
+
+        r_template_out = TemplateResource(
+            name=self.n_template_out,
+            grid_coordinates=r_template_in.grid_coordinates
+        )
+
+        if r_template_in.is_streaming:
+            r_template_out.set_tile_function(r_template_in.get_tile, r_template_in.tile_size)
+        else:
+            r_template_out.set_data(r_template_in.view())
+            r_template_out.tile_size = r_template_in.tile_size
+
+        # The norms are obtained from the Gram matrices if they are computed
+        if self.gram:
+            r_template_out.get_gram()
+
+        r_template_out.get_norms()
+
+        print('Done')
+        return r_template_out,
@@ -1,16 +1,17 @@
 import warnings
-from itertools import product
 
-import numpy as np
 import torch
 from numpy.linalg import pinv
 from scipy.linalg import sqrtm
+from torch import Tensor
 
 from lifesimmc.core.modules.processing.base_transformation_module import BaseTransformationModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.data_resource import DataResource
 from lifesimmc.core.resources.template_resource import TemplateResource
 from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util.matrix import apply_matrices_to_templates
+from lifesimmc.util.operators import BlockDiagonalOperator
 
 
 class NoiseVarianceNormalizationModule(BaseTransformationModule):
@@ -35,6 +36,9 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
         Name of the output transformation resource.
     diagonal_only : bool
         If True, only the diagonal of the covariance matrix is used for whitening. Default is False.
+    chunk_size : int, optional
+        Number of grid rows of the templates that are normalized at once. If None, all grid rows are normalized at
+        once. Default is None.
     """
 
     def __init__(
@@ -46,6 +50,7 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
             n_planet_params_in: str,
             n_template_in: str = None,
             n_template_out: str = None,
+            chunk_size: int = None,
     ):
         """Constructor method.
 
@@ -65,6 +70,9 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
             Name of the output transformation resource.
         diagonal_only : bool
             If True, only the diagonal of the covariance matrix is used for whitening. Default is False.
+        chunk_size : int, optional
+            Number of grid rows of the templates that are normalized at once. If None, all grid rows are normalized at
+            once. Default is None.
         """
         super().__init__()
         self.n_config_in = n_setup_in
@@ -74,6 +82,7 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
         self.n_template_out = n_template_out
         self.n_transformation_out = n_transformation_out
         self.n_planet_params_in = n_planet_params_in
+        self.chunk_size = chunk_size
 
     def run(self, pipeline_resources: list[BaseResource]) -> tuple[
         DataResource, TemplateResource, TransformationResource]:
@@ -96,7 +105,7 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
             warnings.warn('The noise variance normalization module should only be used for unperturbed instruments.')
 
         r_config_in = self.get_resource_from_name(self.n_config_in)
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
+        data_in = self.get_resource_from_name(self.n_data_in).clone()
         r_template_in = self.get_resource_from_name(self.n_template_in) if self.n_template_in is not None else None
         r_data_out = DataResource(self.n_data_out)
         planet_params_in = self.get_resource_from_name(self.n_planet_params_in) if self.n_planet_params_in else None
@@ -140,36 +149,38 @@ class NoiseVarianceNormalizationModule(BaseTransformationModule):
 
         if r_template_in is not None:
             r_template_in = self.get_resource_from_name(self.n_template_in)
-            template_data_in = r_template_in.get_data()
-            template_counts_white = torch.zeros(template_data_in.shape, device=self.device, dtype=torch.float32)
-
-            for k in range(template_data_in.shape[0]):
-                for i, j in product(range(template_data_in.shape[-2]), range(template_data_in.shape[-1])):
-                    # template_counts_white[k, :, :, i, j] = template_data_in[k, :, :, i, j] / data_variance[k]
-                    template_counts_white[k, :, :, i, j] = icov_sqrt[k] @ template_data_in[k, :, :, i, j]
-
-                # Create the output resources
-                r_template_out = TemplateResource(
-                    name=self.n_template_out,
-                    grid_coordinates=r_template_in.grid_coordinates
+
+            # Create the output resources
+            r_template_out = TemplateResource(
+                name=self.n_template_out,
+                grid_coordinates=r_template_in.grid_coordinates
+            )
+
+            # Normalize streamed templates on demand, tile by tile
+            if r_template_in.is_streaming:
+                def get_tile(start: int, stop: int) -> Tensor:
+                    """Normalize the templates of the grid rows from start to stop."""
+                    return apply_matrices_to_templates(
+                        icov_sqrt,
+                        r_template_in.get_tile(start, stop).to(torch.float32)
+                    )
+
+                r_template_out.set_tile_function(get_tile, r_template_in.tile_size)
+
+            # Normalize the templates of all grid pixels at once
+            else:
+                template_counts_white = apply_matrices_to_templates(
+                    icov_sqrt,
+                    r_template_in.view().to(torch.float32),
+                    chunk_size=self.chunk_size
                 )
                 r_template_out.set_data(template_counts_white)
 
         r_data_out.set_data(data_in)
 
-        # Save the normalization transformation
-        def normalization_transformation(data):
-            if isinstance(data, np.ndarray):
-                i2 = icov_sqrt.cpu().numpy()
-            else:
-                i2 = icov_sqrt
-            for l in range(data.shape[0]):
-                data[l] = i2[l] @ data[l]
-            return data
-
         r_transformation_out = TransformationResource(
             name=self.n_transformation_out,
-            transformation=normalization_transformation
+            transformation=BlockDiagonalOperator(icov_sqrt)
         )
 
         print('Done')
@@ -1,20 +1,34 @@
-from copy import deepcopy
+import math
+from typing import Union
 
-import numpy as np
 import torch
-from phringe.main import PHRINGE
+from torch import Tensor
 
 from lifesimmc.core.modules.processing.base_transformation_module import BaseTransformationModule
 from lifesimmc.core.resources.base_resource import BaseResource
 from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.setup_resource import SetupResource
 from lifesimmc.core.resources.template_resource import TemplateResource
 from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util.cache import LRUCache
+from lifesimmc.util.hashing import get_fingerprint
+from lifesimmc.util.matrix import get_ledoit_wolf_covariance
+from lifesimmc.util.noise import get_noise_reference_counts
+from lifesimmc.util.operators import DenseOperator, LinearOperator, LowRankUpdateOperator
 
 
 class ZCAWhiteningModule(BaseTransformationModule):
     """Class representation of the ZCA whitening transformation module. This module applied ZCA whitening to the data
     and templates using a covariance matrix based on a calibration star.
 
+    The covariance of the differential outputs and wavelengths is estimated from the time steps of a noise reference
+    data set, either as the sample covariance, with the Ledoit-Wolf shrinkage estimator, which stays well-conditioned
+    if there are few time steps per spectral channel, or as a low-rank plus diagonal covariance. In the latter case,
+    the whitening transformation is a diagonal scaling followed by a low-rank update, so that fitting it and whitening
+    the data and templates scales linearly with the number of spectral channels. The sample and Ledoit-Wolf estimators
+    form the dense covariance matrix and its eigendecomposition, which takes memory quadratic and time cubic in
+    n_diff_out * n_wavelengths, so the low-rank estimator should be used for many spectral channels.
+
     Parameters
     ----------
 
@@ -32,7 +46,25 @@ class ZCAWhiteningModule(BaseTransformationModule):
         Name of the output transformation resource.
     diagonal_only : bool
         If True, only the diagonal of the covariance matrix is used for whitening. Default is False.
+    cache : LRUCache, optional
+        Cache for the whitening matrix. If given, the noise reference simulation is only run once for identical
+        instruments, observations, star and zodi configurations. Default is None.
+    cache_per_seed : bool
+        If True, the seed is part of the cache key, so that the whitening matrix is only reused for identical seeds.
+        If False, it is shared between all seeds, e.g. between the realizations of a Monte Carlo run. Default is False.
+    covariance : str
+        The covariance estimator, i.e. 'sample', 'ledoit_wolf' or 'low_rank'. Default is 'sample'.
+    rank : int
+        The rank of the low-rank part of the covariance, which is required for the 'low_rank' estimator.
+    lazy_templates : bool
+        If True, stored templates are whitened on demand, tile by tile, whenever the whitened templates are accessed,
+        so that the whitened template cube is never held in memory next to the raw one. The tiles are whitened again on
+        every access. Streamed templates are always whitened on demand. Default is False.
+    template_tile_size : int
+        The number of grid rows per tile of lazily whitened templates. If None, the tile size of the input templates
+        is used or, if the input templates are stored as a single tile, a single grid row.
     """
+    uses_random_numbers = True
 
     def __init__(
             self,
@@ -42,7 +74,13 @@ class ZCAWhiteningModule(BaseTransformationModule):
             n_transformation_out: str,
             n_template_in: str = None,
             n_template_out: str = None,
-            diagonal_only: bool = False
+            diagonal_only: bool = False,
+            cache: LRUCache = None,
+            cache_per_seed: bool = False,
+            covariance: str = 'sample',
+            rank: int = None,
+            lazy_templates: bool = False,
+            template_tile_size: int = None
     ):
         """Constructor method.
 
@@ -62,7 +100,33 @@ class ZCAWhiteningModule(BaseTransformationModule):
             Name of the output transformation resource.
         diagonal_only : bool
             If True, only the diagonal of the covariance matrix is used for whitening. Default is False.
+        cache : LRUCache, optional
+            Cache for the whitening matrix. If given, the noise reference simulation is only run once for identical
+            instruments, observations, star and zodi configurations. Default is None.
+        cache_per_seed : bool
+            If True, the seed is part of the cache key, so that the whitening matrix is only reused for identical
+            seeds. If False, it is shared between all seeds, e.g. between the realizations of a Monte Carlo run.
+            Default is False.
+        covariance : str, optional
+            The covariance estimator, i.e. 'sample', 'ledoit_wolf' or 'low_rank'. Default is 'sample'.
+        rank : int, optional
+            The rank of the low-rank part of the covariance, which is required for the 'low_rank' estimator. Default is
+            None.
+        lazy_templates : bool, optional
+            If True, stored templates are whitened on demand, tile by tile, whenever the whitened templates are
+            accessed, so that the whitened template cube is never held in memory next to the raw one. The tiles are
+            whitened again on every access. Streamed templates are always whitened on demand. Default is False.
+        template_tile_size : int, optional
+            The number of grid rows per tile of lazily whitened templates. If None, the tile size of the input
+            templates is used or, if the input templates are stored as a single tile, a single grid row. Default is
+            None.
         """
+        if covariance not in ('sample', 'ledoit_wolf', 'low_rank'):
+            raise ValueError(f"Unknown covariance estimator '{covariance}'. Use 'sample', 'ledoit_wolf' or 'low_rank'.")
+
+        if covariance == 'low_rank' and rank is None:
+            raise ValueError("The 'low_rank' covariance estimator requires a rank.")
+
         super().__init__()
         self.n_setup_in = n_setup_in
         self.n_data_in = n_data_in
@@ -71,119 +135,258 @@ class ZCAWhiteningModule(BaseTransformationModule):
         self.n_template_out = n_template_out
         self.n_transformation_out = n_transformation_out
         self.diagonal_only = diagonal_only
+        self.cache = cache
+        self.cache_per_seed = cache_per_seed
+        self.covariance = covariance
+        self.rank = rank
+        self.lazy_templates = lazy_templates
+        self.template_tile_size = template_tile_size
 
-    def run(self, pipeline_resources: list[BaseResource]) -> tuple[
-                                                                 DataResource, TemplateResource, TransformationResource] | \
-                                                             tuple[DataResource, TransformationResource]:
-        """Apply the module.
+    def estimate_output_bytes(self, input_bytes: dict[str, Union[int, None]]) -> dict[str, Union[int, None]]:
+        """Estimate the sizes of the output resources, where lazily whitened templates only take up the memory of the
+        tile that is currently whitened.
 
         Parameters
         ----------
-        pipeline_resources : list[BaseResource]
-            List of resources to be processed.
+        input_bytes : dict[str, int or None]
+            The sizes of the input resources in bytes or None if they are unknown.
 
         Returns
         -------
-        tuple[DataResource, TemplateResource, TransformationResource]
-            Tuple containing the output data resource, template resource, and transformation resource.
+        dict[str, int or None]
+            The estimated sizes of the output resources in bytes or None if they are unknown.
         """
-        print('Applying ZCA whitening...')
+        output_bytes = super().estimate_output_bytes(input_bytes)
 
-        r_setup_in = self.get_resource_from_name(self.n_setup_in)
+        template_bytes = output_bytes.get(self.n_template_out)
+
+        if self.lazy_templates and template_bytes is not None and self.grid_size is not None:
+            tile_size = min(self.template_tile_size or 1, self.grid_size)
+            output_bytes[self.n_template_out] = math.ceil(template_bytes * tile_size / self.grid_size)
+
+        return output_bytes
+
+    def _get_cache_key(self, r_setup_in: SetupResource) -> str:
+        """Get the key of the whitening matrix in the cache.
+
+        Parameters
+        ----------
+        r_setup_in : SetupResource
+            The input setup resource.
 
-        # Generate a reference data set
-        phringe = PHRINGE(
-            seed=self.seed,
-            gpu_index=self.gpu_index,
-            grid_size=self.grid_size,
-            time_step_size=self.time_step_size,
-            device=self.device,
-            extra_memory=20
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        scene = r_setup_in.phringe._scene
+
+        return get_fingerprint(
+            self.__class__.__name__,
+            r_setup_in.phringe._instrument,
+            r_setup_in.phringe._observation,
+            [scene.star, scene.exozodi, scene.local_zodi],
+            self.grid_size,
+            self.time_step_size,
+            self.diagonal_only,
+            self.covariance,
+            self.rank,
+            self.seed if self.cache_per_seed else None
         )
 
-        # Create a copy of the instrument
-        instrument_new = deepcopy(r_setup_in.phringe._instrument)
-        phringe.set(instrument_new)
+    def _get_low_rank_whitening(self, noise_ref: Tensor, max_iterations: int = 100) -> LowRankUpdateOperator:
+        """Calculate the whitening transformation of a low-rank plus diagonal covariance F @ F.T + D.
 
-        # Set the observation
-        observation_new = deepcopy(r_setup_in.phringe._observation)
-        phringe.set(observation_new)
+        The factor F and the diagonal D are fitted with the expectation-maximization algorithm of factor analysis,
+        starting from the leading principal components. Each iteration only involves products of the data with
+        matrices of the size of F, so that the fit scales linearly with the number of spectral channels. With
+        G = D^(-1/2) @ F, the transformation (I + G @ G.T)^(-1/2) @ D^(-1/2) whitens the data. Since G has orthonormal
+        left singular vectors U and singular values s, the inverse square root is the low-rank update
+        I + U @ diag((1 + s^2)^(-1/2) - 1) @ U.T of the identity.
 
-        # Remove all planets from the scene to calculate covariance only on noise
-        scene_new = deepcopy(r_setup_in.phringe._scene)
+        Parameters
+        ----------
+        noise_ref : Tensor
+            The noise reference data of shape (n_diff_out * n_wavelengths x n_time_steps).
+        max_iterations : int
+            The maximum number of iterations of the fit.
 
-        for planet in r_setup_in.phringe._scene.planets:
-            scene_new.remove_source(planet.name)
+        Returns
+        -------
+        LowRankUpdateOperator
+            The whitening transformation.
+        """
+        n_samples = noise_ref.shape[-1]
+        noise_ref = noise_ref - noise_ref.mean(dim=-1, keepdim=True)
+        variance = (noise_ref ** 2).sum(dim=-1) / (n_samples - 1)
+        min_variance = 1e-6 * variance.mean()
+        eye = torch.eye(self.rank, dtype=noise_ref.dtype, device=noise_ref.device)
 
-        phringe.set(scene_new)
+        # Start from the leading principal components and the remaining variance
+        U, S, _ = torch.svd_lowrank(noise_ref, q=self.rank)
+        factor = U * S / math.sqrt(n_samples - 1)
+        residual_variance = (variance - (factor ** 2).sum(dim=-1)).clamp(min=min_variance)
 
-        # Get the noise reference counts
-        noise_ref = phringe.get_counts(kernels=True)
+        for _ in range(max_iterations):
+            # Projection onto the expected latent factors, using the Woodbury identity for the inverse covariance
+            factor_scaled = factor / residual_variance[:, None]
+            projection = torch.linalg.solve(eye + factor.T @ factor_scaled, factor_scaled.T)
+            cov_projection = noise_ref @ (noise_ref.T @ projection.T) / (n_samples - 1)
+            latent_cov = eye - projection @ factor + projection @ cov_projection
 
-        # Calculate the whitening matrix
-        nk = noise_ref.shape[0]
-        nl = noise_ref.shape[1]
-        nt = noise_ref.shape[2]
+            factor_new = torch.linalg.solve(latent_cov, cov_projection.T).T
+            residual_variance = (variance - (factor_new * cov_projection).sum(dim=-1)).clamp(min=min_variance)
+            converged = torch.allclose(factor_new, factor, rtol=1e-6, atol=1e-6 * factor.abs().max().item())
+            factor = factor_new
 
-        noise_ref = noise_ref.reshape(nk * nl, nt)
-        cov = torch.cov(noise_ref)
+            if converged:
+                break
 
-        U, Svals, _ = torch.linalg.svd(cov)
-        w = U @ torch.diag(1 / torch.sqrt(Svals)) @ U.T
+        diagonal = residual_variance.rsqrt()
+        U, S, _ = torch.linalg.svd(diagonal[:, None] * factor, full_matrices=False)
 
-        if self.diagonal_only:
-            w = torch.diag(torch.diag(w))
+        return LowRankUpdateOperator(diagonal, U, (1 + S ** 2).rsqrt() - 1)
 
-        # Apply the whitening matrix to the data
-        data_in = self.get_resource_from_name(self.n_data_in).get_data()
-        r_data_out = DataResource(self.n_data_out)
+    def _get_whitening(self, noise_ref: Tensor) -> LinearOperator:
+        """Calculate the whitening transformation from the covariance of noise reference data.
 
-        data_in = data_in.reshape(nk * nl, nt)
-        data_in_white = w @ data_in
-        data_in_white = data_in_white.reshape(nk, nl, nt)
+        If only the diagonal is used, the diagonal of the low-rank whitening transformation is calculated without
+        forming its dense matrix.
 
-        r_data_out.set_data(data_in_white)
+        Parameters
+        ----------
+        noise_ref : Tensor
+            The noise reference data of shape (n_diff_out * n_wavelengths x n_time_steps).
 
-        # Apply whitening to templates
-        if self.n_template_in and self.n_template_out:
-            r_template_in = self.get_resource_from_name(self.n_template_in)
-            template_data_in = r_template_in.get_data()
+        Returns
+        -------
+        LinearOperator
+            The whitening transformation.
+        """
+        if self.covariance == 'low_rank':
+            zca = self._get_low_rank_whitening(noise_ref)
 
-            nk, nl, nt, ng, _ = template_data_in.shape
+            if self.diagonal_only:
+                zca = LowRankUpdateOperator(zca.get_diagonal(), zca.factor[:, :0], zca.coefficients[:0])
 
-            template_data_in_flat = template_data_in.reshape(nk * nl, nt, ng, ng)
+            return zca
 
-            template_data_in_white = torch.einsum(
-                "ab,btij->atij",
-                w,
-                template_data_in_flat,
-            )
+        cov = get_ledoit_wolf_covariance(noise_ref) if self.covariance == 'ledoit_wolf' else torch.cov(noise_ref)
 
-            template_data_in_white = template_data_in_white.reshape(nk, nl, nt, ng, ng)
+        # The singular values of the symmetric covariance matrix are the magnitudes of its eigenvalues, of which the
+        # smallest ones can be negative due to rounding errors
+        eigenvalues, U = torch.linalg.eigh(cov)
+        zca = DenseOperator(U @ torch.diag(1 / torch.sqrt(eigenvalues.abs())) @ U.T)
 
-            r_template_out = TemplateResource(
-                name=self.n_template_out,
-                grid_coordinates=r_template_in.grid_coordinates
-            )
-            r_template_out.set_data(template_data_in_white)
+        if self.diagonal_only:
+            zca = DenseOperator(torch.diag(zca.get_diagonal()))
+
+        return zca
+
+    def _get_whitening_operator(self, r_setup_in: SetupResource) -> LinearOperator:
+        """Calculate the whitening transformation from a noise-only reference data set.
+
+        Parameters
+        ----------
+        r_setup_in : SetupResource
+            The input setup resource.
+
+        Returns
+        -------
+        LinearOperator
+            The whitening transformation acting on data of shape (n_diff_out x n_wavelengths x n_time_steps).
+        """
+        noise_ref = get_noise_reference_counts(self, r_setup_in.phringe)
+        nk, nl, nt = noise_ref.shape
+
+        return self._get_whitening(noise_ref.reshape(nk * nl, nt))
+
+    def _get_whitened_templates(self, r_template_in: TemplateResource, zca: LinearOperator) -> TemplateResource:
+        """Get the whitened templates, which are whitened on demand if they are streamed or lazy whitening is enabled.
+
+        Parameters
+        ----------
+        r_template_in : TemplateResource
+            The input template resource.
+        zca : LinearOperator
+            The whitening transformation.
+
+        Returns
+        -------
+        TemplateResource
+            The output template resource.
+        """
+        r_template_out = TemplateResource(
+            name=self.n_template_out,
+            grid_coordinates=r_template_in.grid_coordinates
+        )
 
+        if r_template_in.is_streaming:
+            tile_size = self.template_tile_size or r_template_in.tile_size
+        elif self.lazy_templates:
+            # A single tile would be the whole cube, so lazily whitened stored templates are whitened row by row
+            tile_size = self.template_tile_size or r_template_in.tile_size or 1
         else:
-            r_template_out = None
+            r_template_out.set_data(zca.apply_to_templates(r_template_in.view()))
+            return r_template_out
+
+        r_template_out.set_tile_function(
+            lambda start, stop: zca.apply_to_templates(r_template_in.get_tile(start, stop)),
+            tile_size
+        )
 
-        # Save the whitening transformation
-        def zca_whitening_transformation(data):
-            """Apply the ZCA whitening transformation."""
-            if isinstance(data, np.ndarray):
-                w1 = w.cpu().numpy()
-            else:
-                w1 = w
-            nk, nl, nt = data.shape
-            data = w1 @ data.reshape(nk * nl, nt)
-            data = data.reshape(nk, nl, nt)
+        return r_template_out
+
+    def run(self, pipeline_resources: list[BaseResource]) -> tuple[
+                                                                 DataResource, TemplateResource, TransformationResource] | \
+                                                             tuple[DataResource, TransformationResource]:
+        """Apply the module.
 
-            return data
+        Parameters
+        ----------
+        pipeline_resources : list[BaseResource]
+            List of resources to be processed.
 
-        zca = zca_whitening_transformation
+        Returns
+        -------
+        tuple[DataResource, TemplateResource, TransformationResource]
+            Tuple containing the output data resource, template resource, and transformation resource.
+        """
+        print('Applying ZCA whitening...')
+
+        r_setup_in = self.get_resource_from_name(self.n_setup_in)
+
+        # Get the whitening matrix from the cache or calculate it from a noise reference data set
+        cache_key = self._get_cache_key(r_setup_in) if self.cache is not None else None
+        zca = self.cache.get(cache_key) if self.cache is not None else None
+
+        if zca is None:
+            zca = self._get_whitening_operator(r_setup_in)
+
+            if self.cache is not None:
+                self.cache.set(cache_key, zca)
+
+        zca = zca.to(self.device)
+
+        # Apply the whitening matrix to the data
+        r_data_in = self.get_resource_from_name(self.n_data_in)
+        r_data_out = DataResource(self.n_data_out)
+
+        # Stacked data of several realizations is whitened with the same matrix, streamed data batch by batch
+        if r_data_in.is_streaming:
+            r_data_out.set_batch_function(
+                lambda start, stop: zca.apply_batch(r_data_in.get_batch(start, stop)),
+                r_data_in.n_realizations,
+                r_data_in.batch_size
+            )
+        else:
+            r_data_out.set_data(zca.apply_batch(r_data_in.view()))
+
+        # Apply whitening to templates
+        if self.n_template_in and self.n_template_out:
+            r_template_out = self._get_whitened_templates(self.get_resource_from_name(self.n_template_in), zca)
+        else:
+            r_template_out = None
 
         r_transformation_out = TransformationResource(
             name=self.n_transformation_out,
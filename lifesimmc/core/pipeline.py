@@ -1,10 +1,175 @@
+import json
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+from types import BuiltinFunctionType, FunctionType, MethodType
 from typing import Union
 
+import numpy as np
 import torch
 from phringe.util.memory import get_device
 
 from lifesimmc.core.modules.base_module import BaseModule
-from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.base_resource import BaseResource, get_bytes_copied
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.image_resource import ImageResource
+from lifesimmc.core.resources.spilled_resource import SpilledResource
+from lifesimmc.core.resources.template_resource import TemplateResource
+from lifesimmc.core.resources.test_resource import TestResource
+from lifesimmc.core.resources.test_result_batch import TestResultBatch
+from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util import serialization
+from lifesimmc.util.cache import LRUCache
+from lifesimmc.util.hashing import get_fingerprint
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Resources that only hold tensors, arrays and linear operators can be restored from a persisted cache, checkpoints and
+# spill files. Other resources, e.g. setup resources holding PHRINGE instances, are only kept in memory
+torch.serialization.add_safe_globals([
+    DataResource,
+    ImageResource,
+    TemplateResource,
+    TestResource,
+    TestResultBatch,
+    TransformationResource
+])
+
+
+def _get_rss() -> Union[int, None]:
+    """Get the current resident set size of the process.
+
+    Returns
+    -------
+    int or None
+        The resident set size in bytes or None if it is not available on the platform.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _RSSMonitor:
+    """Class representation of a monitor sampling the resident set size of the process while a module runs.
+
+    The resident set size is shared by all threads, so the values of modules running concurrently include the memory
+    of each other.
+
+    Parameters
+    ----------
+    interval : float
+        The time between two samples in seconds.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """Constructor method.
+
+        Parameters
+        ----------
+        interval : float, optional
+            The time between two samples in seconds. Default is 0.01.
+        """
+        self.interval = interval
+        self.rss_start = None
+        self.rss_peak = None
+        self.rss_stop = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        """Sample the resident set size until the monitor is stopped."""
+        while not self._stop_event.wait(self.interval):
+            self.rss_peak = max(self.rss_peak, _get_rss())
+
+    def start(self):
+        """Record the resident set size at the start of the module and start sampling."""
+        self.rss_start = self.rss_peak = _get_rss()
+
+        if self.rss_start is not None:
+            self._thread.start()
+
+    def stop(self) -> dict[str, Union[int, None]]:
+        """Stop sampling and get the increase of the resident set size during the module.
+
+        Returns
+        -------
+        dict[str, int or None]
+            The increase of the peak resident set size during the module and the increase of the resident set size at
+            its end compared to its start in bytes, or None if the resident set size is not available.
+        """
+        if self.rss_start is None:
+            return {'peak_rss_increase': None, 'rss_increase': None}
+
+        self._stop_event.set()
+        self._thread.join()
+        self.rss_stop = _get_rss()
+        self.rss_peak = max(self.rss_peak, self.rss_stop)
+
+        return {'peak_rss_increase': self.rss_peak - self.rss_start, 'rss_increase': self.rss_stop - self.rss_start}
+
+
+def _holds_closure(resource: BaseResource) -> bool:
+    """Check whether a resource holds a function, e.g. the tile function of streaming templates.
+
+    The content of a function, including the variables it captures, cannot be fingerprinted, so that such resources
+    are excluded from caching and checkpointing. Callable objects that only hold data, e.g. linear operators, are
+    fingerprinted through their data.
+
+    Parameters
+    ----------
+    resource : BaseResource
+        The resource.
+
+    Returns
+    -------
+    bool
+        True if the resource holds a function, False otherwise.
+    """
+    return any(
+        isinstance(value, (FunctionType, MethodType, BuiltinFunctionType, partial))
+        for value in vars(resource).values()
+    )
+
+
+def _get_random_state() -> tuple:
+    """Get the state of the global random number generators used by PHRINGE.
+
+    Returns
+    -------
+    tuple
+        The states of the torch CPU and CUDA and the numpy random number generators.
+    """
+    cuda_state = torch.cuda.get_rng_state_all() if torch.cuda.is_initialized() else None
+    return torch.get_rng_state(), cuda_state, np.random.get_state()
+
+
+def _set_random_state(random_state: tuple):
+    """Set the state of the global random number generators used by PHRINGE.
+
+    Parameters
+    ----------
+    random_state : tuple
+        The states of the torch CPU and CUDA and the numpy random number generators.
+    """
+    torch_state, cuda_state, numpy_state = random_state
+    torch.set_rng_state(torch_state)
+    np.random.set_state(numpy_state)
+
+    if cuda_state is not None:
+        torch.cuda.set_rng_state_all(cuda_state)
 
 
 class Pipeline:
@@ -26,6 +191,33 @@ class Pipeline:
         The list of modules in the pipeline.
     _resources : dict
         The dictionary of resources in the pipeline.
+    evict : bool
+        Whether to evict resources from the pipeline after the last module of a run that uses them.
+    spill_dir : Path
+        The directory to which evicted resources are spilled. If None, evicted resources are freed.
+    max_workers : int
+        The maximum number of modules that run concurrently.
+    cache : LRUCache
+        The cache of the outputs of the modules. If None, the outputs are not cached.
+    profile : bool
+        Whether the resource usage of the modules is recorded.
+    trace_dir : Path
+        The directory to which torch profiler traces of the modules are written. If None, no traces are recorded.
+    checkpoint_dir : Path
+        The directory to which the outputs of the modules are checkpointed. If None, no checkpoints are written.
+    profile_records : list
+        The records of the resource usage of the modules that have been run with profiling enabled.
+    bytes_copied : int
+        The number of bytes of resource data that have been copied by the modules in all runs of the pipeline. The
+        copies are counted in the thread each module runs in, so that they are included for any number of workers.
+    _pinned : set
+        The names of the resources that are never evicted.
+    _fingerprints : dict
+        The fingerprints of the resources in the pipeline, which are None for resources that cannot be fingerprinted.
+    _random_fingerprint : str
+        The fingerprint of the last module that has used random numbers, which identifies the state of the random
+        number generators. It is an empty string before the first such module and None if that module cannot be
+        fingerprinted.
     """
 
     def __init__(
@@ -34,9 +226,68 @@ class Pipeline:
             gpu_index: int = None,
             grid_size: int = 40,
             time_step_size: float = None,
-            device: torch.device = None
+            device: torch.device = None,
+            evict: bool = False,
+            spill_dir: Union[str, Path] = None,
+            max_workers: int = 1,
+            cache: LRUCache = None,
+            profile: bool = False,
+            trace_dir: Union[str, Path] = None,
+            checkpoint_dir: Union[str, Path] = None
     ):
-        """Constructor method."""
+        """Constructor method.
+
+        Parameters
+        ----------
+        seed : int
+            The seed for the random number generator.
+        gpu_index : int
+            The index of the GPU to use.
+        grid_size : int
+            The size of the grid.
+        time_step_size : float
+            The size of the time step.
+        device : torch.device
+            The device to use for the simulation.
+        evict : bool, optional
+            Whether to evict resources from the pipeline once they are no longer needed. When a pipeline is run, the
+            last module using each resource is determined from the declared input names of the modules (n_*_in
+            attributes). Resources that are used by the modules of the run are evicted after their last use, unless
+            they are pinned. Resources that are not used by any module of the run, e.g. final results, are kept.
+            Default is False.
+        spill_dir : str or Path, optional
+            The directory to which evicted resources are spilled instead of freeing them. Spilled resources are loaded
+            again transparently when they are accessed. Resources that cannot be pickled or loaded safely are kept in
+            memory. If None, evicted resources are freed.
+        max_workers : int, optional
+            The maximum number of modules that run concurrently. Modules are independent if none of them uses the
+            outputs of the other, e.g. the generation of the data and the templates. Modules using random numbers
+            always run in the order in which they have been added. Default is 1, i.e. the modules run one after the
+            other in the order in which they have been added.
+        cache : LRUCache, optional
+            The cache in which the outputs of the modules are memoized. Each module is identified by a fingerprint of
+            its class, its parameters, including the seed, and the fingerprints of its inputs. If a module with the
+            same fingerprint has been run before, e.g. in a previous pipeline of a parameter sweep, its cached outputs
+            are used instead of running it again. Modules using random numbers also depend on the previous module
+            using random numbers and restore the state of the random number generators after them, so that the
+            results are the same as without cache. The cache can be shared between pipelines and persisted on disk.
+            If None, the outputs are not cached.
+        profile : bool, optional
+            Whether to record the wall time, CPU time, peak memory usage, output sizes and device of each module. The
+            records are available with ``get_profile_report``. When modules run concurrently, the peak memory usage
+            is shared between them. Default is False.
+        trace_dir : str or Path, optional
+            The directory to which a torch profiler trace of each module is written, which can be opened e.g. in
+            chrome://tracing or Perfetto. This enables profiling and requires the modules to run one after the other.
+            If None, no traces are recorded.
+        checkpoint_dir : str or Path, optional
+            The directory to which the outputs of each module are checkpointed after it has been run, together with the
+            state of the random number generators. The checkpoints are identified by the fingerprints of the modules
+            (see ``cache``). If a pipeline with the same modules is run again, e.g. after the process has been
+            interrupted, the outputs of all modules with a checkpoint are restored, so that only the remaining
+            modules are run. Tensors are memory-mapped from the checkpoints. Use ``clear_checkpoints`` to remove the
+            checkpoints once they are no longer needed. If None, no checkpoints are written.
+        """
         self.seed = seed
         self.gpu_index = gpu_index
         self.grid_size = grid_size
@@ -44,6 +295,30 @@ class Pipeline:
         self.device = get_device(self.gpu_index) if device is None else device
         self._modules = []
         self._resources = {}
+        self.evict = evict
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self.max_workers = max_workers
+        self.cache = cache
+        self.trace_dir = Path(trace_dir) if trace_dir is not None else None
+        self.profile = profile or self.trace_dir is not None
+        self.profile_records = []
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir is not None else None
+        self.bytes_copied = 0
+        self._pinned = set()
+        self._fingerprints = {}
+        self._random_fingerprint = ''
+
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.checkpoint_dir is not None:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.trace_dir is not None:
+            if self.max_workers != 1:
+                raise ValueError('Profiler traces can only be recorded if the modules run one after the other.')
+
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
 
     def add_module(self, module: BaseModule):
         """Add a module to the pipeline.
@@ -61,6 +336,285 @@ class Pipeline:
         module.device = self.device
         self._modules.append(module)
 
+    def add_resource(self, resource: BaseResource):
+        """Add an existing resource to the pipeline, e.g. a resource that is shared between several pipelines.
+
+        Parameters
+        ----------
+        resource : BaseResource
+            The resource to add to the pipeline.
+        """
+        self._resources[resource.name] = resource
+        self._fingerprints.pop(resource.name, None)
+
+    def _get_checkpoint_path(self, fingerprint: str) -> Path:
+        """Get the path of the checkpoint of a module.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the module.
+
+        Returns
+        -------
+        Path
+            The path of the checkpoint.
+        """
+        return self.checkpoint_dir / f'{fingerprint}.pt'
+
+    def _load_checkpoint(self, fingerprint: str) -> Union[tuple, None]:
+        """Load the outputs of a module and the state of the random number generators after it from its checkpoint.
+
+        The tensors are memory-mapped from the checkpoint file with copy-on-write semantics, so they are only read
+        into memory when they are accessed.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the module.
+
+        Returns
+        -------
+        tuple or None
+            The output resources and the state of the random number generators or None if there is no checkpoint.
+        """
+        path = self._get_checkpoint_path(fingerprint)
+
+        if not path.exists():
+            return None
+
+        try:
+            return serialization.load(path, mmap=True)
+        except (pickle.UnpicklingError, RuntimeError, EOFError, OSError):
+            path.unlink(missing_ok=True)
+            return None
+
+    def _save_checkpoint(self, fingerprint: str, entry: tuple):
+        """Save the outputs of a module and the state of the random number generators after it to a checkpoint.
+
+        The checkpoint is written under a temporary name and renamed once it is complete, so that a process that is
+        interrupted while writing never leaves an incomplete checkpoint. Outputs that cannot be pickled or loaded
+        safely, e.g. setup resources holding PHRINGE instances, are not checkpointed, so the module is run again when
+        the pipeline is resumed.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the module.
+        entry : tuple
+            The output resources and the state of the random number generators.
+        """
+        serialization.save(entry, self._get_checkpoint_path(fingerprint))
+
+    def clear_checkpoints(self):
+        """Remove all checkpoints from the checkpoint directory."""
+        if self.checkpoint_dir is not None:
+            for path in self.checkpoint_dir.glob('*.pt'):
+                path.unlink()
+
+    def _evict_resource(self, name: str):
+        """Evict a resource by freeing it or spilling it to disk.
+
+        Parameters
+        ----------
+        name : str
+            The name of the resource to evict.
+        """
+        resource = self._resources.get(name)
+
+        if resource is None or isinstance(resource, SpilledResource):
+            return
+
+        if self.spill_dir is None:
+            del self._resources[name]
+            return
+
+        path = self.spill_dir / f'{name}.pt'
+
+        # Resources that cannot be pickled or loaded safely are kept in memory
+        if serialization.save(resource, path):
+            self._resources[name] = SpilledResource(name=name, path=path)
+
+    def _get_dependencies(self) -> list[set[int]]:
+        """Get the dependencies between the modules and validate that all their inputs are available.
+
+        A module depends on the last previous module producing one of its inputs. A module producing a resource also
+        depends on the previous modules producing or using a resource of the same name, so that resources are never
+        replaced before they have been used. Modules that use random numbers depend on the previous module using random
+        numbers. Modules that do not declare any inputs or outputs are run after all previous and before all following
+        modules.
+
+        Returns
+        -------
+        list[set[int]]
+            The indices of the modules each module depends on.
+        """
+        dependencies = []
+        producers = {}
+        users = {}
+        last_random_module = None
+        last_barrier = None
+
+        for index, module in enumerate(self._modules):
+            input_names = module.get_input_names()
+            output_names = module.get_output_names()
+            module_dependencies = set()
+
+            for name in input_names:
+                if name in producers:
+                    module_dependencies.add(producers[name])
+                elif name not in self._resources:
+                    raise ValueError(
+                        f"Resource '{name}' required by {module.__class__.__name__} is neither in the pipeline nor "
+                        f"produced by a previous module."
+                    )
+                users.setdefault(name, set()).add(index)
+
+            for name in output_names:
+                if name in producers:
+                    module_dependencies.add(producers[name])
+                module_dependencies.update(users.pop(name, set()))
+                producers[name] = index
+
+            if module.uses_random_numbers:
+                if last_random_module is not None:
+                    module_dependencies.add(last_random_module)
+                last_random_module = index
+
+            if not input_names and not output_names:
+                module_dependencies.update(range(index))
+                last_barrier = index
+            elif last_barrier is not None:
+                module_dependencies.add(last_barrier)
+
+            module_dependencies.discard(index)
+            dependencies.append(module_dependencies)
+
+        return dependencies
+
+    def _print_plan(self, dependencies: list[set[int]]):
+        """Print the stages of the execution plan and the estimated memory footprint of the resources.
+
+        Sizes that cannot be estimated before running, e.g. of data generated from a setup that is created in the same
+        run, are printed as unknown. The peak memory is then only a lower bound.
+
+        Parameters
+        ----------
+        dependencies : list[set[int]]
+            The indices of the modules each module depends on.
+        """
+
+        def format_size(size):
+            return 'unknown' if size is None else f'{size / 1024 ** 2:.2f} MB'
+
+        sizes = {
+            name: resource.get_size_in_bytes()
+            if isinstance(resource, BaseResource) and not isinstance(resource, SpilledResource) else None
+            for name, resource in self._resources.items()
+        }
+        live_names = set(sizes)
+        remaining_uses = Counter(name for module in self._modules for name in module.get_input_names())
+        peak_size = sum(size or 0 for size in sizes.values())
+
+        for stage_index, stage in enumerate(self._get_stages(dependencies)):
+            print(f'Stage {stage_index + 1}:')
+
+            for index in stage:
+                module = self._modules[index]
+                input_names = module.get_input_names()
+                output_sizes = module.estimate_output_bytes({name: sizes.get(name) for name in input_names})
+                sizes.update(output_sizes)
+                live_names.update(output_sizes)
+                outputs = ', '.join(f'{name} ({format_size(size)})' for name, size in output_sizes.items())
+                print(f'    {module.__class__.__name__}: {", ".join(input_names) or "-"} -> {outputs or "-"}')
+
+            peak_size = max(peak_size, sum(sizes[name] or 0 for name in live_names))
+
+            for index in stage:
+                for name in self._modules[index].get_input_names():
+                    remaining_uses[name] -= 1
+                    if self.evict and remaining_uses[name] == 0 and name not in self._pinned:
+                        live_names.discard(name)
+
+        n_unknown = sum(size is None for size in sizes.values())
+
+        if n_unknown == 0:
+            print(f'Estimated peak memory of the resources: {format_size(peak_size)}')
+        elif peak_size == 0:
+            print(f'Estimated peak memory of the resources: unknown ({n_unknown} resources of unknown size)')
+        else:
+            print(
+                f'Estimated peak memory of the resources: at least {format_size(peak_size)} ({n_unknown} resources of '
+                f'unknown size)'
+            )
+
+    def _get_fingerprints(self) -> list[str]:
+        """Get the fingerprints of the modules and record the fingerprints of their outputs.
+
+        The fingerprints of resources that have been added to the pipeline directly are calculated from their content.
+        Resources that hold functions cannot be fingerprinted, so that the modules depending on them, directly or
+        through the state of the random number generators, are neither cached nor checkpointed.
+
+        Returns
+        -------
+        list[str or None]
+            The fingerprint of each module or None if it cannot be fingerprinted.
+        """
+        fingerprints = []
+
+        for module in self._modules:
+            input_fingerprints = []
+
+            for name in module.get_input_names():
+                if name not in self._fingerprints:
+                    resource = self.get_resource(name)
+                    self._fingerprints[name] = None if _holds_closure(resource) else get_fingerprint({
+                        key: value for key, value in vars(resource).items() if key != '_version'
+                    })
+                input_fingerprints.append(self._fingerprints[name])
+
+            if module.uses_random_numbers:
+                input_fingerprints.append(self._random_fingerprint)
+
+            if None in input_fingerprints:
+                fingerprint = None
+            else:
+                fingerprint = module.get_fingerprint(input_fingerprints)
+
+            fingerprints.append(fingerprint)
+
+            if module.uses_random_numbers:
+                self._random_fingerprint = fingerprint
+
+            for name in module.get_output_names():
+                self._fingerprints[name] = get_fingerprint(fingerprint, name) if fingerprint is not None else None
+
+        return fingerprints
+
+    @staticmethod
+    def _get_stages(dependencies: list[set[int]]) -> list[list[int]]:
+        """Group the modules into stages of modules that only depend on modules of previous stages.
+
+        Parameters
+        ----------
+        dependencies : list[set[int]]
+            The indices of the modules each module depends on.
+
+        Returns
+        -------
+        list[list[int]]
+            The indices of the modules of each stage.
+        """
+        levels = []
+
+        for module_dependencies in dependencies:
+            levels.append(1 + max((levels[index] for index in module_dependencies), default=-1))
+
+        return [
+            [index for index, level in enumerate(levels) if level == stage_level]
+            for stage_level in range(max(levels, default=-1) + 1)
+        ]
+
     def get_resource(self, name: str) -> Union[BaseResource, None]:
         """Get a resource by name.
 
@@ -75,16 +629,278 @@ class Pipeline:
             The resource if found, otherwise None.
         """
         if name in self._resources:
-            return self._resources[name]
+            resource = self._resources[name]
+
+            # Load resources that have been spilled to disk
+            if isinstance(resource, SpilledResource):
+                resource = resource.load()
+                self._resources[name] = resource
+
+            return resource
         else:
             print(f"Resource {name} not found.")
             return None
 
-    def run(self):
-        """Run the pipeline with all the modules that have been added. Remove the modules after running."""
-        for module in self._modules:
-            output_resources = module.run(pipeline_resources=self._resources)
-            if output_resources is not None:
-                for output_resource in output_resources:
-                    self._resources[output_resource.name] = output_resource
+    def pin(self, *names: str):
+        """Pin resources so that they are never evicted, e.g. to inspect them after the pipeline has been run.
+
+        Parameters
+        ----------
+        *names : str
+            The names of the resources to pin.
+        """
+        self._pinned.update(names)
+
+    def get_plan(self) -> list[list[BaseModule]]:
+        """Get the execution plan of the modules that have been added.
+
+        The modules are grouped into stages of modules that are independent of each other and only depend on modules
+        of previous stages, so that the modules of a stage can run concurrently.
+
+        Returns
+        -------
+        list[list[BaseModule]]
+            The modules of each stage.
+        """
+        return [[self._modules[index] for index in stage] for stage in self._get_stages(self._get_dependencies())]
+
+    def _run_module(self, module: BaseModule, fingerprint: str = None) -> tuple[tuple, dict]:
+        """Run a module or get its outputs from the cache and measure its resource usage.
+
+        Parameters
+        ----------
+        module : BaseModule
+            The module to run.
+        fingerprint : str, optional
+            The fingerprint of the module. If None, neither checkpoints nor the cache are used.
+
+        Returns
+        -------
+        tuple[tuple, dict]
+            The output resources of the module and the statistics of the run, i.e. the number of bytes copied and, if
+            profiling is enabled, the time and memory usage.
+        """
+        profiler = None
+        is_cuda = self.device is not None and torch.device(self.device).type == 'cuda'
+
+        if self.profile and is_cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        if self.trace_dir is not None:
+            profiler = torch.profiler.profile(profile_memory=True, record_shapes=True)
+            profiler.start()
+
+        rss_monitor = _RSSMonitor() if self.profile else None
+
+        if rss_monitor is not None:
+            rss_monitor.start()
+
+        wall_time = time.perf_counter()
+        cpu_time = time.thread_time()
+        bytes_copied = get_bytes_copied()
+        entry = None
+
+        if self.checkpoint_dir is not None and fingerprint is not None:
+            entry = self._load_checkpoint(fingerprint)
+
+        is_checkpointed = entry is not None
+
+        if entry is not None:
+            print(f'Restoring outputs of {module.__class__.__name__} from checkpoint')
+        elif self.cache is not None and fingerprint is not None:
+            entry = self.cache.get(fingerprint)
+
+            if entry is not None:
+                print(f'Using cached outputs of {module.__class__.__name__}')
+
+        if entry is not None:
+            output_resources, random_state = entry
+
+            if random_state is not None:
+                _set_random_state(random_state)
+        else:
+            try:
+                output_resources = module.run(pipeline_resources=self._resources)
+            except BaseException:
+                if rss_monitor is not None:
+                    rss_monitor.stop()
+                raise
+
+        statistics = {
+            'wall_time': time.perf_counter() - wall_time,
+            'cpu_time': time.thread_time() - cpu_time,
+            'bytes_copied': get_bytes_copied() - bytes_copied
+        }
+
+        if profiler is not None:
+            profiler.stop()
+            trace_name = f'{len(self.profile_records):03d}_{module.__class__.__name__}.json'
+            profiler.export_chrome_trace(str(self.trace_dir / trace_name))
+
+        if self.profile:
+            statistics.update({
+                **rss_monitor.stop(),
+                'max_memory_allocated': torch.cuda.max_memory_allocated(self.device) if is_cuda else None,
+                'device': str(self.device),
+                'cached': entry is not None
+            })
+
+        if fingerprint is not None:
+            if entry is None:
+                entry = (output_resources, _get_random_state() if module.uses_random_numbers else None)
+
+                # Outputs that cannot be pickled or loaded safely are only cached in memory
+                if self.cache is not None:
+                    self.cache.set(fingerprint, entry)
+
+            if self.checkpoint_dir is not None and not is_checkpointed:
+                self._save_checkpoint(fingerprint, entry)
+
+        return output_resources, statistics
+
+    def _finish_module(self, module: BaseModule, output_resources: tuple, statistics: dict, remaining_uses: Counter):
+        """Add the outputs of a module to the pipeline and evict the resources that are no longer needed.
+
+        Parameters
+        ----------
+        module : BaseModule
+            The module that has been run.
+        output_resources : tuple
+            The output resources of the module.
+        statistics : dict
+            The statistics of the run of the module.
+        remaining_uses : Counter
+            The number of modules of the run that still have to use each resource.
+        """
+        output_resources = output_resources or ()
+
+        for output_resource in output_resources:
+            self._resources[output_resource.name] = output_resource
+
+        self.bytes_copied += statistics['bytes_copied']
+
+        if self.profile:
+            self.profile_records.append({
+                'module': module.__class__.__name__,
+                **statistics,
+                'output_bytes': {
+                    resource.name: resource.get_size_in_bytes()
+                    for resource in output_resources if isinstance(resource, BaseResource)
+                }
+            })
+
+        for name in module.get_input_names():
+            remaining_uses[name] -= 1
+
+            # Evict the resources that are not used by any of the remaining modules
+            if self.evict and remaining_uses[name] == 0 and name not in self._pinned:
+                self._evict_resource(name)
+
+    def get_profile_report(self, format: str = 'dict') -> Union[list[dict], str, 'pandas.DataFrame']:
+        """Get the report of the resource usage of all modules that have been run with profiling enabled.
+
+        Each record contains the name of the module, the wall time and the CPU time of its thread in seconds, the
+        number of bytes of resource data it copied, the increase of the peak resident set size of the process during the
+        module and of the resident set size at its end compared to its start in bytes, which include the memory of
+        modules running concurrently, on CUDA devices the peak memory allocated by torch during the module in bytes,
+        the device, whether the outputs have been taken from the cache and the sizes of the output resources in bytes.
+
+        Parameters
+        ----------
+        format : str, optional
+            The format of the report, i.e. 'dict' for a list of records, 'json' for a JSON string or 'dataframe' for a
+            pandas DataFrame, which requires pandas to be installed. Default is 'dict'.
+
+        Returns
+        -------
+        list[dict] or str or pandas.DataFrame
+            The report.
+        """
+        if format == 'dict':
+            return [dict(record) for record in self.profile_records]
+        elif format == 'json':
+            return json.dumps(self.profile_records, indent=4)
+        elif format == 'dataframe':
+            try:
+                import pandas as pd
+            except ImportError as error:
+                raise ImportError("The 'dataframe' format requires pandas to be installed.") from error
+
+            return pd.DataFrame(self.profile_records)
+        else:
+            raise ValueError(f"Unknown format '{format}'. Use 'dict', 'json' or 'dataframe'.")
+
+    def run(self, dry_run: bool = False):
+        """Run the pipeline with all the modules that have been added. Remove the modules after running.
+
+        The dependencies between the modules are derived from the names of their input and output resources and
+        validated before any module is run. With max_workers > 1, independent modules run concurrently on a thread
+        pool.
+
+        Parameters
+        ----------
+        dry_run : bool, optional
+            If True, the modules are not run, but the execution plan and the estimated memory footprint of the
+            resources are printed. Default is False.
+        """
+        dependencies = self._get_dependencies()
+
+        if dry_run:
+            self._print_plan(dependencies)
+            return
+
+        remaining_uses = Counter(name for module in self._modules for name in module.get_input_names())
+        if self.cache is not None or self.checkpoint_dir is not None:
+            fingerprints = self._get_fingerprints()
+        else:
+            fingerprints = [None] * len(self._modules)
+
+        if self.max_workers == 1:
+            for module, fingerprint in zip(self._modules, fingerprints):
+                output_resources, statistics = self._run_module(module, fingerprint)
+                self._finish_module(module, output_resources, statistics, remaining_uses)
+        else:
+            self._run_concurrently(dependencies, fingerprints, remaining_uses)
+
         self._modules = []
+
+    def _run_concurrently(self, dependencies: list[set[int]], fingerprints: list[str], remaining_uses: Counter):
+        """Run the modules on a thread pool, starting each module as soon as its dependencies have finished.
+
+        Parameters
+        ----------
+        dependencies : list[set[int]]
+            The indices of the modules each module depends on.
+        fingerprints : list[str]
+            The fingerprints of the modules or None if the cache is not used.
+        remaining_uses : Counter
+            The number of modules of the run that still have to use each resource.
+        """
+        pending_dependencies = [set(module_dependencies) for module_dependencies in dependencies]
+        dependents = [[] for _ in self._modules]
+
+        for index, module_dependencies in enumerate(dependencies):
+            for dependency in module_dependencies:
+                dependents[dependency].append(index)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._run_module, self._modules[index], fingerprints[index]): index
+                for index, module_dependencies in enumerate(dependencies) if not module_dependencies
+            }
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                # Process the finished modules in the order in which they have been added
+                for future in sorted(done, key=futures.get):
+                    index = futures.pop(future)
+                    output_resources, statistics = future.result()
+                    self._finish_module(self._modules[index], output_resources, statistics, remaining_uses)
+
+                    for dependent in dependents[index]:
+                        pending_dependencies[dependent].discard(index)
+
+                        if not pending_dependencies[dependent]:
+                            module = self._modules[dependent]
+                            futures[executor.submit(self._run_module, module, fingerprints[dependent])] = dependent
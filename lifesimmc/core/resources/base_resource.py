@@ -1,13 +1,178 @@
+import threading
 from dataclasses import dataclass
+from typing import ClassVar
+
+import numpy as np
+from torch import Tensor
+
+from lifesimmc.util.operators import LinearOperator
+
+_copy_statistics = threading.local()
+
+
+def add_bytes_copied(data: Tensor):
+    """Add the size of a copied tensor to the number of bytes copied by the current thread.
+
+    The counts are thread-local, so that modules running concurrently in the worker threads of a pipeline do not
+    interfere with each other.
+
+    Parameters
+    ----------
+    data : Tensor
+        The copied tensor.
+    """
+    _copy_statistics.bytes_copied = get_bytes_copied() + data.numel() * data.element_size()
+
+
+def get_bytes_copied() -> int:
+    """Get the number of bytes of resource data that have been copied by the current thread.
+
+    Copies made in other threads are not included. In particular, if a pipeline runs with ``max_workers > 1``, the
+    modules run in worker threads and their copies are not seen by the calling thread. Use the ``bytes_copied``
+    attribute of the pipeline instead, which sums the copies of all modules measured in the threads they ran in. Copies
+    made in threads started by a module itself are not counted in either case.
+
+    Returns
+    -------
+    int
+        The number of bytes copied.
+    """
+    return getattr(_copy_statistics, 'bytes_copied', 0)
 
 
 @dataclass
 class BaseResource:
     """Class representation of the base resource.
 
+    Resources holding a tensor that is shared between modules set ``_data_attribute`` to the name of the attribute
+    storing it and record its version counter in ``_version``, which enables the protection against in-place
+    modifications as well as ``clone`` and ``view``. Resources that can generate their data on demand override
+    ``is_streaming`` and ``_get_streamed_data``.
+
     Parameters
     ----------
     name : str
         The name of the resource.
     """
     name: str
+    _data_attribute: ClassVar[str] = None
+
+    @property
+    def is_streaming(self) -> bool:
+        """Whether the data is generated on demand.
+
+        Returns
+        -------
+        bool
+            True if the data is generated on demand, False if it is stored.
+        """
+        return False
+
+    def __setstate__(self, state: dict):
+        # The version counter of unpickled data does not match the recorded one, so it is recorded again
+        self.__dict__.update(state)
+
+        if self._data_attribute is not None:
+            data = getattr(self, self._data_attribute)
+            self._version = data._version if data is not None else None
+
+    def _check_unmodified(self):
+        """Raise an error if the data has been modified in place since it was set."""
+        data = self._get_stored_data()
+
+        if data is not None and data._version != self._version:
+            raise RuntimeError(
+                f"The data of resource '{self.name}' has been modified in place. Use clone() to get a copy of the data "
+                f"that can be modified."
+            )
+
+    def _get_stored_data(self) -> Tensor:
+        """Get the tensor stored in the data attribute of the resource.
+
+        Returns
+        -------
+        Tensor
+            The stored tensor or None if no tensor is stored.
+        """
+        if self._data_attribute is None:
+            raise TypeError(f"Resource '{self.name}' of type {type(self).__name__} does not hold data.")
+
+        return getattr(self, self._data_attribute)
+
+    def _get_streamed_data(self) -> Tensor:
+        """Generate all data of a resource in streaming mode.
+
+        Returns
+        -------
+        Tensor
+            The generated data.
+        """
+        raise NotImplementedError
+
+    def clone(self) -> Tensor:
+        """Get a copy of the data that can be modified.
+
+        The size of the copy is added to the number of copied bytes (see ``get_bytes_copied``). In streaming mode, the
+        data is generated and concatenated, which does not involve a copy.
+
+        Returns
+        -------
+        Tensor
+            A copy of the data stored in the resource.
+        """
+        if self.is_streaming:
+            return self._get_streamed_data()
+
+        self._check_unmodified()
+        data = self._get_stored_data()
+        add_bytes_copied(data)
+        return data.clone()
+
+    def get_size_in_bytes(self) -> int:
+        """Get the size of the tensors and arrays stored in the resource.
+
+        Objects that are not tensors, arrays, linear operators or resources, e.g. PHRINGE instances, are not included.
+
+        Returns
+        -------
+        int
+            The size in bytes.
+        """
+        size = 0
+
+        for value in vars(self).values():
+            values = value if isinstance(value, (list, tuple)) else [value]
+
+            for value in values:
+                if isinstance(value, Tensor):
+                    size += value.numel() * value.element_size()
+                elif isinstance(value, np.ndarray):
+                    size += value.nbytes
+                elif isinstance(value, BaseResource):
+                    size += value.get_size_in_bytes()
+                elif isinstance(value, LinearOperator):
+                    size += sum(
+                        tensor.numel() * tensor.element_size() for tensor in vars(value).values()
+                        if isinstance(tensor, Tensor)
+                    )
+
+        return size
+
+    def view(self) -> Tensor:
+        """Get a view of the data without copying it.
+
+        The view must not be modified in place, since this would change the data for all other modules. In-place
+        modifications are detected on the next access of the data. In streaming mode, the data is generated and
+        concatenated.
+
+        Returns
+        -------
+        Tensor
+            A view of the data stored in the resource.
+        """
+        if self.is_streaming:
+            return self._get_streamed_data()
+
+        self._check_unmodified()
+        data = self._get_stored_data()
+        return data.view_as(data)
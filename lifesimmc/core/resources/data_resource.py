@@ -1,6 +1,7 @@
-from copy import copy
 from dataclasses import dataclass
+from typing import Callable, ClassVar, Iterator
 
+import torch
 from torch import Tensor
 
 from lifesimmc.core.resources.base_resource import BaseResource
@@ -10,22 +11,128 @@ from lifesimmc.core.resources.base_resource import BaseResource
 class DataResource(BaseResource):
     """Class representation of the data resource.
 
+    The data is either stored as a tensor or, in streaming mode, a stack of realizations that is generated on demand in
+    batches of realizations by a batch function, so that the whole stack never needs to be held in memory.
+
     Parameters
     ----------
     _data : Tensor
         The data to be stored.
+    _version : int
+        The version counter of the data when it was set, which is used to detect in-place modifications.
+    n_realizations : int
+        The number of realizations in streaming mode.
+    batch_size : int
+        The number of realizations per batch. If None, all realizations are a single batch.
+    _batch_function : Callable
+        The function returning the realizations from start to stop in streaming mode.
     """
     _data: Tensor = None
+    _version: int = None
+    n_realizations: int = None
+    batch_size: int = None
+    _batch_function: Callable[[int, int], Tensor] = None
+    _data_attribute: ClassVar[str] = '_data'
+
+    @property
+    def is_streaming(self) -> bool:
+        """Whether the realizations are generated on demand.
+
+        Returns
+        -------
+        bool
+            True if the realizations are generated on demand, False if the data is stored.
+        """
+        return self._data is None and self._batch_function is not None
+
+    def _get_streamed_data(self) -> Tensor:
+        """Generate all batches and concatenate them.
+
+        Returns
+        -------
+        Tensor
+            The concatenated realizations.
+        """
+        return torch.cat(list(self.get_batches()))
 
     def get_data(self) -> Tensor:
         """Get the data stored in the resource.
 
+        This is equivalent to ``view``, i.e. the data is not copied and must not be modified in place.
+
+        Returns
+        -------
+        Tensor
+            A view of the data stored in the resource.
+        """
+        return self.view()
+
+    def get_batch(self, start: int, stop: int) -> Tensor:
+        """Get the realizations from start to stop of a stack of realizations.
+
+        Stored data is returned as a view, which must not be modified.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first realization.
+        stop : int
+            The index after the last realization.
+
         Returns
         -------
         Tensor
-            A deep copy of the data stored in the resource.
+            The realizations of shape (stop - start x n_diff_out x n_wavelengths x n_time_steps).
+        """
+        if self.is_streaming:
+            return self._batch_function(start, stop)
+
+        self._check_unmodified()
+        return self._data[start:stop]
+
+    def get_batches(self, batch_size: int = None) -> Iterator[Tensor]:
+        """Iterate over a stack of realizations in batches.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            The number of realizations per batch. If None, the batch size of the resource is used.
+
+        Yields
+        ------
+        Tensor
+            The realizations of a batch of shape (n_batch x n_diff_out x n_wavelengths x n_time_steps).
+        """
+        n_realizations = self.n_realizations if self.is_streaming else len(self._data)
+        batch_size = batch_size or self.batch_size or n_realizations
+
+        for start in range(0, n_realizations, batch_size):
+            yield self.get_batch(start, min(start + batch_size, n_realizations))
+
+    def set_batch_function(
+            self,
+            batch_function: Callable[[int, int], Tensor],
+            n_realizations: int,
+            batch_size: int = None
+    ):
+        """Set the function generating the realizations on demand, which enables the streaming mode.
+
+        The function must return the same realizations every time it is called with the same indices.
+
+        Parameters
+        ----------
+        batch_function : Callable[[int, int], Tensor]
+            The function returning the realizations from start to stop.
+        n_realizations : int
+            The number of realizations.
+        batch_size : int, optional
+            The number of realizations per batch. If None, all realizations are a single batch.
         """
-        return copy(self._data)
+        self._data = None
+        self._version = None
+        self._batch_function = batch_function
+        self.n_realizations = n_realizations
+        self.batch_size = batch_size
 
     def set_data(self, data: Tensor):
         """Set the data in the resource.
@@ -36,3 +143,5 @@ class DataResource(BaseResource):
             The data to be stored in the resource.
         """
         self._data = data
+        self._version = data._version if data is not None else None
+        self._batch_function = None
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.util import serialization
+
+
+@dataclass
+class SpilledResource(BaseResource):
+    """Class representation of a placeholder for a resource that has been spilled to disk by the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        The name of the resource.
+    path : Path
+        The path of the file the resource has been saved to.
+    """
+    path: Path = None
+
+    def load(self) -> BaseResource:
+        """Load the resource from disk without executing arbitrary code.
+
+        Returns
+        -------
+        BaseResource
+            The resource.
+        """
+        return serialization.load(self.path)
@@ -1,6 +1,7 @@
-from copy import deepcopy
 from dataclasses import dataclass
+from typing import Callable, ClassVar, Iterator
 
+import torch
 from torch import Tensor
 
 from lifesimmc.core.resources.base_resource import BaseResource
@@ -10,25 +11,170 @@ from lifesimmc.core.resources.base_resource import BaseResource
 class TemplateResource(BaseResource):
     """Class representation of a template resource.
 
+    The templates are either stored as a tensor or, in streaming mode, generated on demand in tiles of grid rows by a
+    tile function, so that the whole template cube never needs to be held in memory.
+
+    The per-pixel template norms and, optionally, the per-pixel Gram matrices of the wavelengths are computed once and
+    cached alongside the templates, so that repeated detection maps and cost maps only need the inner products with the
+    data. The caches are cleared whenever the templates are set, e.g. by a transformation module with a new
+    transformation.
+
     Parameters
     ----------
     name : str
         The name of the resource.
     _data : Tensor
         The data of the resource.
+    grid_coordinates : Tensor
+        The x and y coordinates of the template grid.
+    tile_size : int
+        The number of grid rows per tile. If None, the whole grid is a single tile.
+    _tile_function : Callable
+        The function returning the templates of the grid rows from start to stop in streaming mode.
+    _version : int
+        The version counter of the data when it was set, which is used to detect in-place modifications.
+    _norms : Tensor
+        The cached per-pixel template norms.
+    _gram : Tensor
+        The cached per-pixel Gram matrices of the wavelengths.
     """
     _data: Tensor = None
     grid_coordinates: Tensor = None
+    tile_size: int = None
+    _tile_function: Callable[[int, int], Tensor] = None
+    _version: int = None
+    _norms: Tensor = None
+    _gram: Tensor = None
+    _data_attribute: ClassVar[str] = '_data'
+
+    @property
+    def has_gram(self) -> bool:
+        """Whether the per-pixel Gram matrices have been computed.
+
+        Returns
+        -------
+        bool
+            True if the Gram matrices are cached, False otherwise.
+        """
+        return self._gram is not None
+
+    @property
+    def is_streaming(self) -> bool:
+        """Whether the templates are generated on demand.
+
+        Returns
+        -------
+        bool
+            True if the templates are generated on demand, False if they are stored.
+        """
+        return self._data is None and self._tile_function is not None
+
+    def _get_streamed_data(self) -> Tensor:
+        """Generate all tiles and concatenate them.
+
+        Returns
+        -------
+        Tensor
+            The concatenated templates.
+        """
+        return torch.cat(list(self.get_tiles()), dim=-2)
 
     def get_data(self) -> Tensor:
-        """Get the data of the resource.
+        """Get a copy of the data of the resource.
+
+        This is equivalent to ``clone``. Modules that only read the templates should use ``view`` instead.
 
         Returns
         -------
         Tensor
-            The data of the resource.
+            A copy of the data of the resource.
         """
-        return deepcopy(self._data)
+        return self.clone()
+
+    def get_gram(self) -> Tensor:
+        """Get the per-pixel Gram matrices of the wavelengths, i.e. the inner products of the templates of each pair of
+        wavelengths summed over the differential outputs and time steps.
+
+        The Gram matrices are computed tile by tile on the first call and cached.
+
+        Returns
+        -------
+        Tensor
+            The Gram matrices of shape (n_grid x n_grid x n_wavelengths x n_wavelengths).
+        """
+        if self._gram is None:
+            self._gram = torch.cat(
+                [torch.einsum('kjtab, kmtab->abjm', tile, tile) for tile in self.get_tiles()],
+                dim=0
+            )
+
+        self._check_unmodified()
+        return self._gram
+
+    def get_norms(self) -> Tensor:
+        """Get the per-pixel template norms, i.e. the Euclidean norms of the templates of each grid position.
+
+        The norms are computed tile by tile on the first call and cached. If the Gram matrices are cached, the norms
+        are obtained from their traces.
+
+        Returns
+        -------
+        Tensor
+            The norms of shape (n_grid x n_grid).
+        """
+        if self._norms is None:
+            if self.has_gram:
+                self._norms = torch.sqrt(torch.diagonal(self._gram, dim1=-2, dim2=-1).sum(dim=-1))
+            else:
+                self._norms = torch.cat(
+                    [torch.linalg.vector_norm(tile, dim=(0, 1, 2)) for tile in self.get_tiles()],
+                    dim=0
+                )
+
+        self._check_unmodified()
+        return self._norms
+
+    def get_tile(self, start: int, stop: int) -> Tensor:
+        """Get the templates of the grid rows from start to stop.
+
+        Stored templates are returned as a view, which must not be modified.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first grid row.
+        stop : int
+            The index after the last grid row.
+
+        Returns
+        -------
+        Tensor
+            The templates of shape (n_diff_out x n_wavelengths x n_time_steps x stop - start x n_grid).
+        """
+        if self.is_streaming:
+            return self._tile_function(start, stop)
+
+        self._check_unmodified()
+        return self._data[..., start:stop, :]
+
+    def get_tiles(self, tile_size: int = None) -> Iterator[Tensor]:
+        """Iterate over the templates in tiles of grid rows.
+
+        Parameters
+        ----------
+        tile_size : int, optional
+            The number of grid rows per tile. If None, the tile size of the resource is used.
+
+        Yields
+        ------
+        Tensor
+            The templates of a tile of shape (n_diff_out x n_wavelengths x n_time_steps x n_rows x n_grid).
+        """
+        n_grid = self.grid_coordinates.shape[-2]
+        tile_size = tile_size or self.tile_size or n_grid
+
+        for start in range(0, n_grid, tile_size):
+            yield self.get_tile(start, min(start + tile_size, n_grid))
 
     def set_data(self, data: Tensor):
         """Set the data of the resource.
@@ -39,3 +185,23 @@ class TemplateResource(BaseResource):
             The data to set.
         """
         self._data = data
+        self._version = data._version if data is not None else None
+        self._tile_function = None
+        self._norms = None
+        self._gram = None
+
+    def set_tile_function(self, tile_function: Callable[[int, int], Tensor], tile_size: int = None):
+        """Set the function generating the templates on demand, which enables the streaming mode.
+
+        Parameters
+        ----------
+        tile_function : Callable[[int, int], Tensor]
+            The function returning the templates of the grid rows from start to stop.
+        tile_size : int, optional
+            The number of grid rows per tile. If None, the whole grid is a single tile.
+        """
+        self._data = None
+        self._tile_function = tile_function
+        self.tile_size = tile_size
+        self._norms = None
+        self._gram = None
@@ -24,6 +24,10 @@ class TestResource(BaseResource):
         The probability of detection.
     probability_false_alarm : float
         The probability of false alarm.
+    p_value : float
+        The p-value of the test statistic under the alternative hypothesis.
+    threshold_xsi_interval : tuple[float, float]
+        The confidence interval of an empirically calibrated threshold.
     """
     test_statistic_h1: float = None
     test_statistic_h0: float = None
@@ -33,3 +37,4 @@ class TestResource(BaseResource):
     detection_probability: float = None
     probability_false_alarm: float = None
     p_value: float = None
+    threshold_xsi_interval: tuple[float, float] = None
@@ -0,0 +1,404 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Union
+
+import numpy as np
+from scipy.stats import chi2, ncx2, norm
+
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.test_resource import TestResource
+
+_COLUMNS = (
+    'test_statistic_h1',
+    'test_statistic_h0',
+    'threshold_xsi',
+    'model_length_xtx',
+    'detection_probability',
+    'p_value'
+)
+
+
+@dataclass
+class TestResultBatch(BaseResource):
+    """Class representation of the results of a test applied to many data realizations.
+
+    The results are stored column-wise with one array per field and one entry per realization, so that tens of
+    thousands of test outcomes, e.g. for ROC curves or detection yields, can be stored and evaluated without Python
+    loops. The test statistics, thresholds and detection probabilities are stored in the given data type, while the
+    p-values are always stored in double precision, since they underflow in single precision for strong detections.
+
+    Parameters
+    ----------
+    name : str
+        The name of the resource.
+    test_statistic_h1 : np.ndarray
+        The test statistics under the alternative hypothesis.
+    test_statistic_h0 : np.ndarray
+        The test statistics under the null hypothesis.
+    threshold_xsi : np.ndarray
+        The thresholds for the test statistics.
+    model_length_xtx : np.ndarray
+        The lengths of the models.
+    detection_probability : np.ndarray
+        The probabilities of detection.
+    p_value : np.ndarray
+        The p-values of the test statistics under the alternative hypothesis.
+    dimensions : int
+        The number of dimensions.
+    probability_false_alarm : float
+        The probability of false alarm.
+    threshold_xsi_interval : tuple[float, float]
+        The confidence interval of an empirically calibrated threshold.
+    dtype : np.dtype
+        The data type of all columns except the p-values. Default is np.float32.
+    """
+    test_statistic_h1: np.ndarray = None
+    test_statistic_h0: np.ndarray = None
+    threshold_xsi: np.ndarray = None
+    model_length_xtx: np.ndarray = None
+    detection_probability: np.ndarray = None
+    p_value: np.ndarray = None
+    dimensions: int = None
+    probability_false_alarm: float = None
+    threshold_xsi_interval: tuple[float, float] = None
+    dtype: np.dtype = np.float32
+
+    def __post_init__(self):
+        n_realizations = max(
+            (np.size(getattr(self, column)) for column in _COLUMNS if getattr(self, column) is not None),
+            default=0
+        )
+
+        # Values that are the same for all realizations, e.g. the threshold, are broadcast to all realizations
+        for column in _COLUMNS:
+            value = getattr(self, column)
+
+            if value is not None:
+                value = np.asarray(value, dtype=np.float64 if column == 'p_value' else self.dtype)
+                setattr(self, column, np.broadcast_to(value, (n_realizations,)).copy())
+
+    def __getitem__(self, index: int) -> TestResource:
+        return TestResource(
+            name=f'{self.name}_{index}',
+            dimensions=self.dimensions,
+            probability_false_alarm=self.probability_false_alarm,
+            threshold_xsi_interval=self.threshold_xsi_interval,
+            **{column: self._get_value(column, index) for column in _COLUMNS}
+        )
+
+    def __len__(self) -> int:
+        return len(self.test_statistic_h1) if self.test_statistic_h1 is not None else 0
+
+    def _get_value(self, column: str, index: int) -> Union[float, None]:
+        """Get the value of a column for a single realization.
+
+        Parameters
+        ----------
+        column : str
+            The name of the column.
+        index : int
+            The index of the realization.
+
+        Returns
+        -------
+        float or None
+            The value or None if the column is not set.
+        """
+        value = getattr(self, column)
+        return value[index].item() if value is not None else None
+
+    @classmethod
+    def from_energy_detector(
+            cls,
+            name: str,
+            test_statistic_h1: np.ndarray,
+            test_statistic_h0: np.ndarray,
+            model_length_xtx: Union[float, np.ndarray],
+            dimensions: int,
+            probability_false_alarm: float,
+            threshold_xsi: float = None,
+            threshold_xsi_interval: tuple[float, float] = None,
+            detection_probability: float = None,
+            dtype: np.dtype = np.float32
+    ) -> 'TestResultBatch':
+        """Create the results of the energy detector test and compute the thresholds, detection probabilities and
+        p-values of all realizations at once.
+
+        If an empirically calibrated threshold is given, the detection probability estimated at the calibrated
+        threshold is used and the p-values are not computed, since they assume the analytic distribution of the test
+        statistic.
+
+        Parameters
+        ----------
+        name : str
+            The name of the resource.
+        test_statistic_h1 : np.ndarray
+            The test statistics under the alternative hypothesis.
+        test_statistic_h0 : np.ndarray
+            The test statistics under the null hypothesis.
+        model_length_xtx : float or np.ndarray
+            The length of the model or the lengths of the models of all realizations.
+        dimensions : int
+            The number of dimensions.
+        probability_false_alarm : float
+            The probability of false alarm.
+        threshold_xsi : float, optional
+            The empirically calibrated threshold. If None, the analytic threshold is used.
+        threshold_xsi_interval : tuple[float, float], optional
+            The confidence interval of the empirically calibrated threshold.
+        detection_probability : float, optional
+            The detection probability at the empirically calibrated threshold.
+        dtype : np.dtype, optional
+            The data type of all columns except the p-values. Default is np.float32.
+
+        Returns
+        -------
+        TestResultBatch
+            The test results.
+        """
+        if threshold_xsi is not None:
+            return cls(
+                name=name,
+                test_statistic_h1=test_statistic_h1,
+                test_statistic_h0=test_statistic_h0,
+                threshold_xsi=threshold_xsi,
+                model_length_xtx=model_length_xtx,
+                dimensions=dimensions,
+                detection_probability=detection_probability,
+                probability_false_alarm=probability_false_alarm,
+                threshold_xsi_interval=threshold_xsi_interval,
+                dtype=dtype
+            )
+
+        threshold_xsi = chi2.ppf(1 - probability_false_alarm, df=dimensions)
+
+        return cls(
+            name=name,
+            test_statistic_h1=test_statistic_h1,
+            test_statistic_h0=test_statistic_h0,
+            threshold_xsi=threshold_xsi,
+            model_length_xtx=model_length_xtx,
+            detection_probability=ncx2.sf(threshold_xsi, df=dimensions, nc=model_length_xtx),
+            p_value=chi2.sf(test_statistic_h1, df=dimensions),
+            dimensions=dimensions,
+            probability_false_alarm=probability_false_alarm,
+            dtype=dtype
+        )
+
+    @classmethod
+    def from_neyman_pearson(
+            cls,
+            name: str,
+            test_statistic_h1: np.ndarray,
+            test_statistic_h0: np.ndarray,
+            model_length_xtx: Union[float, np.ndarray],
+            dimensions: int,
+            probability_false_alarm: float,
+            dtype: np.dtype = np.float32
+    ) -> 'TestResultBatch':
+        """Create the results of the Neyman-Pearson test and compute the thresholds, detection probabilities and
+        p-values of all realizations at once.
+
+        Parameters
+        ----------
+        name : str
+            The name of the resource.
+        test_statistic_h1 : np.ndarray
+            The test statistics under the alternative hypothesis.
+        test_statistic_h0 : np.ndarray
+            The test statistics under the null hypothesis.
+        model_length_xtx : float or np.ndarray
+            The length of the model or the lengths of the models of all realizations.
+        dimensions : int
+            The number of dimensions.
+        probability_false_alarm : float
+            The probability of false alarm.
+        dtype : np.dtype, optional
+            The data type of all columns except the p-values. Default is np.float32.
+
+        Returns
+        -------
+        TestResultBatch
+            The test results.
+        """
+        model_norm = np.sqrt(model_length_xtx)
+        threshold_xsi = model_norm * norm.ppf(1 - probability_false_alarm)
+
+        return cls(
+            name=name,
+            test_statistic_h1=test_statistic_h1,
+            test_statistic_h0=test_statistic_h0,
+            threshold_xsi=threshold_xsi,
+            model_length_xtx=model_length_xtx,
+            detection_probability=norm.sf((threshold_xsi - model_length_xtx) / model_norm),
+            p_value=norm.sf(np.asarray(test_statistic_h1) / model_norm),
+            dimensions=dimensions,
+            probability_false_alarm=probability_false_alarm,
+            dtype=dtype
+        )
+
+    @classmethod
+    def from_test_resources(
+            cls,
+            name: str,
+            test_resources: Iterable[TestResource],
+            dtype: np.dtype = np.float32
+    ) -> 'TestResultBatch':
+        """Collect the results of tests applied to single realizations.
+
+        Parameters
+        ----------
+        name : str
+            The name of the resource.
+        test_resources : Iterable[TestResource]
+            The test resources of the same test.
+        dtype : np.dtype, optional
+            The data type of all columns except the p-values. Default is np.float32.
+
+        Returns
+        -------
+        TestResultBatch
+            The test results.
+        """
+        test_resources = list(test_resources)
+        columns = {}
+
+        for column in _COLUMNS:
+            values = [getattr(r_test, column) for r_test in test_resources]
+            columns[column] = None if any(value is None for value in values) else np.asarray(values, dtype=np.float64)
+
+        return cls(
+            name=name,
+            dimensions=test_resources[0].dimensions if test_resources else None,
+            probability_false_alarm=test_resources[0].probability_false_alarm if test_resources else None,
+            threshold_xsi_interval=test_resources[0].threshold_xsi_interval if test_resources else None,
+            dtype=dtype,
+            **columns
+        )
+
+    @classmethod
+    def concatenate(cls, name: str, batches: Iterable['TestResultBatch']) -> 'TestResultBatch':
+        """Concatenate the results of several batches of the same test.
+
+        Parameters
+        ----------
+        name : str
+            The name of the resource.
+        batches : Iterable[TestResultBatch]
+            The batches.
+
+        Returns
+        -------
+        TestResultBatch
+            The concatenated test results.
+        """
+        batches = list(batches)
+        columns = {}
+
+        for column in _COLUMNS:
+            values = [getattr(batch, column) for batch in batches]
+            columns[column] = None if any(value is None for value in values) else np.concatenate(values)
+
+        return cls(
+            name=name,
+            dimensions=batches[0].dimensions,
+            probability_false_alarm=batches[0].probability_false_alarm,
+            threshold_xsi_interval=batches[0].threshold_xsi_interval,
+            dtype=batches[0].dtype,
+            **columns
+        )
+
+    def get_columns(self) -> dict[str, np.ndarray]:
+        """Get the columns of the test results that are set.
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            The columns by their names.
+        """
+        return {column: getattr(self, column) for column in _COLUMNS if getattr(self, column) is not None}
+
+    def get_detections(self) -> np.ndarray:
+        """Get whether the test statistic of each realization exceeds its threshold.
+
+        Returns
+        -------
+        np.ndarray
+            The boolean detection outcomes.
+        """
+        return self.test_statistic_h1 > self.threshold_xsi
+
+    def to_dataframe(self) -> 'pandas.DataFrame':
+        """Get the test results as a pandas DataFrame with one row per realization.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The test results.
+        """
+        try:
+            import pandas as pd
+        except ImportError as error:
+            raise ImportError('Exporting test results to a DataFrame requires pandas to be installed.') from error
+
+        dataframe = pd.DataFrame(self.get_columns())
+        dataframe.attrs.update(dimensions=self.dimensions, probability_false_alarm=self.probability_false_alarm)
+        return dataframe
+
+    def save_npz(self, path: Union[str, Path]):
+        """Save the test results to a compressed NPZ file.
+
+        Parameters
+        ----------
+        path : str or Path
+            The path of the file.
+        """
+        np.savez_compressed(
+            path,
+            dimensions=np.asarray(-1 if self.dimensions is None else self.dimensions),
+            probability_false_alarm=np.asarray(np.nan if self.probability_false_alarm is None
+                                               else self.probability_false_alarm),
+            threshold_xsi_interval=np.asarray(self.threshold_xsi_interval or (np.nan, np.nan)),
+            **self.get_columns()
+        )
+
+    @classmethod
+    def load_npz(cls, path: Union[str, Path], name: str = None) -> 'TestResultBatch':
+        """Load test results from an NPZ file.
+
+        Parameters
+        ----------
+        path : str or Path
+            The path of the file.
+        name : str, optional
+            The name of the resource. If None, the file name without suffix is used.
+
+        Returns
+        -------
+        TestResultBatch
+            The test results.
+        """
+        with np.load(path) as file:
+            dimensions = int(file['dimensions'])
+            probability_false_alarm = float(file['probability_false_alarm'])
+            threshold_xsi_interval = tuple(file['threshold_xsi_interval'].tolist())
+            columns = {column: file[column] for column in _COLUMNS if column in file}
+
+        return cls(
+            name=name or Path(path).stem,
+            dimensions=None if dimensions < 0 else dimensions,
+            probability_false_alarm=None if np.isnan(probability_false_alarm) else probability_false_alarm,
+            threshold_xsi_interval=None if np.isnan(threshold_xsi_interval).any() else threshold_xsi_interval,
+            dtype=columns['test_statistic_h1'].dtype if 'test_statistic_h1' in columns else np.float32,
+            **columns
+        )
+
+    def save_parquet(self, path: Union[str, Path]):
+        """Save the test results to a Parquet file, which requires pandas and pyarrow to be installed.
+
+        Parameters
+        ----------
+        path : str or Path
+            The path of the file.
+        """
+        self.to_dataframe().to_parquet(path, index=False)
@@ -1,19 +1,19 @@
 from dataclasses import dataclass
-from typing import Callable
 
-from torch import Tensor
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.util.operators import LinearOperator
 
 
 @dataclass
-class TransformationResource:
+class TransformationResource(BaseResource):
     """Class representation of the transformation resource.
 
     Parameters
     ----------
     name : str
         The name of the transformation.
-    transformation : Callable[[Tensor], Tensor]
-        The transformation function that takes a Tensor as input and returns a Tensor.
+    transformation : LinearOperator
+        The transformation as a linear operator, which can be called on a Tensor or array and returns the transformed
+        Tensor or array. Since it only holds tensors, the resource can be pickled, cached and checkpointed.
     """
-    name: str
-    transformation: Callable[[Tensor], Tensor]
+    transformation: LinearOperator = None
@@ -1,4 +1,8 @@
-from typing import Union
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import deepcopy
+from typing import Union, Callable, Iterable
 
 import numpy as np
 import torch
@@ -19,10 +23,13 @@ from lifesimmc.core.modules.processing.ml_parameter_estimation_module import MLS
 from lifesimmc.core.modules.processing.neyman_pearson_test_module import NeymanPearsonTestModule
 from lifesimmc.core.modules.processing.zca_whitening_module import ZCAWhiteningModule
 from lifesimmc.core.pipeline import Pipeline
+from lifesimmc.core.resources.template_resource import TemplateResource
 from lifesimmc.lib.instrument import InstrumentalNoise
 from lifesimmc.presets.single_epoch_observation.single_epoch_observation import SingleEpochObservation
+from lifesimmc.util.cache import LRUCache
 from lifesimmc.util.library import XArrayConfiguration
 from lifesimmc.util.spectrum import convert_spectral_units, convert_wavelength_units
+from lifesimmc.util.template_store import TemplateStore
 
 
 class SingleEpochObservationV1(SingleEpochObservation):
@@ -114,7 +121,32 @@ class SingleEpochObservationV1(SingleEpochObservation):
 
     host_star_declination : float or str or Quantity, optional
         Host star declination. Only required if no star is specified in the scene.
+
+    backend : str, optional
+        Execution backend used for the repetitions; one of 'serial', 'thread' or 'process'. With 'thread', the
+        analyses of the repetitions (SED extraction, detection significance, matched filter) run concurrently. With
+        'process', each repetition is simulated and analyzed in a separate worker process during ``run``. The seed of
+        repetition i is always ``seed + i``. Defaults to 'serial'.
+
+    num_workers : int, optional
+        Maximum number of worker threads or processes. If None, the default of the executor is used.
+
+    whitening_cache : LRUCache, optional
+        Cache for the whitening matrix. If given, the noise reference simulation used for the whitening is only run
+        once and shared between all repetitions (and all presets using the same cache and setup).
+
+    template_store : TemplateStore, optional
+        Persistent store for the templates. If given, the templates are only generated once for each instrument and
+        observation configuration and memory-mapped from the store in subsequent runs.
+
+    analyses : Iterable[str], optional
+        The analyses that are performed for the repetitions; any of 'sed', 'significance' and 'matched_filter'. With
+        the serial and thread backend, an analysis is performed when its results are requested. With the process
+        backend, all requested analyses are performed during ``run``. Requesting the results of another analysis raises
+        a RuntimeError. Defaults to all analyses.
     """
+    _BACKENDS = ('serial', 'thread', 'process')
+    _ANALYSES = ('sed', 'significance', 'matched_filter')
 
     def __init__(
             self,
@@ -148,8 +180,12 @@ class SingleEpochObservationV1(SingleEpochObservation):
             host_star_mass: Union[str, float, Quantity, None] = None,
             host_star_distance: Union[float, str, Quantity, None] = None,
             host_star_right_ascension: Union[str, float, Quantity, None] = None,
-            host_star_declination: Union[str, float, Quantity, None] = None
-
+            host_star_declination: Union[str, float, Quantity, None] = None,
+            backend: str = 'serial',
+            num_workers: int = None,
+            whitening_cache: LRUCache = None,
+            template_store: TemplateStore = None,
+            analyses: Iterable[str] = _ANALYSES
     ):
         """Initialize the single-epoch observation preset.
 
@@ -184,10 +220,27 @@ class SingleEpochObservationV1(SingleEpochObservation):
         self.host_star_distance = host_star_distance
         self.host_star_right_ascension = host_star_right_ascension
         self.host_star_declination = host_star_declination
+        self.backend = backend
+        self.num_workers = num_workers
+        self.whitening_cache = whitening_cache
+        self.template_store = template_store
+        self.analyses = tuple(analyses)
+
+        if self.backend not in self._BACKENDS:
+            raise ValueError(
+                f"Unknown backend {self.backend!r}. Available backends are: {', '.join(self._BACKENDS)}."
+            )
+
+        for analysis in self.analyses:
+            if analysis not in self._ANALYSES:
+                raise ValueError(
+                    f"Unknown analysis {analysis!r}. Available analyses are: {', '.join(self._ANALYSES)}."
+                )
 
         self._instrument = self._create_instrument()
         self._observation = self._create_observation()
         self._pipelines = None
+        self._results = None
 
     def _create_instrument(self) -> Instrument:
         """Create the instrument and set the perturbations.
@@ -264,28 +317,254 @@ class SingleEpochObservationV1(SingleEpochObservation):
             })
         )
 
-    def extract_sed(self, units: Union[str, Quantity] = 'ph/s/m3') -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-        seds, stds, covs = [], [], []
+    def __getstate__(self) -> dict:
+        """Return the state used to ship the preset to worker processes.
 
-        for pipeline in self._pipelines:
-            module = MLSEDEstimationModule(
-                n_setup_in='setup',
-                n_data_in='data_white',
-                n_template_in='temp_white',
-                n_transformation_in='zca',
-                n_planets_in='planets_init',
-                n_planets_out='planets_ml',
-            )
-            pipeline.add_module(module)
-            pipeline.run()
+        The instrument and observation reference lambdified functions that cannot be pickled and are recreated from
+        the preset parameters instead. The scene is shipped without its reference to a PHRINGE instance.
+        """
+        state = self.__dict__.copy()
+        state['_instrument'] = None
+        state['_observation'] = None
+        state['_pipelines'] = None
+        state['_results'] = None
+        state['scene'] = self._copy_scene()
+        return state
+
+    def __setstate__(self, state: dict):
+        """Restore the preset in a worker process."""
+        self.__dict__.update(state)
+        self._instrument = self._create_instrument()
+        self._observation = self._create_observation()
+
+    def _copy_scene(self) -> Scene:
+        """Copy the scene without its reference to a PHRINGE instance.
+
+        PHRINGE stores a reference to itself in the scene and its sources when the scene is set, so each repetition
+        uses its own copy of the scene to avoid that concurrently running pipelines see the PHRINGE instance of
+        another repetition.
+
+        Returns
+        -------
+        Scene
+            The copy of the scene.
+        """
+        return deepcopy(self.scene, {id(self.scene._phringe): None})
+
+    def _map(self, function: Callable, items: Iterable) -> list:
+        """Apply a function to all items using the serial or thread execution backend.
+
+        Parameters
+        ----------
+        function : Callable
+            The function to apply.
+        items : Iterable
+            The items to apply the function to.
+
+        Returns
+        -------
+        list
+            The results in the order of the items.
+        """
+        if self.backend == 'serial':
+            return [function(item) for item in items]
 
-            r_planets_ml = pipeline.get_resource('planets_ml')
-            sed = r_planets_ml.collection[0].sed
-            std = r_planets_ml.collection[0].std
-            cov_raw = r_planets_ml.collection[0].cov
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            return list(executor.map(function, items))
 
-            units = u.Unit(units) if isinstance(units, str) else units
+    def _get_templates(self) -> TemplateResource:
+        """Generate the templates that are shared between all repetitions.
+
+        Returns
+        -------
+        TemplateResource
+            The template resource.
+        """
+        pipeline = Pipeline(device=self.device, grid_size=self.grid_size)
+
+        module = SetupModule(
+            n_setup_out='setup',
+            n_planets_out='planets_init',
+            scene=self.scene,
+            instrument=self._instrument,
+            observation=self._observation
+        )
+        pipeline.add_module(module)
+
+        module = TemplateGenerationModule(
+            n_setup_in='setup',
+            n_template_out='temp',
+            fov=self.template_fov_rad,
+            store=self.template_store
+        )
+        pipeline.add_module(module)
+
+        pipeline.run()
+
+        return pipeline.get_resource('temp')
+
+    def _run_pipeline(self, index: int, r_template: TemplateResource) -> Pipeline:
+        """Simulate and whiten the data of a single repetition.
+
+        Parameters
+        ----------
+        index : int
+            The index of the repetition, which is added to the seed.
+        r_template : TemplateResource
+            The shared template resource.
+
+        Returns
+        -------
+        Pipeline
+            The pipeline of the repetition.
+        """
+        seed = None if self.seed is None else self.seed + index
+
+        # The raw data and templates are only needed for the whitening, so they are evicted from the pipeline of each
+        # repetition, while the resources used by the later analyses are pinned
+        pipeline = Pipeline(device=self.device, seed=seed, grid_size=self.grid_size, evict=True)
+        pipeline.pin('setup', 'planets_init', 'data_white', 'temp_white', 'zca')
+        pipeline.add_resource(r_template)
+
+        module = SetupModule(
+            n_setup_out='setup',
+            n_planets_out='planets_init',
+            scene=self._copy_scene(),
+            instrument=self._instrument,
+            observation=self._observation
+        )
+        pipeline.add_module(module)
+
+        module = DataGenerationModule(n_setup_in='setup', n_data_out='data')
+        pipeline.add_module(module)
+
+        module = ZCAWhiteningModule(
+            n_setup_in='setup',
+            n_data_in='data',
+            n_template_in='temp',
+            n_data_out='data_white',
+            n_template_out='temp_white',
+            n_transformation_out='zca',
+            diagonal_only=not self.whitening,
+            cache=self.whitening_cache
+        )
+        pipeline.add_module(module)
+
+        pipeline.run()
+
+        return pipeline
+
+    @staticmethod
+    def _extract_sed_from_pipeline(pipeline: Pipeline) -> tuple[np.ndarray, np.ndarray, Union[np.ndarray, None]]:
+        """Extract the SED of a single repetition in units of ph/s/m3.
+
+        Parameters
+        ----------
+        pipeline : Pipeline
+            The pipeline of the repetition.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray or None]
+            A tuple containing the SED, standard deviations, and covariance matrix including the position parameters.
+        """
+        module = MLSEDEstimationModule(
+            n_setup_in='setup',
+            n_data_in='data_white',
+            n_template_in='temp_white',
+            n_transformation_in='zca',
+            n_planets_in='planets_init',
+            n_planets_out='planets_ml',
+        )
+        pipeline.add_module(module)
+        pipeline.run()
 
+        r_planets_ml = pipeline.get_resource('planets_ml')
+
+        return r_planets_ml.collection[0].sed, r_planets_ml.collection[0].std, r_planets_ml.collection[0].cov
+
+    @staticmethod
+    def _get_detection_significance_from_pipeline(pipeline: Pipeline) -> float:
+        """Get the detection significance of a single repetition.
+
+        Parameters
+        ----------
+        pipeline : Pipeline
+            The pipeline of the repetition.
+
+        Returns
+        -------
+        float
+            The detection significance in units of sigma.
+        """
+        module = NeymanPearsonTestModule(
+            n_setup_in="setup",
+            n_data_in='data_white',
+            n_transformation_in='zca',
+            n_planets_true_in='planets_init',
+            # n_planets_est_in='planets_ml',
+            n_test_out='test_np',
+            n_image_out='imag_np',
+            pfa=2.87e-7,
+            pdet=0.9
+        )
+        pipeline.add_module(module)
+        pipeline.run()
+
+        return np.sqrt(pipeline.get_resource('test_np').model_length_xtx)
+
+    @staticmethod
+    def _get_matched_filter_from_pipeline(pipeline: Pipeline) -> np.ndarray:
+        """Get the matched filter map of a single repetition.
+
+        Parameters
+        ----------
+        pipeline : Pipeline
+            The pipeline of the repetition.
+
+        Returns
+        -------
+        np.ndarray
+            The matched filter map.
+        """
+        module = MatchedFilterModule(n_data_in='data_white', n_template_in='temp_white', n_image_out='imag_corr')
+        pipeline.add_module(module)
+        pipeline.run()
+
+        return pipeline.get_resource('imag_corr').get_image(as_numpy=True)
+
+    def _get_results(self, name: str, function: Callable) -> list:
+        """Get the per-repetition results of an analysis.
+
+        Parameters
+        ----------
+        name : str
+            The name of the analysis.
+        function : Callable
+            The function performing the analysis on the pipeline of a single repetition.
+
+        Returns
+        -------
+        list
+            The results of all repetitions.
+        """
+        if self._results is None and self._pipelines is None:
+            raise RuntimeError(f"{self.__class__.__name__} has not been run yet. Call run() first.")
+
+        if name not in self.analyses:
+            raise RuntimeError(f"The analysis {name!r} has not been requested. Add it to the analyses of the preset.")
+
+        if self._results is not None:
+            return [result[name] for result in self._results]
+
+        return self._map(function, self._pipelines)
+
+    def extract_sed(self, units: Union[str, Quantity] = 'ph/s/m3') -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        seds, stds, covs = [], [], []
+
+        units = u.Unit(units) if isinstance(units, str) else units
+
+        for sed, std, cov_raw in self._get_results('sed', self._extract_sed_from_pipeline):
             sed = convert_spectral_units(
                 sed,
                 self.get_wavelength_bin_centers(),
@@ -320,25 +599,7 @@ class SingleEpochObservationV1(SingleEpochObservation):
         return np.stack(seds), np.stack(stds), np.stack(covs)
 
     def get_detection_significance(self) -> np.ndarray:
-        significances = []
-
-        for pipeline in self._pipelines:
-            module = NeymanPearsonTestModule(
-                n_setup_in="setup",
-                n_data_in='data_white',
-                n_transformation_in='zca',
-                n_planets_true_in='planets_init',
-                # n_planets_est_in='planets_ml',
-                n_test_out='test_np',
-                n_image_out='imag_np',
-                pfa=2.87e-7,
-                pdet=0.9
-            )
-            pipeline.add_module(module)
-            pipeline.run()
-
-            xtx = pipeline.get_resource('test_np').model_length_xtx
-            significances.append(np.sqrt(xtx))
+        significances = self._get_results('significance', self._get_detection_significance_from_pipeline)
 
         return np.asarray(significances)
 
@@ -356,16 +617,9 @@ class SingleEpochObservationV1(SingleEpochObservation):
         return sed_converted
 
     def get_matched_filter(self) -> np.ndarray:
-        maps = []
-
-        for pipeline in self._pipelines:
-            module = MatchedFilterModule(n_data_in='data_white', n_template_in='temp_white', n_image_out='imag_corr')
-            pipeline.add_module(module)
-            pipeline.run()
+        maps = self._get_results('matched_filter', self._get_matched_filter_from_pipeline)
 
-            maps.append(pipeline.get_resource('imag_corr').get_image(as_numpy=True))
-
-            return np.stack(maps)
+        return np.stack(maps)
 
     def get_wavelength_bin_centers(self, units: Union[str, Quantity] = 'm') -> np.ndarray:
         wavelengths_m = self._instrument.wavelength_bin_centers.cpu().numpy()
@@ -377,39 +631,69 @@ class SingleEpochObservationV1(SingleEpochObservation):
         )
 
     def run(self):
-        self._pipelines = []
+        self._pipelines = None
+        self._results = None
 
-        for i in range(self.num_reps):
-            seed = None if self.seed is None else self.seed + i
+        # The templates do not depend on the noise realization and are only generated once
+        r_template = self._get_templates()
 
-            pipeline = Pipeline(device=self.device, seed=seed, grid_size=self.grid_size)
+        if self.backend == 'process':
+            context = mp.get_context('spawn')
+
+            with ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=context,
+                    initializer=_initialize_worker,
+                    initargs=(self, r_template, self.num_workers)
+            ) as executor:
+                self._results = list(executor.map(_run_repetition_in_worker, range(self.num_reps)))
+
+        else:
+            # The repetitions are simulated one after another, since the seeding of PHRINGE is global
+            self._pipelines = [self._run_pipeline(i, r_template) for i in range(self.num_reps)]
 
-            module = SetupModule(
-                n_setup_out='setup',
-                n_planets_out='planets_init',
-                scene=self.scene,
-                instrument=self._instrument,
-                observation=self._observation
-            )
-            pipeline.add_module(module)
-
-            module = DataGenerationModule(n_setup_in='setup', n_data_out='data')
-            pipeline.add_module(module)
-
-            module = TemplateGenerationModule(n_setup_in='setup', n_template_out='temp', fov=self.template_fov_rad)
-            pipeline.add_module(module)
-
-            module = ZCAWhiteningModule(
-                n_setup_in='setup',
-                n_data_in='data',
-                n_template_in='temp',
-                n_data_out='data_white',
-                n_template_out='temp_white',
-                n_transformation_out='zca',
-                diagonal_only=not self.whitening
-            )
-            pipeline.add_module(module)
 
-            pipeline.run()
+_worker_preset = None
+_worker_template = None
 
-            self._pipelines.append(pipeline)
+
+def _initialize_worker(preset: SingleEpochObservationV1, r_template: TemplateResource, num_workers: int):
+    """Store the shared state in a worker process of the process backend.
+
+    Parameters
+    ----------
+    preset : SingleEpochObservationV1
+        The preset.
+    r_template : TemplateResource
+        The shared template resource.
+    num_workers : int
+        The number of worker processes, used to avoid oversubscription of the CPU threads.
+    """
+    global _worker_preset, _worker_template
+    _worker_preset = preset
+    _worker_template = r_template
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // (num_workers or os.cpu_count() or 1)))
+
+
+def _run_repetition_in_worker(index: int) -> dict:
+    """Run a single repetition including the requested analyses in a worker process of the process backend.
+
+    Parameters
+    ----------
+    index : int
+        The index of the repetition.
+
+    Returns
+    -------
+    dict
+        The results of the analyses of the repetition.
+    """
+    pipeline = _worker_preset._run_pipeline(index, _worker_template)
+    functions = {
+        'sed': _worker_preset._extract_sed_from_pipeline,
+        'significance': _worker_preset._get_detection_significance_from_pipeline,
+        'matched_filter': _worker_preset._get_matched_filter_from_pipeline,
+    }
+
+    return {name: functions[name](pipeline) for name in _worker_preset.analyses}
@@ -0,0 +1,148 @@
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Union
+
+from lifesimmc.util import serialization
+
+
+class LRUCache:
+    """Class representation of a least-recently-used cache with optional persistence on disk.
+
+    Persisted entries are loaded without executing arbitrary code, i.e. they may only contain tensors, numpy arrays,
+    Python containers, linear operators and classes registered with ``torch.serialization.add_safe_globals``.
+    Entries containing other objects are only kept in memory. Persisted entries that cannot be loaded, e.g. because
+    they are corrupt, are treated as missing and removed.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of entries that are kept in memory.
+    cache_dir : str or Path, optional
+        The directory in which the entries are persisted. If None, the entries are only kept in memory.
+    """
+
+    def __init__(self, max_size: int = 16, cache_dir: Union[str, Path] = None):
+        """Constructor method.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum number of entries that are kept in memory.
+        cache_dir : str or Path, optional
+            The directory in which the entries are persisted. If None, the entries are only kept in memory.
+        """
+        self.max_size = max_size
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        path = self._get_path(key)
+
+        with self._lock:
+            return key in self._entries or (path is not None and path.exists())
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_path(self, key: str) -> Union[Path, None]:
+        """Get the path of the file in which an entry is persisted.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+
+        Returns
+        -------
+        Path or None
+            The path of the file or None if the cache is not persisted.
+        """
+        return self.cache_dir.joinpath(f'{key}.pt') if self.cache_dir is not None else None
+
+    def clear(self):
+        """Remove all entries from memory. Persisted entries are kept on disk."""
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get an entry from the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        default : Any
+            The value to return if the entry is not found.
+
+        Returns
+        -------
+        Any
+            The entry or the default value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            path = self._get_path(key)
+
+            if path is None or not path.exists():
+                return default
+
+            try:
+                value = serialization.load(path)
+            except (pickle.UnpicklingError, RuntimeError, EOFError, OSError):
+                path.unlink(missing_ok=True)
+                return default
+
+            self._add(key, value)
+            return value
+
+    def set(self, key: str, value: Any):
+        """Add an entry to the cache.
+
+        The entry is persisted atomically if it can be pickled and loaded safely (see ``serialization.save``) and
+        only kept in memory otherwise.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        value : Any
+            The entry.
+        """
+        with self._lock:
+            self._add(key, value)
+
+            path = self._get_path(key)
+
+            if path is not None:
+                serialization.save(value, path)
+
+    def _add(self, key: str, value: Any):
+        """Add an entry to memory and evict the least recently used entries if the cache is full.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        value : Any
+            The entry.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
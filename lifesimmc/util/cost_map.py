@@ -0,0 +1,177 @@
+from typing import Iterable
+
+import torch
+from torch import Tensor
+
+
+def get_cost_map(
+        data: Tensor,
+        template_data: Tensor,
+        covariance: Tensor = None,
+        positive: bool = True,
+        chunk_size: int = None,
+        template_gram: Tensor = None
+) -> tuple[Tensor, Tensor]:
+    """Calculate the optimum flux and the cost function of a point source for every template position.
+
+    The optimum flux and cost function are calculated according to equations B.2 to B.8 of Dannert et al. (2022). If
+    no covariance is given, the noise is assumed to be uncorrelated between the wavelength bins, so that matrix B is
+    diagonal and the optimum flux is obtained element-wise with O(n_wavelengths * n_grid^2) memory and work. Otherwise,
+    the linear systems of all grid positions are solved with batched Cholesky decompositions.
+
+    The sums over the differential outputs and time steps are calculated as contractions that never build a tensor of
+    the size of the templates. The sums over products of templates do not depend on the data and can be passed as
+    precomputed per-pixel Gram matrices, e.g. from ``TemplateResource.get_gram``, so that only the inner products with
+    the data are calculated. The cost maps of a stack of data realizations are calculated in the same contractions, so
+    that the templates are only read once for all realizations.
+
+    Parameters
+    ----------
+    data : Tensor
+        The data of shape (n_diff_out x n_wavelengths x n_time_steps) or a stack of data realizations of shape
+        (... x n_diff_out x n_wavelengths x n_time_steps).
+    template_data : Tensor
+        The template data of shape (n_diff_out x n_wavelengths x n_time_steps x n_grid x n_grid).
+    covariance : Tensor, optional
+        The noise covariance matrix between the wavelength bins of shape (n_wavelengths x n_wavelengths). If None, the
+        noise is assumed to be uncorrelated with the variance of the data in each wavelength bin of each realization.
+    positive : bool, optional
+        Whether to set negative optimum fluxes to zero. Default is True.
+    chunk_size : int, optional
+        Number of time steps that are processed at once. If None, all time steps are processed at once. With a
+        covariance, this bounds the size of the intermediate tensors of the Gram matrices.
+    template_gram : Tensor, optional
+        The precomputed per-pixel Gram matrices of the wavelengths of shape
+        (n_grid x n_grid x n_wavelengths x n_wavelengths). If None, they are calculated from the templates.
+
+    Returns
+    -------
+    tuple[Tensor, Tensor]
+        The optimum flux and the contribution of each wavelength bin to the cost function, both of shape
+        (... x n_wavelengths x n_grid x n_grid). Summing the cost function over the wavelength axis gives the cost map.
+    """
+    nk, nl, nt, n_rows, n_columns = template_data.shape
+    chunk_size = chunk_size or nt
+    batch_shape = data.shape[:-3]
+    data = data.reshape(-1, nk, nl, nt)
+
+    if covariance is None:
+        data_variance = torch.var(data.transpose(2, 3).reshape(len(data), -1, nl), axis=1)
+        weighted_data = data
+        vector_b = torch.zeros((nl, n_rows, n_columns), dtype=template_data.dtype, device=template_data.device)
+    else:
+        covariance_inv = torch.linalg.inv(covariance.to(data.dtype))
+        weighted_data = torch.einsum('jm, nkjt->nkmt', covariance_inv, data)
+        gram = torch.zeros((n_rows, n_columns, nl, nl), dtype=template_data.dtype, device=template_data.device)
+
+    # The realizations are stacked as rows of the matrix products, so that the templates are never broadcast or copied
+    weighted_data = weighted_data.permute(1, 2, 0, 3)
+    vector_c = torch.zeros(
+        (nl, len(data), n_rows * n_columns),
+        dtype=template_data.dtype,
+        device=template_data.device
+    )
+
+    for t in range(0, nt, chunk_size):
+        templates = template_data[:, :, t:t + chunk_size]
+
+        # Calculate the sums of equations B.2 and B.3 over the differential outputs and time steps
+        vector_c += torch.sum(weighted_data[..., t:t + chunk_size] @ templates.flatten(-2), axis=0)
+
+        if covariance is None:
+            if template_gram is None:
+                vector_b += torch.linalg.vector_norm(templates, dim=(0, 2)) ** 2
+        elif template_gram is None:
+            gram += torch.einsum('kjtab, kmtab->abjm', templates, templates)
+
+    vector_c = vector_c.transpose(0, 1).reshape(-1, nl, n_rows, n_columns)
+
+    if template_gram is not None:
+        template_gram = template_gram.to(template_data)
+        vector_b = torch.diagonal(template_gram, dim1=-2, dim2=-1).permute(2, 0, 1)
+        gram = template_gram
+
+    if covariance is None:
+        # Calculate vectors C and B according to equations B.2 and B.3, where B is the diagonal of matrix B
+        vector_c = vector_c / data_variance[..., None, None]
+        vector_b = torch.nan_to_num(vector_b / data_variance[..., None, None], 1)
+
+        # Calculate the optimum flux according to equation B.6
+        optimum_flux = vector_c / vector_b
+
+    else:
+        # Calculate matrix B according to equation B.3 and the optimum flux according to equation B.6
+        matrix_b = covariance_inv[None, None] * gram
+        cholesky = torch.linalg.cholesky(matrix_b)
+        optimum_flux = torch.cholesky_solve(vector_c.permute(0, 2, 3, 1)[..., None], cholesky)[..., 0]
+        optimum_flux = optimum_flux.permute(0, 3, 1, 2)
+
+    # Calculate the cost function according to equation B.8
+    if positive:
+        optimum_flux = torch.where(optimum_flux >= 0, optimum_flux, 0)
+
+    cost_function = optimum_flux * vector_c
+
+    output_shape = (*batch_shape, nl, n_rows, n_columns)
+
+    return optimum_flux.reshape(output_shape), cost_function.reshape(output_shape)
+
+
+def get_cost_map_from_tiles(
+        data: Tensor,
+        template_tiles: Iterable[Tensor],
+        covariance: Tensor = None,
+        positive: bool = True,
+        chunk_size: int = None,
+        template_gram: Tensor = None
+) -> tuple[Tensor, Tensor]:
+    """Calculate the optimum flux and the cost function from templates that are provided in tiles of grid rows.
+
+    Only a single tile of templates is held in memory at a time. See ``get_cost_map`` for details.
+
+    Parameters
+    ----------
+    data : Tensor
+        The data of shape (n_diff_out x n_wavelengths x n_time_steps) or a stack of data realizations of shape
+        (... x n_diff_out x n_wavelengths x n_time_steps).
+    template_tiles : Iterable[Tensor]
+        The template tiles of shape (n_diff_out x n_wavelengths x n_time_steps x n_rows x n_grid), e.g. from
+        ``TemplateResource.get_tiles``.
+    covariance : Tensor, optional
+        The noise covariance matrix between the wavelength bins of shape (n_wavelengths x n_wavelengths). If None, the
+        noise is assumed to be uncorrelated with the variance of the data in each wavelength bin.
+    positive : bool, optional
+        Whether to set negative optimum fluxes to zero. Default is True.
+    chunk_size : int, optional
+        Number of time steps that are processed at once. If None, all time steps are processed at once.
+    template_gram : Tensor, optional
+        The precomputed per-pixel Gram matrices of the wavelengths of all grid positions of shape
+        (n_grid x n_grid x n_wavelengths x n_wavelengths). If None, they are calculated from the templates.
+
+    Returns
+    -------
+    tuple[Tensor, Tensor]
+        The optimum flux and the contribution of each wavelength bin to the cost function, both of shape
+        (... x n_wavelengths x n_grid x n_grid).
+    """
+    results = []
+    start = 0
+
+    for template_tile in template_tiles:
+        stop = start + template_tile.shape[-2]
+        results.append(
+            get_cost_map(
+                data,
+                template_tile,
+                covariance=covariance,
+                positive=positive,
+                chunk_size=chunk_size,
+                template_gram=template_gram[start:stop] if template_gram is not None else None
+            )
+        )
+        start = stop
+
+    optimum_flux = torch.cat([result[0] for result in results], dim=-2)
+    cost_function = torch.cat([result[1] for result in results], dim=-2)
+
+    return optimum_flux, cost_function
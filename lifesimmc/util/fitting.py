@@ -0,0 +1,230 @@
+from typing import Callable, Union
+
+import torch
+from phringe.main import PHRINGE
+from torch import Tensor
+
+from lifesimmc.util.model import get_unit_model_counts_torch
+from lifesimmc.util.operators import LinearOperator
+
+
+def apply_transformation(transformation: Union[LinearOperator, Callable], data: Tensor) -> Tensor:
+    """Apply a transformation to a batch of data sets at once.
+
+    Linear operators are applied to the whole batch directly. Other transformations act on the differential output and
+    wavelength axes and are the same for every time step, so the leading axes of the batch are moved into the time axis
+    and the transformation is applied with a single call.
+
+    Parameters
+    ----------
+    transformation : LinearOperator or Callable
+        The transformation acting on data of shape (n_diff_out x n_wavelengths x n_time_steps). If None, the data is
+        returned unchanged.
+    data : Tensor
+        The data of shape (... x n_diff_out x n_wavelengths x n_time_steps).
+
+    Returns
+    -------
+    Tensor
+        The transformed data of the same shape as the input data.
+    """
+    if transformation is None:
+        return data
+
+    if isinstance(transformation, LinearOperator):
+        return transformation.apply_batch(data)
+
+    shape = data.shape
+    nk, nl, nt = shape[-3:]
+
+    data = data.reshape(-1, nk, nl, nt).permute(1, 2, 0, 3).reshape(nk, nl, -1)
+    data = transformation(data)
+
+    return data.reshape(nk, nl, -1, nt).permute(2, 0, 1, 3).reshape(shape)
+
+
+def fit_sed_variable_projection(
+        phringe: PHRINGE,
+        data: Tensor,
+        x_init: Tensor,
+        y_init: Tensor,
+        transformation: Callable = None,
+        max_iterations: int = 100,
+        tolerance: float = 1e-10,
+        batch_size: int = None
+) -> tuple[Tensor, Tensor, Tensor, Tensor, Tensor]:
+    """Fit the SED and position of a point source to one or several data sets with a Levenberg-Marquardt solver.
+
+    The counts are linear in the flux, so for a given position the optimum flux is the solution of a linear least
+    squares problem. The flux is therefore solved in closed form in every iteration and only the two position
+    parameters are optimized with the Levenberg-Marquardt algorithm (variable projection). The Jacobian of the
+    projected residual is calculated with Kaufman's approximation, with central differences of the unit model counts
+    for the position derivatives. All data sets of a batch are fitted simultaneously on the device of the PHRINGE
+    instance.
+
+    Parameters
+    ----------
+    phringe : PHRINGE
+        The PHRINGE instance of the setup.
+    data : Tensor
+        The (transformed) data of shape (n_data_sets x n_diff_out x n_wavelengths x n_time_steps).
+    x_init : Tensor
+        The initial x positions in radians of shape (n_data_sets).
+    y_init : Tensor
+        The initial y positions in radians of shape (n_data_sets).
+    transformation : Callable, optional
+        The transformation that has been applied to the data. It is applied to the model counts as well. If None, no
+        transformation is applied.
+    max_iterations : int, optional
+        The maximum number of Levenberg-Marquardt iterations. Default is 100.
+    tolerance : float, optional
+        The relative tolerance of the cost function used as convergence criterion. Default is 1e-10.
+    batch_size : int, optional
+        Number of data sets that are fitted at once. If None, all data sets are fitted at once. Smaller values reduce
+        the memory usage.
+
+    Returns
+    -------
+    tuple[Tensor, Tensor, Tensor, Tensor, Tensor]
+        The SEDs of shape (n_data_sets x n_wavelengths), their standard deviations of shape
+        (n_data_sets x n_wavelengths), the covariance matrices of the fluxes and positions of shape
+        (n_data_sets x n_wavelengths + 2 x n_wavelengths + 2) and the x and y positions of shape (n_data_sets).
+    """
+    batch_size = batch_size or len(data)
+    results = [
+        _fit_batch(
+            phringe,
+            data[i:i + batch_size],
+            x_init[i:i + batch_size],
+            y_init[i:i + batch_size],
+            transformation,
+            max_iterations,
+            tolerance
+        )
+        for i in range(0, len(data), batch_size)
+    ]
+
+    return tuple(torch.cat(result) for result in zip(*results))
+
+
+def _fit_batch(
+        phringe: PHRINGE,
+        data: Tensor,
+        x_init: Tensor,
+        y_init: Tensor,
+        transformation: Callable,
+        max_iterations: int,
+        tolerance: float
+) -> tuple[Tensor, Tensor, Tensor, Tensor, Tensor]:
+    """Fit a single batch of data sets. See ``fit_sed_variable_projection``."""
+    dtype = torch.float64
+    device = phringe._device
+    nb, nk, nl, nt = data.shape
+
+    # The positions are optimized in units of the maximum half field of view, which are also their bounds
+    hfov_max = phringe.get_field_of_view()[-1].item() / 2
+    step = 1e-5
+    shifts = step * torch.tensor([[1, 0], [-1, 0], [0, 1], [0, -1]], dtype=dtype, device=device)
+    eye = torch.eye(nl, dtype=dtype, device=device)
+
+    data = data.to(device=device, dtype=dtype).reshape(nb, -1)
+    positions = torch.stack([
+        torch.as_tensor(x_init, dtype=dtype, device=device),
+        torch.as_tensor(y_init, dtype=dtype, device=device)
+    ], dim=1) / hfov_max
+
+    def get_unit_counts(positions):
+        return get_unit_model_counts_torch(
+            phringe,
+            positions[:, 0] * hfov_max,
+            positions[:, 1] * hfov_max,
+            dtype=dtype
+        )
+
+    def evaluate(positions):
+        """Return the residuals, model matrices, Cholesky factors of their Gram matrices and optimum fluxes."""
+        unit_counts = get_unit_counts(positions)
+
+        # Column l of the model matrix contains the transformed counts of a unit flux in wavelength bin l
+        matrices = apply_transformation(
+            transformation,
+            unit_counts[:, None] * eye[None, :, None, :, None]
+        ).reshape(nb, nl, -1)
+
+        # Wavelength bins outside of the field of view have no response, so a small ridge keeps the Gram matrix
+        # positive definite
+        gram = matrices @ matrices.mT
+        ridge = 1e-12 * gram.diagonal(dim1=1, dim2=2).amax(dim=1).clamp(min=torch.finfo(dtype).tiny)
+        cholesky = torch.linalg.cholesky(gram + ridge[:, None, None] * eye)
+
+        fluxes = torch.cholesky_solve((matrices @ data[..., None]), cholesky)[..., 0]
+        residuals = (fluxes[:, None, :] @ matrices)[:, 0] - data
+
+        return residuals, matrices, cholesky, fluxes
+
+    def get_position_derivatives(positions, fluxes):
+        """Return the derivatives of the transformed model counts with respect to the scaled positions."""
+        unit_counts = get_unit_counts((positions[:, None, :] + shifts[None]).reshape(-1, 2))
+        unit_counts = unit_counts.reshape(nb, 4, nk, nl, nt)
+
+        derivatives = torch.stack([
+            unit_counts[:, 0] - unit_counts[:, 1],
+            unit_counts[:, 2] - unit_counts[:, 3]
+        ], dim=1) / (2 * step)
+
+        return apply_transformation(
+            transformation,
+            derivatives * fluxes[:, None, None, :, None]
+        ).reshape(nb, 2, -1)
+
+    residuals, matrices, cholesky, fluxes = evaluate(positions)
+    cost = torch.sum(residuals ** 2, dim=1)
+    damping = torch.full((nb,), 1e-3, dtype=dtype, device=device)
+    active = torch.ones(nb, dtype=torch.bool, device=device)
+
+    for _ in range(max_iterations):
+        # Kaufman's approximation of the Jacobian of the projected residuals
+        derivatives = get_position_derivatives(positions, fluxes)
+        coefficients = torch.cholesky_solve(matrices @ derivatives.mT, cholesky)
+        jacobian = derivatives - coefficients.mT @ matrices
+
+        gradient = jacobian @ residuals[..., None]
+        hessian = jacobian @ jacobian.mT
+        hessian_diagonal = torch.diag_embed(hessian.diagonal(dim1=1, dim2=2))
+        delta = -torch.linalg.solve(hessian + damping[:, None, None] * hessian_diagonal, gradient)[..., 0]
+
+        positions_trial = torch.clamp(positions + delta, -1, 1)
+        residuals_trial, matrices_trial, cholesky_trial, fluxes_trial = evaluate(positions_trial)
+        cost_trial = torch.sum(residuals_trial ** 2, dim=1)
+
+        accept = active & (cost_trial < cost)
+        converged = (accept & (cost - cost_trial <= tolerance * cost)) \
+                    | (torch.linalg.norm(positions_trial - positions, dim=1) <= tolerance) \
+                    | (damping > 1e10)
+
+        positions = torch.where(accept[:, None], positions_trial, positions)
+        residuals = torch.where(accept[:, None], residuals_trial, residuals)
+        matrices = torch.where(accept[:, None, None], matrices_trial, matrices)
+        cholesky = torch.where(accept[:, None, None], cholesky_trial, cholesky)
+        fluxes = torch.where(accept[:, None], fluxes_trial, fluxes)
+        cost = torch.where(accept, cost_trial, cost)
+        damping = torch.where(accept, damping / 10, damping * 10)
+
+        active = active & ~converged
+
+        if not active.any():
+            break
+
+    # Calculate the covariance of all parameters from the full Jacobian at the optimum and scale it with the reduced
+    # chi-square
+    derivatives = get_position_derivatives(positions, fluxes) / hfov_max
+    jacobian = torch.cat([matrices, derivatives], dim=1)
+    scales = torch.linalg.norm(jacobian, dim=2).clamp(min=torch.finfo(dtype).tiny)
+    jacobian = jacobian / scales[..., None]
+
+    reduced_chi_square = cost / (data.shape[1] - nl - 2)
+    cov = torch.linalg.pinv(jacobian @ jacobian.mT, hermitian=True) / (scales[:, :, None] * scales[:, None, :])
+    cov = cov * reduced_chi_square[:, None, None]
+    stds = torch.sqrt(torch.diagonal(cov, dim1=1, dim2=2)[:, :nl])
+
+    return fluxes, stds, cov, positions[:, 0] * hfov_max, positions[:, 1] * hfov_max
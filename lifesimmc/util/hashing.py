@@ -0,0 +1,107 @@
+import hashlib
+from enum import Enum
+
+import numpy as np
+import torch
+from astropy.units import Quantity, UnitBase
+from pydantic import BaseModel
+from sympy import Basic, MatrixBase
+
+
+def _update_hash(hash_object, obj, visited: dict = None):
+    """Recursively feed the content of an object into a hash object.
+
+    Containers and objects that have already been visited, e.g. through a reference of a PHRINGE entity to its parent,
+    are hashed as a back-reference to their first visit, so that cyclic object graphs can be hashed.
+
+    Parameters
+    ----------
+    hash_object : hashlib._Hash
+        The hash object to update.
+    obj : object
+        The object to hash.
+    visited : dict, optional
+        The visited objects by their id, with the index of their visit and the object itself, which is kept alive so
+        that its id is not reused.
+    """
+    visited = {} if visited is None else visited
+    hash_object.update(type(obj).__qualname__.encode())
+
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, Enum, np.generic)):
+        hash_object.update(repr(obj).encode())
+    elif isinstance(obj, bytes):
+        hash_object.update(obj)
+    elif isinstance(obj, torch.Tensor):
+        hash_object.update(f'{obj.dtype}{tuple(obj.shape)}'.encode())
+        hash_object.update(obj.detach().cpu().contiguous().numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        hash_object.update(f'{obj.dtype}{obj.shape}'.encode())
+        hash_object.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (Quantity, UnitBase)):
+        hash_object.update(repr(obj).encode())
+    elif isinstance(obj, (Basic, MatrixBase)):
+        hash_object.update(str(obj).encode())
+    elif isinstance(obj, (list, dict, BaseModel)) or (hasattr(obj, '__dict__') and not isinstance(obj, tuple)):
+        if id(obj) in visited:
+            hash_object.update(f'<reference {visited[id(obj)][0]}>'.encode())
+            return
+
+        visited[id(obj)] = (len(visited), obj)
+        _update_object_hash(hash_object, obj, visited)
+    elif isinstance(obj, tuple):
+        for item in obj:
+            _update_hash(hash_object, item, visited)
+    else:
+        hash_object.update(repr(obj).encode())
+
+
+def _update_object_hash(hash_object, obj, visited: dict):
+    """Feed the content of a list, dictionary, pydantic model or object with attributes into a hash object.
+
+    Parameters
+    ----------
+    hash_object : hashlib._Hash
+        The hash object to update.
+    obj : object
+        The object to hash.
+    visited : dict
+        The visited objects by their id.
+    """
+    if isinstance(obj, list):
+        for item in obj:
+            _update_hash(hash_object, item, visited)
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            _update_hash(hash_object, key, visited)
+            _update_hash(hash_object, obj[key], visited)
+    elif isinstance(obj, BaseModel):
+        _update_hash(hash_object, {name: getattr(obj, name) for name in type(obj).model_fields}, visited)
+    else:
+        _update_hash(hash_object, {
+            key: value for key, value in vars(obj).items() if not key.startswith('_') and not callable(value)
+        }, visited)
+
+
+def get_fingerprint(*objects) -> str:
+    """Return a fingerprint of the content of one or several objects.
+
+    The fingerprint only depends on the values of the objects, e.g. the fields of PHRINGE entities or the content of
+    tensors, and not on their identity. It can therefore be used as a key to cache results that are derived from them.
+
+    Parameters
+    ----------
+    *objects
+        The objects to fingerprint.
+
+    Returns
+    -------
+    str
+        The hexadecimal fingerprint.
+    """
+    hash_object = hashlib.sha256()
+    visited = {}
+
+    for obj in objects:
+        _update_hash(hash_object, obj, visited)
+
+    return hash_object.hexdigest()
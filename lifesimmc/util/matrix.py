@@ -1,4 +1,6 @@
 import numpy as np
+import torch
+from torch import Tensor
 
 
 def cov_inv_sqrt(cov_matrix):
@@ -12,3 +14,74 @@ def cov_inv_sqrt(cov_matrix):
     cov_inv_sqrt_matrix = eigvecs @ inv_sqrt_eigvals @ eigvecs.T
 
     return cov_inv_sqrt_matrix
+
+
+def apply_matrices_to_templates(matrices: Tensor, templates: Tensor, chunk_size: int = None) -> Tensor:
+    """Apply one (n_wavelengths x n_wavelengths) matrix per differential output to a template cube.
+
+    This is equivalent to computing ``matrices[k] @ templates[k, :, :, i, j]`` for every differential output k and
+    every grid pixel (i, j), but uses a single batched contraction instead of one matrix multiplication per pixel.
+
+    Parameters
+    ----------
+    matrices : Tensor
+        The matrices of shape (n_diff_out x n_wavelengths x n_wavelengths).
+    templates : Tensor
+        The templates of shape (n_diff_out x n_wavelengths x n_time_steps x n_grid x n_grid).
+    chunk_size : int, optional
+        Number of grid rows that are processed at once. If None, the whole grid is processed at once. Smaller values
+        reduce the size of the intermediate tensors.
+
+    Returns
+    -------
+    Tensor
+        The transformed templates of shape (n_diff_out x n_wavelengths x n_time_steps x n_grid x n_grid).
+    """
+    matrices = matrices.to(templates.dtype)
+
+    if chunk_size is None:
+        return torch.einsum('kab, kbtij->katij', matrices, templates)
+
+    templates_out = torch.empty_like(templates)
+
+    for i in range(0, templates.shape[-2], chunk_size):
+        templates_out[..., i:i + chunk_size, :] = torch.einsum(
+            'kab, kbtij->katij',
+            matrices,
+            templates[..., i:i + chunk_size, :]
+        )
+
+    return templates_out
+
+
+def get_ledoit_wolf_covariance(data: Tensor) -> Tensor:
+    """Estimate a covariance matrix with the Ledoit-Wolf shrinkage estimator.
+
+    The sample correlation matrix is shrunk towards the identity with the shrinkage intensity that minimizes the
+    expected squared error, which keeps the estimate well-conditioned if there are few samples per variable. Shrinking
+    the correlations instead of the covariances, i.e. towards the diagonal of the sample covariance, keeps variables
+    with very different variances, e.g. spectral channels, on their own scale.
+
+    Parameters
+    ----------
+    data : Tensor
+        The samples of shape (n_variables x n_samples).
+
+    Returns
+    -------
+    Tensor
+        The covariance matrix of shape (n_variables x n_variables).
+    """
+    n_variables, n_samples = data.shape
+    data = data - data.mean(dim=-1, keepdim=True)
+    std = torch.sqrt((data ** 2).mean(dim=-1))
+    data = data / std[:, None]
+    eye = torch.eye(n_variables, dtype=data.dtype, device=data.device)
+    corr = data @ data.T / n_samples
+
+    # Squared distance of the sample correlation matrix to the identity and its estimated variance
+    delta = ((corr - eye) ** 2).sum() / n_variables
+    beta = (((data ** 2).sum(dim=0) ** 2).sum() / n_samples - (corr ** 2).sum()) / (n_variables * n_samples)
+    shrinkage = torch.clamp(beta / delta, max=1) if delta > 0 else 1
+
+    return ((1 - shrinkage) * corr + shrinkage * eye) * std[:, None] * std[None, :]
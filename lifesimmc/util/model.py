@@ -0,0 +1,128 @@
+from typing import Union
+
+import numpy as np
+import torch
+from phringe.main import PHRINGE
+from torch import Tensor
+
+
+def get_unit_model_counts(
+        phringe: PHRINGE,
+        x_positions: Union[float, np.ndarray],
+        y_positions: Union[float, np.ndarray]
+) -> np.ndarray:
+    """Return the kernel model counts of a point source with a flux of 1 ph/s/m3 in every wavelength bin.
+
+    The model counts are evaluated for several sky positions in a single call of the lambdified instrument response.
+    Since the counts are linear in the flux, the model counts for a spectral energy distribution ``sed`` are given by
+    ``unit_counts * sed[None, :, None]``, which is equivalent to ``phringe.get_model_counts(sed, ..., kernels=True)``.
+
+    Parameters
+    ----------
+    phringe : PHRINGE
+        The PHRINGE instance of the setup.
+    x_positions : float or np.ndarray
+        The x sky positions in radians.
+    y_positions : float or np.ndarray
+        The y sky positions in radians.
+
+    Returns
+    -------
+    np.ndarray
+        The unit model counts of shape (n_positions x n_diff_out x n_wavelengths x n_time_steps).
+    """
+    x_positions = np.atleast_1d(np.asarray(x_positions, dtype=float))
+    y_positions = np.atleast_1d(np.asarray(y_positions, dtype=float))
+
+    times = phringe.get_time_steps().cpu().numpy()
+    wavelength_bin_centers = phringe.get_wavelength_bin_centers().cpu().numpy()
+    wavelength_bin_widths = phringe.get_wavelength_bin_widths().cpu().numpy()
+    n_inputs = phringe._instrument.number_of_inputs
+    shape = (len(wavelength_bin_centers), len(times), len(x_positions), 1)
+
+    response = np.stack([np.broadcast_to(response_func(
+        times[None, :, None, None],
+        wavelength_bin_centers[:, None, None, None],
+        x_positions[None, None, :, None],
+        y_positions[None, None, :, None],
+        phringe._observation.modulation_period,
+        phringe.get_nulling_baseline(),
+        *[0 for _ in range(3 * n_inputs)]
+    ), shape) for response_func in phringe._instrument._response_kernels_numpy])
+
+    # Cancel the response of positions outside of the field of view of a wavelength bin
+    fovs = phringe.get_field_of_view().cpu().numpy()
+    factors = (
+            (np.abs(x_positions)[:, None] <= fovs[None, :] / 2)
+            & (np.abs(y_positions)[:, None] <= fovs[None, :] / 2)
+    )
+
+    return (
+            response[..., 0].transpose(3, 0, 1, 2)
+            * phringe._observation.detector_integration_time
+            * wavelength_bin_widths[None, None, :, None]
+            * factors[:, None, :, None]
+    )
+
+
+def get_unit_model_counts_torch(
+        phringe: PHRINGE,
+        x_positions: Tensor,
+        y_positions: Tensor,
+        dtype: torch.dtype = torch.float64
+) -> Tensor:
+    """Return the kernel model counts of a point source with a flux of 1 ph/s/m3 in every wavelength bin as a tensor.
+
+    This is the torch equivalent of ``get_unit_model_counts``; it is evaluated on the device of the PHRINGE instance and
+    is differentiable with respect to the positions.
+
+    Parameters
+    ----------
+    phringe : PHRINGE
+        The PHRINGE instance of the setup.
+    x_positions : Tensor
+        The x sky positions in radians of shape (n_positions).
+    y_positions : Tensor
+        The y sky positions in radians of shape (n_positions).
+    dtype : torch.dtype
+        The data type used for the calculation.
+
+    Returns
+    -------
+    Tensor
+        The unit model counts of shape (n_positions x n_diff_out x n_wavelengths x n_time_steps).
+    """
+    device = phringe._device
+    x_positions = torch.atleast_1d(torch.as_tensor(x_positions, dtype=dtype, device=device))
+    y_positions = torch.atleast_1d(torch.as_tensor(y_positions, dtype=dtype, device=device))
+
+    times = phringe.get_time_steps().to(dtype)
+    wavelength_bin_centers = phringe.get_wavelength_bin_centers().to(dtype)
+    wavelength_bin_widths = phringe.get_wavelength_bin_widths().to(dtype)
+    zero = torch.zeros((), dtype=dtype, device=device)
+    n_inputs = phringe._instrument.number_of_inputs
+    shape = (len(wavelength_bin_centers), len(times), len(x_positions), 1)
+
+    response = torch.stack([torch.broadcast_to(response_func(
+        times[None, :, None, None],
+        wavelength_bin_centers[:, None, None, None],
+        x_positions[None, None, :, None],
+        y_positions[None, None, :, None],
+        phringe._observation.modulation_period,
+        phringe.get_nulling_baseline(),
+        *[zero for _ in range(3 * n_inputs)]
+    ), shape) for response_func in phringe._instrument._response_kernels_torch])
+
+    # Cancel the response of positions outside of the field of view of a wavelength bin
+    fovs = phringe.get_field_of_view().to(dtype)
+    factors = (
+            (torch.abs(x_positions)[:, None] <= fovs[None, :] / 2)
+            & (torch.abs(y_positions)[:, None] <= fovs[None, :] / 2)
+    )
+
+    return (
+            response[..., 0].permute(3, 0, 1, 2)
+            * phringe._observation.detector_integration_time
+            * wavelength_bin_widths[None, None, :, None]
+            * factors[:, None, :, None]
+    )
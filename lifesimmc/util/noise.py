@@ -0,0 +1,60 @@
+from copy import deepcopy
+
+from phringe.main import PHRINGE
+from torch import Tensor
+
+from lifesimmc.core.modules.base_module import BaseModule
+
+
+def get_noise_reference_counts(
+        module: BaseModule,
+        phringe: PHRINGE,
+        extra_memory: int = 20,
+        seed: int = None
+) -> Tensor:
+    """Simulate a noise-only reference data set of a setup, i.e. the same observation with all planets removed.
+
+    Parameters
+    ----------
+    module : BaseModule
+        The module requesting the reference data set; its seed, GPU index, grid size, time step size and device are
+        used for the simulation.
+    phringe : PHRINGE
+        The PHRINGE instance of the setup.
+    extra_memory : int
+        Extra memory factor used for the simulation.
+    seed : int, optional
+        The seed of the simulation. If None, the seed of the module is used.
+
+    Returns
+    -------
+    Tensor
+        The noise reference counts of shape (n_diff_out x n_wavelengths x n_time_steps).
+    """
+    phringe_ref = PHRINGE(
+        seed=module.seed if seed is None else seed,
+        gpu_index=module.gpu_index,
+        grid_size=module.grid_size,
+        time_step_size=module.time_step_size,
+        device=module.device,
+        extra_memory=extra_memory
+    )
+
+    # Create a copy of the instrument
+    instrument_new = deepcopy(phringe._instrument)
+    phringe_ref.set(instrument_new)
+
+    # Set the observation
+    observation_new = deepcopy(phringe._observation)
+    phringe_ref.set(observation_new)
+
+    # Remove all planets from the scene to calculate covariance only on noise
+    scene_new = deepcopy(phringe._scene)
+
+    for planet in phringe._scene.planets:
+        scene_new.remove_source(planet.name)
+
+    phringe_ref.set(scene_new)
+
+    # Get the noise reference counts
+    return phringe_ref.get_counts(kernels=True)
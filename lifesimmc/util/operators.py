@@ -0,0 +1,324 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterable, Union
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from lifesimmc.util.matrix import apply_matrices_to_templates
+
+
+class LinearOperator(ABC):
+    """Class representation of a linear transformation of the data, e.g. a whitening transformation.
+
+    The transformation acts on the differential output and wavelength axes of data of shape
+    (n_diff_out x n_wavelengths x n_time_steps) and is the same for all time steps. Operators only hold tensors, so they
+    can be pickled, e.g. to ship them to worker processes or to cache them on disk. Calling an operator is equivalent to
+    ``apply``.
+    """
+
+    def __call__(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        return self.apply(data)
+
+    def apply(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        """Apply the transformation to a data set.
+
+        Parameters
+        ----------
+        data : Tensor or np.ndarray
+            The data of shape (n_diff_out x n_wavelengths x n_time_steps).
+
+        Returns
+        -------
+        Tensor or np.ndarray
+            The transformed data of the same shape and type as the input data.
+        """
+        return self.apply_batch(data)
+
+    @abstractmethod
+    def apply_batch(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        """Apply the transformation to a batch of data sets at once.
+
+        Parameters
+        ----------
+        data : Tensor or np.ndarray
+            The data of shape (... x n_diff_out x n_wavelengths x n_time_steps).
+
+        Returns
+        -------
+        Tensor or np.ndarray
+            The transformed data of the same shape and type as the input data.
+        """
+        pass
+
+    @abstractmethod
+    def apply_to_templates(self, templates: Tensor) -> Tensor:
+        """Apply the transformation to the templates of all grid positions with a single contraction.
+
+        Parameters
+        ----------
+        templates : Tensor
+            The templates of shape (n_diff_out x n_wavelengths x n_time_steps x n_rows x n_grid).
+
+        Returns
+        -------
+        Tensor
+            The transformed templates of the same shape.
+        """
+        pass
+
+    def compose(self, other: 'LinearOperator') -> 'LinearOperator':
+        """Compose the transformation with another transformation that is applied after it.
+
+        Parameters
+        ----------
+        other : LinearOperator
+            The transformation that is applied after this transformation.
+
+        Returns
+        -------
+        LinearOperator
+            The transformation that is equivalent to applying this transformation and then the other one.
+        """
+        if isinstance(other, IdentityOperator):
+            return self
+
+        matrix = self.get_matrix()
+
+        return DenseOperator(other.get_matrix().to(matrix) @ matrix)
+
+    def get_diagonal(self) -> Tensor:
+        """Get the diagonal of the matrix of the transformation.
+
+        Returns
+        -------
+        Tensor
+            The diagonal of shape (n_diff_out * n_wavelengths).
+        """
+        return torch.diagonal(self.get_matrix())
+
+    @abstractmethod
+    def get_matrix(self) -> Tensor:
+        """Get the dense matrix of the transformation acting on the flattened differential output and wavelength axes.
+
+        Returns
+        -------
+        Tensor
+            The matrix of shape (n_diff_out * n_wavelengths x n_diff_out * n_wavelengths).
+        """
+        pass
+
+    @abstractmethod
+    def to(self, device: Union[str, torch.device] = None, dtype: torch.dtype = None) -> 'LinearOperator':
+        """Move the operator to a device and cast it to a data type.
+
+        Parameters
+        ----------
+        device : str or torch.device, optional
+            The device.
+        dtype : torch.dtype, optional
+            The data type.
+
+        Returns
+        -------
+        LinearOperator
+            The moved operator.
+        """
+        pass
+
+
+def _get_matrix_like(matrix: Tensor, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+    """Get a matrix on the device and of the type of the data it is applied to.
+
+    Parameters
+    ----------
+    matrix : Tensor
+        The matrix.
+    data : Tensor or np.ndarray
+        The data.
+
+    Returns
+    -------
+    Tensor or np.ndarray
+        The matrix as a tensor on the device of the data or as an array if the data is an array.
+    """
+    if isinstance(data, np.ndarray):
+        return matrix.cpu().numpy().astype(data.dtype, copy=False)
+
+    return matrix.to(device=data.device, dtype=data.dtype)
+
+
+@dataclass
+class IdentityOperator(LinearOperator):
+    """Class representation of the identity transformation."""
+
+    def apply_batch(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        return data
+
+    def apply_to_templates(self, templates: Tensor) -> Tensor:
+        return templates
+
+    def compose(self, other: LinearOperator) -> LinearOperator:
+        return other
+
+    def get_matrix(self) -> Tensor:
+        raise ValueError('The identity acts on data of any size and has no matrix.')
+
+    def to(self, device: Union[str, torch.device] = None, dtype: torch.dtype = None) -> 'IdentityOperator':
+        return self
+
+
+@dataclass
+class DenseOperator(LinearOperator):
+    """Class representation of a transformation mixing all differential outputs and wavelengths, e.g. ZCA whitening.
+
+    Parameters
+    ----------
+    matrix : Tensor
+        The matrix of shape (n_diff_out * n_wavelengths x n_diff_out * n_wavelengths) acting on the flattened
+        differential output and wavelength axes.
+    """
+    matrix: Tensor
+
+    def apply_batch(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        *shape, nk, nl, nt = data.shape
+        matrix = _get_matrix_like(self.matrix, data)
+
+        return (matrix @ data.reshape(*shape, nk * nl, nt)).reshape(*shape, nk, nl, nt)
+
+    def apply_to_templates(self, templates: Tensor) -> Tensor:
+        nk, nl, nt, n_rows, n_columns = templates.shape
+        matrix = _get_matrix_like(self.matrix, templates)
+        templates = torch.einsum('ab, btij->atij', matrix, templates.reshape(nk * nl, nt, n_rows, n_columns))
+
+        return templates.reshape(nk, nl, nt, n_rows, n_columns)
+
+    def get_matrix(self) -> Tensor:
+        return self.matrix
+
+    def to(self, device: Union[str, torch.device] = None, dtype: torch.dtype = None) -> 'DenseOperator':
+        return DenseOperator(self.matrix.to(device=device, dtype=dtype))
+
+
+@dataclass
+class BlockDiagonalOperator(LinearOperator):
+    """Class representation of a transformation that mixes the wavelengths of each differential output separately, e.g.
+    the noise variance normalization.
+
+    Parameters
+    ----------
+    blocks : Tensor
+        The matrices of the differential outputs of shape (n_diff_out x n_wavelengths x n_wavelengths).
+    """
+    blocks: Tensor
+
+    def apply_batch(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        return _get_matrix_like(self.blocks, data) @ data
+
+    def apply_to_templates(self, templates: Tensor) -> Tensor:
+        return apply_matrices_to_templates(_get_matrix_like(self.blocks, templates), templates)
+
+    def compose(self, other: LinearOperator) -> LinearOperator:
+        if isinstance(other, BlockDiagonalOperator):
+            return BlockDiagonalOperator(other.blocks @ self.blocks.to(other.blocks))
+
+        return super().compose(other)
+
+    def get_matrix(self) -> Tensor:
+        return torch.block_diag(*self.blocks)
+
+    def to(self, device: Union[str, torch.device] = None, dtype: torch.dtype = None) -> 'BlockDiagonalOperator':
+        return BlockDiagonalOperator(self.blocks.to(device=device, dtype=dtype))
+
+
+@dataclass
+class LowRankUpdateOperator(LinearOperator):
+    """Class representation of a diagonal scaling followed by a low-rank update of the identity, i.e. the matrix
+    (I + U @ diag(c) @ U.T) @ diag(d), e.g. the whitening transformation of a low-rank plus diagonal covariance.
+
+    Applying the transformation scales linearly with the number of differential outputs and wavelengths, since the
+    dense matrix is never formed.
+
+    Parameters
+    ----------
+    diagonal : Tensor
+        The diagonal d of shape (n_diff_out * n_wavelengths).
+    factor : Tensor
+        The orthonormal factor U of shape (n_diff_out * n_wavelengths x rank).
+    coefficients : Tensor
+        The coefficients c of the low-rank update of shape (rank).
+    """
+    diagonal: Tensor
+    factor: Tensor
+    coefficients: Tensor
+
+    def _apply_to_columns(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        """Apply the transformation to the columns of flattened data.
+
+        Parameters
+        ----------
+        data : Tensor or np.ndarray
+            The data of shape (... x n_diff_out * n_wavelengths x n_columns).
+
+        Returns
+        -------
+        Tensor or np.ndarray
+            The transformed data of the same shape.
+        """
+        diagonal = _get_matrix_like(self.diagonal, data)[:, None]
+        factor = _get_matrix_like(self.factor, data)
+        coefficients = _get_matrix_like(self.coefficients, data)[:, None]
+
+        data = diagonal * data
+        return data + factor @ (coefficients * (factor.T @ data))
+
+    def apply_batch(self, data: Union[Tensor, np.ndarray]) -> Union[Tensor, np.ndarray]:
+        *shape, nk, nl, nt = data.shape
+        data = self._apply_to_columns(data.reshape(*shape, nk * nl, nt))
+
+        return data.reshape(*shape, nk, nl, nt)
+
+    def apply_to_templates(self, templates: Tensor) -> Tensor:
+        nk, nl, nt, n_rows, n_columns = templates.shape
+        templates = self._apply_to_columns(templates.reshape(nk * nl, nt * n_rows * n_columns))
+
+        return templates.reshape(nk, nl, nt, n_rows, n_columns)
+
+    def get_diagonal(self) -> Tensor:
+        return (1 + self.factor ** 2 @ self.coefficients) * self.diagonal
+
+    def get_matrix(self) -> Tensor:
+        update = torch.eye(len(self.diagonal)).to(self.factor) + self.factor * self.coefficients @ self.factor.T
+        return update * self.diagonal
+
+    def to(self, device: Union[str, torch.device] = None, dtype: torch.dtype = None) -> 'LowRankUpdateOperator':
+        return LowRankUpdateOperator(
+            self.diagonal.to(device=device, dtype=dtype),
+            self.factor.to(device=device, dtype=dtype),
+            self.coefficients.to(device=device, dtype=dtype)
+        )
+
+
+def compose_operators(operators: Iterable[LinearOperator]) -> LinearOperator:
+    """Compose a chain of transformations into a single operator.
+
+    Block diagonal transformations are composed into a block diagonal operator and all other combinations into a dense
+    operator, so that the chain is applied with a single matrix multiplication.
+
+    Parameters
+    ----------
+    operators : Iterable[LinearOperator]
+        The transformations in the order in which they are applied.
+
+    Returns
+    -------
+    LinearOperator
+        The composed transformation or the identity if there are no transformations.
+    """
+    composed = IdentityOperator()
+
+    for operator in operators:
+        composed = composed.compose(operator)
+
+    return composed
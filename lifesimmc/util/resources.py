@@ -1,6 +1,7 @@
 from typing import Union, Callable
 
 from lifesimmc.core.modules.base_module import BaseModule
+from lifesimmc.util.operators import LinearOperator, compose_operators
 
 
 def get_transformations_from_resource_name(module: BaseModule, resource_name: Union[str, tuple[str]]) -> list[Callable]:
@@ -13,3 +14,22 @@ def get_transformations_from_resource_name(module: BaseModule, resource_name: Un
         transformations = [module.get_resource_from_name(
             resource_name).transformation]
     return transformations
+
+
+def get_transformation_from_resource_name(module: BaseModule, resource_name: Union[str, tuple[str]]) -> LinearOperator:
+    """Get the transformations of one or several transformation resources composed into a single operator.
+
+    Parameters
+    ----------
+    module : BaseModule
+        The module requesting the transformation.
+    resource_name : str or tuple[str]
+        The name of the transformation resource or the names of several transformation resources in the order in which
+        they have been applied. If None, the identity is returned.
+
+    Returns
+    -------
+    LinearOperator
+        The composed transformation.
+    """
+    return compose_operators(get_transformations_from_resource_name(module, resource_name))
@@ -0,0 +1,104 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+
+from lifesimmc.util.operators import BlockDiagonalOperator, DenseOperator, IdentityOperator, LowRankUpdateOperator
+
+
+def _get_numpy_globals() -> list:
+    """Get the numpy functions and types that are needed to restore arrays, scalars, data types and random states.
+
+    The reconstruction functions are taken from the pickling protocol of the arrays, since their module differs between
+    numpy versions.
+
+    Returns
+    -------
+    list
+        The numpy functions and types.
+    """
+    array = np.zeros(1)
+    dtypes = (np.bool_, np.int32, np.int64, np.uint32, np.float32, np.float64, np.complex64, np.complex128)
+    return [np.ndarray, np.dtype, array.__reduce__()[0], array[0].__reduce__()[0], *dtypes] + [
+        type(np.dtype(dtype)) for dtype in dtypes
+    ]
+
+
+# Files are loaded with weights_only=True, since they may be shared between users, so that only tensors, containers
+# and the classes registered here or elsewhere with torch.serialization.add_safe_globals can be restored
+torch.serialization.add_safe_globals([
+    IdentityOperator,
+    DenseOperator,
+    BlockDiagonalOperator,
+    LowRankUpdateOperator,
+    *_get_numpy_globals()
+])
+
+
+def load(path: Path, mmap: bool = False) -> Any:
+    """Load an object saved with ``save`` without executing arbitrary code.
+
+    Parameters
+    ----------
+    path : Path
+        The path of the file.
+    mmap : bool, optional
+        Whether the tensors are memory-mapped from the file instead of being read into memory. Default is False.
+
+    Returns
+    -------
+    Any
+        The object.
+
+    Raises
+    ------
+    pickle.UnpicklingError
+        If the file contains objects of classes that are not registered as safe to load.
+    RuntimeError, EOFError, OSError
+        If the file is corrupt or cannot be read.
+    """
+    return torch.load(path, mmap=mmap, weights_only=True)
+
+
+def save(obj: Any, path: Path) -> bool:
+    """Save an object if it can be pickled and loaded with ``load``.
+
+    The object is written under a temporary name and renamed once it is complete, so that an object that cannot be
+    pickled or a process that is interrupted while writing never leaves an incomplete file.
+
+    Parameters
+    ----------
+    obj : Any
+        The object to save.
+    path : Path
+        The path of the file.
+
+    Returns
+    -------
+    bool
+        True if the object has been saved, False if it cannot be pickled or contains objects of classes that are not
+        registered as safe to load.
+    """
+    path = Path(path)
+    temporary_path = path.with_name(f'{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+    try:
+        torch.save(obj, temporary_path)
+
+        if torch.serialization.get_unsafe_globals_in_checkpoint(temporary_path):
+            temporary_path.unlink()
+            return False
+
+        os.replace(temporary_path, path)
+    except (AttributeError, TypeError, pickle.PicklingError):
+        temporary_path.unlink(missing_ok=True)
+        return False
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+    return True
@@ -0,0 +1,162 @@
+import math
+
+import torch
+from scipy.stats import binom
+from torch import Tensor
+
+
+class TailQuantileEstimator:
+    """Class representation of a streaming estimator of an upper tail quantile and its confidence interval.
+
+    The (1 - probability) quantile of n samples is the m-th largest sample with m = floor(n * probability) + 1, and a
+    distribution-free confidence interval is given by two other order statistics, whose ranks follow from the binomial
+    distribution of the number of samples exceeding the true quantile. Only the largest samples up to the rank of the
+    lower end of the confidence interval are kept, so that millions of samples can be streamed through the estimator
+    with a memory footprint of a few dozen values.
+
+    Parameters
+    ----------
+    probability : float
+        The upper tail probability of the quantile, e.g. the probability of false alarm of a test.
+    n_samples : int
+        The total number of samples that are streamed through the estimator.
+    confidence_level : float
+        The confidence level of the confidence interval.
+    """
+
+    def __init__(self, probability: float, n_samples: int, confidence_level: float = 0.95):
+        """Constructor method.
+
+        Parameters
+        ----------
+        probability : float
+            The upper tail probability of the quantile, e.g. the probability of false alarm of a test.
+        n_samples : int
+            The total number of samples that are streamed through the estimator.
+        confidence_level : float
+            The confidence level of the confidence interval.
+        """
+        if n_samples * probability < 1:
+            raise ValueError(
+                f'At least {math.ceil(1 / probability)} samples are required to estimate the quantile of an upper tail '
+                f'probability of {probability}.'
+            )
+
+        self.probability = probability
+        self.n_samples = n_samples
+        self.confidence_level = confidence_level
+        self.n_seen = 0
+
+        # Ranks of the quantile and the ends of the confidence interval counted from the largest sample
+        alpha = 1 - confidence_level
+        self._rank = math.floor(n_samples * probability) + 1
+        self._rank_upper = max(1, int(binom.ppf(alpha / 2, n_samples, probability)))
+        self._rank_lower = min(n_samples, int(binom.ppf(1 - alpha / 2, n_samples, probability)) + 1)
+        self._largest = None
+
+    def _get_order_statistic(self, rank: int) -> float:
+        """Get the sample of a rank counted from the largest sample.
+
+        Parameters
+        ----------
+        rank : int
+            The rank, where 1 is the largest sample.
+
+        Returns
+        -------
+        float
+            The sample.
+        """
+        if self.n_seen < self.n_samples:
+            raise RuntimeError(f'Only {self.n_seen} of {self.n_samples} samples have been added.')
+
+        return self._largest[rank - 1].item()
+
+    def add(self, samples: Tensor):
+        """Add a batch of samples.
+
+        Parameters
+        ----------
+        samples : Tensor
+            The samples.
+        """
+        samples = samples.flatten()
+        self.n_seen += samples.numel()
+
+        if self._largest is not None:
+            samples = torch.cat((self._largest, samples.to(self._largest)))
+
+        self._largest = torch.topk(samples, min(self._rank_lower, samples.numel())).values
+
+    def get_confidence_interval(self) -> tuple[float, float]:
+        """Get the confidence interval of the quantile.
+
+        Returns
+        -------
+        tuple[float, float]
+            The lower and upper end of the confidence interval.
+        """
+        return self._get_order_statistic(self._rank_lower), self._get_order_statistic(self._rank_upper)
+
+    def get_quantile(self) -> float:
+        """Get the estimate of the quantile.
+
+        Returns
+        -------
+        float
+            The quantile.
+        """
+        return self._get_order_statistic(self._rank)
+
+
+def sample_energy_statistics(
+        covariance: Tensor,
+        n_time_steps: int,
+        n_samples: int,
+        model: Tensor = None
+) -> Tensor:
+    """Draw energy detector statistics of data with a given noise covariance and, optionally, a planet signal.
+
+    The data of each time step is a correlated Gaussian sample with the given covariance of the differential outputs
+    and wavelengths. Rotating it into the eigenbasis of the covariance decorrelates it without changing its energy, so
+    that the energy of the data is a sum of independent chi-squared variables with n_time_steps degrees of freedom
+    weighted by the eigenvalues of the covariance. This is drawn instead of the full data, which is cheaper by a factor
+    of about n_time_steps. If a model of the signal is given, the chi-squared variables are non-central with the energy
+    of the model along each eigenvector divided by its eigenvalue as non-centrality, which are drawn as Poisson mixtures
+    of central chi-squared variables.
+
+    Parameters
+    ----------
+    covariance : Tensor
+        The covariance of shape (n_diff_out * n_wavelengths x n_diff_out * n_wavelengths).
+    n_time_steps : int
+        The number of time steps.
+    n_samples : int
+        The number of statistics to draw.
+    model : Tensor, optional
+        The model of the signal of shape (n_diff_out * n_wavelengths x n_time_steps). If None, noise-only statistics
+        are drawn.
+
+    Returns
+    -------
+    Tensor
+        The statistics of shape (n_samples).
+    """
+    if model is None:
+        eigenvalues = torch.linalg.eigvalsh(covariance).clamp(min=0)
+        degrees_of_freedom = torch.full_like(eigenvalues, n_time_steps)
+        chi_squared = torch.distributions.Chi2(degrees_of_freedom).sample((n_samples,))
+
+        return chi_squared @ eigenvalues
+
+    eigenvalues, eigenvectors = torch.linalg.eigh(covariance)
+    eigenvalues = eigenvalues.clamp(min=0)
+    model_energies = ((eigenvectors.T @ model.to(eigenvectors)) ** 2).sum(dim=-1)
+
+    # Directions without noise contribute the energy of the model deterministically
+    has_noise = eigenvalues > 0
+    non_centralities = model_energies[has_noise] / eigenvalues[has_noise]
+    poisson = torch.distributions.Poisson(non_centralities / 2).sample((n_samples,))
+    chi_squared = torch.distributions.Chi2(n_time_steps + 2 * poisson).sample()
+
+    return chi_squared @ eigenvalues[has_noise] + model_energies[~has_noise].sum()
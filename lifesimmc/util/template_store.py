@@ -0,0 +1,154 @@
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Union
+
+import numpy as np
+import torch
+from phringe.main import PHRINGE
+from torch import Tensor
+
+from lifesimmc.util.hashing import get_fingerprint
+
+
+class TemplateStore:
+    """Class representation of a persistent store of template cubes.
+
+    Each template cube is saved as a .npy file that is named after a fingerprint of all setup parameters the templates
+    depend on. Loaded templates are memory-mapped, so they are not read into memory until they are accessed and are not
+    duplicated when several pipelines use them.
+
+    Parameters
+    ----------
+    directory : str or Path
+        The directory in which the templates are stored.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """Constructor method.
+
+        Parameters
+        ----------
+        directory : str or Path
+            The directory in which the templates are stored.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return self._get_path(key).exists()
+
+    def _get_path(self, key: str) -> Path:
+        """Get the path of the file in which a template cube is stored.
+
+        Parameters
+        ----------
+        key : str
+            The key of the template cube.
+
+        Returns
+        -------
+        Path
+            The path of the file.
+        """
+        return self.directory / f'{key}.npy'
+
+    @staticmethod
+    def get_key(phringe: PHRINGE, fov: float, grid_size: int) -> str:
+        """Get the key of the templates of a setup.
+
+        The templates only depend on the instrument, the observation geometry, the field of view and the grid size.
+
+        Parameters
+        ----------
+        phringe : PHRINGE
+            The PHRINGE instance of the setup.
+        fov : float
+            The field of view of the templates in radians.
+        grid_size : int
+            The size of the template grid.
+
+        Returns
+        -------
+        str
+            The key of the templates.
+        """
+        return get_fingerprint(
+            'templates',
+            phringe._instrument,
+            phringe.simulation_time_steps,
+            phringe.get_wavelength_bin_centers(),
+            phringe.get_wavelength_bin_widths(),
+            phringe.get_nulling_baseline(),
+            phringe._observation.modulation_period,
+            phringe._observation.detector_integration_time,
+            float(fov),
+            grid_size
+        )
+
+    def load(self, key: str) -> Union[Tensor, None]:
+        """Load a template cube from the store.
+
+        The returned tensor is backed by a copy-on-write memory map of the file, so writing to it does not change the
+        stored templates.
+
+        Parameters
+        ----------
+        key : str
+            The key of the template cube.
+
+        Returns
+        -------
+        Tensor or None
+            The template cube or None if it is not in the store.
+        """
+        if key not in self:
+            return None
+
+        return torch.from_numpy(np.load(self._get_path(key), mmap_mode='c'))
+
+    def save(self, key: str, template_tiles: Iterable[Tensor], n_rows: int) -> Tensor:
+        """Save a template cube to the store tile by tile and load it.
+
+        The file is written under a temporary name and renamed once it is complete, so concurrent runs never open
+        incomplete templates.
+
+        Parameters
+        ----------
+        key : str
+            The key of the template cube.
+        template_tiles : Iterable[Tensor]
+            The tiles of consecutive grid rows of shape (n_diff_out x n_wavelengths x n_time_steps x n_rows x n_grid).
+        n_rows : int
+            The total number of grid rows of the template cube.
+
+        Returns
+        -------
+        Tensor
+            The memory-mapped template cube.
+        """
+        path = self._get_path(key)
+        temporary_path = path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp.npy')
+        templates = None
+        start = 0
+
+        for template_tile in template_tiles:
+            template_tile = template_tile.cpu().numpy()
+
+            if templates is None:
+                templates = np.lib.format.open_memmap(
+                    temporary_path,
+                    mode='w+',
+                    dtype=template_tile.dtype,
+                    shape=(*template_tile.shape[:-2], n_rows, template_tile.shape[-1])
+                )
+
+            stop = start + template_tile.shape[-2]
+            templates[..., start:stop, :] = template_tile
+            start = stop
+
+        templates.flush()
+        del templates
+        os.replace(temporary_path, path)
+
+        return self.load(key)
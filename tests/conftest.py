@@ -0,0 +1,127 @@
+"""Fixtures shared by the test cases."""
+import json
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import astropy.units as u
+import pytest
+import torch
+from phringe.core.scene import Scene
+from phringe.core.sources.planet import Planet
+from phringe.core.sources.star import Star
+from phringe.io.sed_loader import SEDLoader
+from torch.profiler import profile, ProfilerActivity
+
+from lifesimmc.core.modules.loading.setup_module import SetupModule
+from lifesimmc.core.pipeline import Pipeline
+from lifesimmc.presets.single_epoch_observation.single_epoch_observation import SingleEpochObservation
+
+
+def get_scene() -> Scene:
+    """Return a scene with a Sun twin and an Earth twin at 10 pc."""
+    scene = Scene()
+    scene.add_source(Star(
+        name='Sun Twin',
+        distance='10 pc',
+        mass='1 Msun',
+        radius='1 Rsun',
+        temperature='5778 K',
+        right_ascension='10 hourangle',
+        declination='45 deg'
+    ))
+    scene.add_source(Planet(
+        name='Earth Twin',
+        propagate_orbit=False,
+        sed_loader=SEDLoader(
+            path_to_file=str(Path(__file__).parents[1] / 'docs' / '_static' / 'psg_earth_spectrum.txt'),
+            sed_units='W/sr/m2/um',
+            wavelength_units='um'
+        ),
+        mass='1 Mearth',
+        radius='1 Rearth',
+        temperature='254 K',
+        semi_major_axis='1 au',
+        eccentricity=0.,
+        inclination='180 deg',
+        raan='90 deg',
+        argument_of_periapsis='0 deg',
+        true_anomaly='45 deg'
+    ))
+    return scene
+
+
+def get_preset(**kwargs) -> SingleEpochObservation:
+    """Return a single-epoch observation of the test scene with few wavelength bins and time steps."""
+    return SingleEpochObservation(**{
+        'scene': get_scene(),
+        'total_integration_time': 1 * u.d,
+        'whitening': False,
+        'spectral_resolving_power': 5,
+        'grid_size': 10,
+        'seed': 1,
+        'device': torch.device('cpu'),
+        **kwargs
+    })
+
+
+def get_peak_memory(function: Callable) -> int:
+    """Return the peak CPU memory in bytes allocated by torch while calling a function.
+
+    The allocations are read from the memory events of the exported Chrome trace of the profiler.
+    """
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        function()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'trace.json'
+        prof.export_chrome_trace(str(path))
+        trace = json.loads(path.read_text())
+
+    events = sorted(
+        (event for event in trace['traceEvents'] if event.get('name') == '[memory]'),
+        key=lambda event: event['ts']
+    )
+    memory = peak_memory = 0
+
+    for event in events:
+        memory += event['args']['Bytes']
+        peak_memory = max(peak_memory, memory)
+
+    return peak_memory
+
+
+@pytest.fixture(scope='session')
+def setup() -> Pipeline:
+    """Return a pipeline containing the setup resource 'setup' and the planet resource 'planets' of the test scene."""
+    preset = get_preset()
+    pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'))
+    pipeline.add_module(SetupModule(
+        n_setup_out='setup',
+        n_planets_out='planets',
+        scene=preset.scene,
+        instrument=preset._instrument,
+        observation=preset._observation
+    ))
+    pipeline.run()
+    return pipeline
+
+
+@pytest.fixture(scope='session')
+def planet_counts(setup: Pipeline) -> tuple[torch.Tensor, float, float, torch.Tensor]:
+    """Return the SED, the x and y positions in radians and the noise-free kernel counts of the planet."""
+    phringe = setup.get_resource('setup').phringe
+    planet = setup.get_resource('planets').collection[0].planet
+    sed = planet.spectral_energy_distribution[:, 0, 0].to(torch.float64)
+    x_position = planet.sky_coordinates[0, 0, 0, 0, 0].item()
+    y_position = planet.sky_coordinates[1, 0, 0, 0, 0].item()
+    counts = torch.as_tensor(
+        phringe.get_model_counts(
+            spectral_energy_distribution=sed.cpu().numpy(),
+            x_position=x_position,
+            y_position=y_position,
+            kernels=True
+        ),
+        dtype=torch.float64
+    )
+    return sed, x_position, y_position, counts
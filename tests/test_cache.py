@@ -0,0 +1,63 @@
+"""Test cases for the cache utilities."""
+import numpy as np
+import torch
+
+from lifesimmc.util.cache import LRUCache
+from lifesimmc.util.hashing import get_fingerprint
+from lifesimmc.util.operators import LowRankUpdateOperator
+
+
+class _Unregistered:
+    """Class that is not registered as safe to load."""
+
+
+def test_lru_cache_evicts_least_recently_used_entry() -> None:
+    """It only keeps the most recently used entries in memory."""
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+
+
+def test_lru_cache_persists_entries_on_disk(tmp_path) -> None:
+    """It restores persisted entries in a new cache instance."""
+    LRUCache(cache_dir=tmp_path).set('w', torch.eye(3))
+
+    assert torch.equal(LRUCache(cache_dir=tmp_path).get('w'), torch.eye(3))
+
+
+def test_lru_cache_only_restores_registered_classes(tmp_path) -> None:
+    """It restores operators and numpy random states and treats entries with other objects as missing."""
+    operator = LowRankUpdateOperator(torch.ones(3), torch.ones(3, 1), torch.ones(1))
+    LRUCache(cache_dir=tmp_path).set('operator', (operator, np.random.get_state()))
+    LRUCache(cache_dir=tmp_path).set('unregistered', _Unregistered())
+
+    restored_operator, random_state = LRUCache(cache_dir=tmp_path).get('operator')
+
+    assert torch.equal(restored_operator.factor, operator.factor)
+    assert np.array_equal(random_state[1], np.random.get_state()[1])
+    assert LRUCache(cache_dir=tmp_path).get('unregistered', default=0) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['operator.pt']
+
+
+def test_lru_cache_never_leaves_or_loads_incomplete_entries(tmp_path) -> None:
+    """It does not persist entries that cannot be pickled and removes corrupt entries instead of loading them."""
+    cache = LRUCache(cache_dir=tmp_path)
+    cache.set('function', lambda: None)
+
+    assert 'function' in cache and list(tmp_path.iterdir()) == []
+
+    tmp_path.joinpath('corrupt.pt').write_bytes(b'PK\x03\x04')
+
+    assert LRUCache(cache_dir=tmp_path).get('corrupt', default=0) == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fingerprint_depends_on_content() -> None:
+    """It is equal for equal content and differs for different content."""
+    assert get_fingerprint(torch.ones(3), {'a': 1}) == get_fingerprint(torch.ones(3), {'a': 1})
+    assert get_fingerprint(torch.ones(3)) != get_fingerprint(torch.zeros(3))
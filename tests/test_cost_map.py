@@ -0,0 +1,101 @@
+"""Test cases for the cost map utilities."""
+import torch
+
+from lifesimmc.util.cost_map import get_cost_map, get_cost_map_from_tiles
+from tests.conftest import get_peak_memory
+
+
+def test_cost_map_with_diagonal_covariance_matches_element_wise_solution() -> None:
+    """It gives the same result for an explicit diagonal covariance as for uncorrelated noise."""
+    torch.manual_seed(0)
+    template_data = torch.rand(2, 4, 25, 3, 3, dtype=torch.float64)
+    data = 2 * template_data[..., 1, 2] + torch.randn(2, 4, 25, dtype=torch.float64)
+    data_variance = torch.var(data.transpose(1, 2).reshape(-1, 4), axis=0)
+
+    flux, cost = get_cost_map(data, template_data)
+    flux_cov, cost_cov = get_cost_map(data, template_data, covariance=torch.diag(data_variance))
+
+    assert torch.allclose(flux, flux_cov)
+    assert torch.allclose(cost, cost_cov)
+
+
+def test_cost_map_with_covariance_solves_generalized_least_squares() -> None:
+    """It gives the generalized least squares flux at every grid position."""
+    torch.manual_seed(0)
+    template_data = torch.rand(2, 4, 25, 2, 2, dtype=torch.float64)
+    data = torch.randn(2, 4, 25, dtype=torch.float64)
+    a = torch.randn(4, 4, dtype=torch.float64)
+    covariance = a @ a.T + torch.eye(4, dtype=torch.float64)
+
+    flux, _ = get_cost_map(data, template_data, covariance=covariance, positive=False)
+
+    # Whiten the samples with the Cholesky factor of the covariance and solve the least squares problem
+    cholesky = torch.linalg.cholesky(covariance)
+    samples = data.transpose(1, 2).reshape(-1, 4)
+    templates = template_data[..., 0, 1].transpose(1, 2).reshape(-1, 4)
+    y = torch.linalg.solve_triangular(cholesky, samples.T, upper=False).T.reshape(-1)
+    x = torch.linalg.solve_triangular(cholesky, torch.diag_embed(templates), upper=False).reshape(-1, 4)
+
+    assert torch.allclose(flux[:, 0, 1], torch.linalg.lstsq(x, y[:, None]).solution[:, 0])
+
+
+def test_cost_map_with_precomputed_gram_matches_cost_map() -> None:
+    """It gives the same cost map with and without precomputed template Gram matrices."""
+    torch.manual_seed(0)
+    data = torch.randn(2, 3, 6, dtype=torch.float64)
+    templates = torch.randn(2, 3, 6, 4, 4, dtype=torch.float64)
+    covariance = torch.cov(data.transpose(0, 1).reshape(3, -1))
+    gram = torch.einsum('kjtab, kmtab->abjm', templates, templates)
+    tiles = [templates[..., :3, :], templates[..., 3:, :]]
+
+    for cov in (None, covariance):
+        expected = get_cost_map(data, templates, covariance=cov)
+        result = get_cost_map_from_tiles(data, tiles, covariance=cov, template_gram=gram)
+
+        assert torch.allclose(result[0], expected[0]) and torch.allclose(result[1], expected[1])
+
+
+def test_cost_map_of_stack_matches_single_realizations() -> None:
+    """It gives the cost maps of all realizations of a stack of data at once."""
+    torch.manual_seed(0)
+    data = torch.randn(2, 3, 2, 3, 6, dtype=torch.float64)
+    templates = torch.randn(2, 3, 6, 4, 4, dtype=torch.float64)
+    gram = torch.einsum('kjtab, kmtab->abjm', templates, templates)
+    tiles = [templates[..., :3, :], templates[..., 3:, :]]
+
+    for cov in (None, torch.eye(3, dtype=torch.float64) + 0.1):
+        flux, cost = get_cost_map_from_tiles(data, tiles, covariance=cov, template_gram=gram)
+
+        assert flux.shape == cost.shape == (2, 3, 3, 4, 4)
+
+        for index in ((0, 0), (1, 2)):
+            expected = get_cost_map(data[index], templates, covariance=cov)
+
+            assert torch.allclose(flux[index], expected[0]) and torch.allclose(cost[index], expected[1])
+
+
+def test_cost_map_is_independent_of_chunk_size() -> None:
+    """It gives the same result when the time steps are processed in chunks."""
+    torch.manual_seed(0)
+    template_data = torch.rand(2, 4, 25, 3, 3, dtype=torch.float64)
+    data = torch.randn(2, 4, 25, dtype=torch.float64)
+    covariance = torch.eye(4, dtype=torch.float64) + 0.1
+
+    for cov in (None, covariance):
+        for expected, result in zip(
+                get_cost_map(data, template_data, covariance=cov),
+                get_cost_map(data, template_data, covariance=cov, chunk_size=7)
+        ):
+            assert torch.allclose(expected, result)
+
+
+def test_cost_map_does_not_allocate_template_sized_intermediates() -> None:
+    """It allocates much less memory than the size of the templates."""
+    template_data = torch.rand(2, 10, 500, 20, 20)
+    data = torch.randn(2, 10, 500)
+    template_bytes = template_data.numel() * template_data.element_size()
+
+    assert get_peak_memory(lambda: get_cost_map(data, template_data)) < template_bytes / 20
+    assert get_peak_memory(
+        lambda: get_cost_map(data, template_data, covariance=torch.eye(10), chunk_size=25)
+    ) < template_bytes / 5
@@ -0,0 +1,76 @@
+"""Test cases for the fitting utilities."""
+import numpy as np
+import torch
+
+from lifesimmc.core.modules.processing.ml_parameter_estimation_module import MLSEDEstimationModule
+from lifesimmc.core.pipeline import Pipeline
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.util.fitting import apply_transformation, fit_sed_variable_projection
+
+
+def test_apply_transformation_matches_per_data_set_application() -> None:
+    """It gives the same result as applying the transformation to every data set separately."""
+    w = torch.randn(6, 6, dtype=torch.float64)
+
+    def transformation(data):
+        nk, nl, nt = data.shape
+        return (w @ data.reshape(nk * nl, nt)).reshape(nk, nl, nt)
+
+    data = torch.randn(4, 5, 2, 3, 7, dtype=torch.float64)
+    expected = torch.stack([torch.stack([transformation(d) for d in batch]) for batch in data])
+
+    assert torch.allclose(apply_transformation(transformation, data), expected)
+
+
+def _get_noisy_data(counts: torch.Tensor, n_data_sets: int) -> torch.Tensor:
+    """Return data sets of the counts with white noise of a percent of the maximum counts."""
+    torch.manual_seed(0)
+    return counts + 0.01 * counts.abs().max() * torch.randn(n_data_sets, *counts.shape, dtype=torch.float64)
+
+
+def test_variable_projection_recovers_sed_and_position(setup, planet_counts) -> None:
+    """It recovers the SED and position of a planet and gives finite uncertainties of the right shape."""
+    sed, x_position, y_position, counts = planet_counts
+    data = _get_noisy_data(counts, 3)
+
+    fluxes, stds, cov, x_positions, y_positions = fit_sed_variable_projection(
+        setup.get_resource('setup').phringe,
+        data,
+        torch.full((3,), 1.05 * x_position),
+        torch.full((3,), 0.95 * y_position),
+        batch_size=2
+    )
+    nl = len(sed)
+
+    assert fluxes.shape == stds.shape == (3, nl) and cov.shape == (3, nl + 2, nl + 2)
+    assert torch.isfinite(stds).all() and torch.isfinite(cov).all()
+    assert torch.allclose(fluxes, sed, atol=0.05 * sed.max())
+    assert torch.allclose(x_positions, torch.tensor(x_position, dtype=torch.float64), rtol=1e-2)
+    assert torch.allclose(y_positions, torch.tensor(y_position, dtype=torch.float64), rtol=1e-2)
+
+
+def test_variable_projection_matches_lmfit(setup, planet_counts) -> None:
+    """It gives the same SED as the lmfit solver of the maximum likelihood estimation module."""
+    data = _get_noisy_data(planet_counts[-1], 1)
+
+    pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'))
+    pipeline.add_resource(setup.get_resource('setup'))
+    pipeline.add_resource(setup.get_resource('planets'))
+    r_data = DataResource('data')
+    r_data.set_data(data[0])
+    pipeline.add_resource(r_data)
+
+    for solver in ('lmfit', 'torch'):
+        pipeline.add_module(MLSEDEstimationModule(
+            n_setup_in='setup',
+            n_data_in='data',
+            n_planets_in='planets',
+            n_planets_out=f'estimate_{solver}',
+            solver=solver
+        ))
+
+    pipeline.run()
+    sed_lmfit = pipeline.get_resource('estimate_lmfit').collection[0].sed
+    sed_torch = pipeline.get_resource('estimate_torch').collection[0].sed
+
+    assert np.linalg.norm(sed_torch - sed_lmfit) <= 1e-3 * np.linalg.norm(sed_lmfit)
@@ -0,0 +1,107 @@
+"""Test cases for the matrix utilities."""
+import torch
+
+from lifesimmc.core.modules.processing.zca_whitening_module import ZCAWhiteningModule
+from lifesimmc.core.resources.template_resource import TemplateResource
+from lifesimmc.util.matrix import apply_matrices_to_templates, get_ledoit_wolf_covariance
+from lifesimmc.util.operators import DenseOperator, LowRankUpdateOperator
+from tests.conftest import get_peak_memory
+
+
+def test_apply_matrices_to_templates_matches_per_pixel_product() -> None:
+    """It gives the same result as one matrix multiplication per grid pixel."""
+    matrices = torch.rand(2, 5, 5)
+    templates = torch.rand(2, 5, 7, 4, 4)
+
+    expected = torch.zeros_like(templates)
+    for k in range(2):
+        for i in range(4):
+            for j in range(4):
+                expected[k, :, :, i, j] = matrices[k] @ templates[k, :, :, i, j]
+
+    assert torch.allclose(apply_matrices_to_templates(matrices, templates), expected)
+    assert torch.allclose(apply_matrices_to_templates(matrices, templates, chunk_size=3), expected)
+
+
+def test_ledoit_wolf_covariance_is_well_conditioned_for_few_samples() -> None:
+    """It gives an invertible covariance with the sample variances if there are fewer samples than variables."""
+    torch.manual_seed(0)
+    data = torch.randn(40, 20, dtype=torch.float64) * torch.logspace(0, 3, 40, dtype=torch.float64)[:, None]
+    cov = get_ledoit_wolf_covariance(data)
+
+    assert torch.linalg.matrix_rank(torch.cov(data)) < 40
+    assert torch.linalg.matrix_rank(cov) == 40
+    assert torch.allclose(torch.diag(cov), data.var(dim=-1, unbiased=False))
+
+
+def test_low_rank_whitening_whitens_low_rank_plus_diagonal_noise() -> None:
+    """It whitens noise with a low-rank plus diagonal covariance without forming the covariance."""
+    torch.manual_seed(0)
+    factor = torch.randn(60, 3, dtype=torch.float64) * 5
+    std = torch.rand(60, 1, dtype=torch.float64) + 0.5
+    noise = factor @ torch.randn(3, 100000, dtype=torch.float64) + std * torch.randn(60, 100000, dtype=torch.float64)
+    module = ZCAWhiteningModule('setup', 'data', 'data_white', 'zca', covariance='low_rank', rank=3)
+
+    zca = module._get_low_rank_whitening(noise)
+    cov = torch.cov(zca.apply(noise.reshape(2, 30, -1)).reshape(60, -1))
+
+    assert torch.allclose(cov, torch.eye(60, dtype=torch.float64), atol=0.05)
+
+
+def test_whitening_of_ledoit_wolf_covariance_is_symmetric_inverse_square_root() -> None:
+    """It whitens the Ledoit-Wolf covariance with its symmetric inverse square root if there are few samples."""
+    torch.manual_seed(0)
+    noise = torch.randn(40, 20, dtype=torch.float64) * torch.logspace(0, 3, 40, dtype=torch.float64)[:, None]
+    module = ZCAWhiteningModule('setup', 'data', 'data_white', 'zca', covariance='ledoit_wolf')
+
+    zca = module._get_whitening(noise).get_matrix()
+    cov = get_ledoit_wolf_covariance(noise)
+
+    assert torch.allclose(zca, zca.T)
+    assert torch.allclose(zca @ cov @ zca, torch.eye(40, dtype=torch.float64))
+
+
+def test_diagonal_of_low_rank_whitening_is_calculated_without_dense_matrix(monkeypatch) -> None:
+    """It uses the diagonal of the low-rank whitening transformation without forming its dense matrix."""
+    torch.manual_seed(1)
+    noise = torch.randn(60, 3, dtype=torch.float64) @ torch.randn(3, 1000, dtype=torch.float64)
+    noise += torch.randn(60, 1000, dtype=torch.float64)
+    torch.manual_seed(0)
+    expected = torch.diagonal(
+        ZCAWhiteningModule('setup', 'data', 'data_white', 'zca', covariance='low_rank', rank=3)
+        ._get_whitening(noise).get_matrix()
+    )
+
+    def get_matrix(self):
+        raise AssertionError('The dense matrix has been formed.')
+
+    monkeypatch.setattr(LowRankUpdateOperator, 'get_matrix', get_matrix)
+    torch.manual_seed(0)
+    zca = ZCAWhiteningModule(
+        'setup', 'data', 'data_white', 'zca', diagonal_only=True, covariance='low_rank', rank=3
+    )._get_whitening(noise)
+
+    assert isinstance(zca, LowRankUpdateOperator) and zca.factor.shape == (60, 0)
+    assert torch.allclose(zca.get_diagonal(), expected)
+    assert torch.allclose(zca.apply(noise.reshape(2, 30, -1)).reshape(60, -1), expected[:, None] * noise)
+
+
+def test_lazily_whitened_templates_match_eager_whitening_one_row_at_a_time() -> None:
+    """It whitens stored templates tile by tile without allocating more than a few tiles at once."""
+    torch.manual_seed(0)
+    zca = DenseOperator(torch.randn(6, 6))
+    r_template = TemplateResource(name='templates', grid_coordinates=torch.zeros(2, 16, 16))
+    r_template.set_data(torch.randn(2, 3, 50, 16, 16))
+    module = ZCAWhiteningModule(
+        'setup', 'data', 'data_white', 'zca', 'templates', 'templates_white', lazy_templates=True
+    )
+    module.grid_size = 16
+
+    r_template_white = module._get_whitened_templates(r_template, zca)
+    tiles = list(r_template_white.get_tiles())
+    tile_bytes = tiles[0].numel() * tiles[0].element_size()
+
+    assert r_template_white.is_streaming and len(tiles) == 16
+    assert torch.allclose(torch.cat(tiles, dim=-2), zca.apply_to_templates(r_template.view()), atol=1e-5)
+    assert get_peak_memory(lambda: [None for _ in r_template_white.get_tiles()]) <= 4 * tile_bytes
+    assert module.estimate_output_bytes({'templates': 16 * tile_bytes})['templates_white'] == tile_bytes
@@ -0,0 +1,233 @@
+"""Test cases for the processing modules."""
+import numpy as np
+import pytest
+import torch
+from scipy.stats import ncx2
+
+from lifesimmc.core.modules.processing.energy_detector_test_module import EnergyDetectorTestModule
+from lifesimmc.core.modules.processing.ml_parameter_estimation_module import (
+    MLSEDBatchEstimationModule,
+    MLSEDEstimationModule
+)
+from lifesimmc.core.modules.processing.neyman_pearson_test_module import NeymanPearsonTestModule
+from lifesimmc.core.pipeline import Pipeline
+from lifesimmc.core.resources import test_result_batch
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.planet_resource import PlanetResource
+from lifesimmc.core.resources.resource_collection import ResourceCollection
+from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util.noise import get_noise_reference_counts
+from lifesimmc.util.operators import DenseOperator
+
+
+def _get_pipeline(setup: Pipeline, data: torch.Tensor, streaming: bool = False) -> Pipeline:
+    """Return a pipeline containing the setup and planet resources of the test scene and a data resource 'data'."""
+    pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'))
+    pipeline.add_resource(setup.get_resource('setup'))
+    pipeline.add_resource(setup.get_resource('planets'))
+    r_data = DataResource('data')
+
+    if streaming:
+        r_data.set_batch_function(lambda start, stop: data[start:stop], n_realizations=len(data), batch_size=2)
+    else:
+        r_data.set_data(data)
+
+    pipeline.add_resource(r_data)
+    return pipeline
+
+
+def _get_noisy_data(counts: torch.Tensor, n_realizations: int) -> torch.Tensor:
+    """Return realizations of the counts with white noise of a percent of the maximum counts."""
+    torch.manual_seed(0)
+    return counts + 0.01 * counts.abs().max() * torch.randn(n_realizations, *counts.shape, dtype=torch.float64)
+
+
+def _run_neyman_pearson_test(setup: Pipeline, data: torch.Tensor, streaming: bool = False):
+    """Return the output of the Neyman-Pearson test of the data."""
+    pipeline = _get_pipeline(setup, data, streaming=streaming)
+    pipeline.add_module(NeymanPearsonTestModule(
+        n_setup_in='setup',
+        n_data_in='data',
+        n_planets_true_in='planets',
+        n_test_out='test',
+        pfa=0.01,
+        pdet=0.9
+    ))
+    pipeline.run()
+    return pipeline.get_resource('test')
+
+
+def _run_energy_detector_test(setup: Pipeline, planet_counts: tuple, data: torch.Tensor, whitening: bool = False,
+                              **kwargs):
+    """Return the pipeline after running the energy detector test of the data with the true planet parameters,
+    optionally with a transformation that exactly whitens the noise reference data set of the test."""
+    sed, x_position, y_position, _ = planet_counts
+    pipeline = _get_pipeline(setup, data)
+    pipeline.add_resource(ResourceCollection[PlanetResource](
+        name='planets_est',
+        collection=[PlanetResource(name='planet_est', sed=sed, pos_x=x_position, pos_y=y_position)]
+    ))
+    module = EnergyDetectorTestModule(
+        n_setup_in='setup',
+        n_data_in='data',
+        n_planet_params_in='planets_est',
+        n_test_out='test',
+        pfa=0.01,
+        n_transformation_in='whitening' if whitening else None,
+        **kwargs
+    )
+    pipeline.add_module(module)
+
+    if whitening:
+        noise_ref = get_noise_reference_counts(module, setup.get_resource('setup').phringe).to(torch.float64)
+        eigenvalues, eigenvectors = torch.linalg.eigh(torch.cov(noise_ref.flatten(end_dim=1)))
+        matrix = eigenvectors @ torch.diag(eigenvalues ** -0.5) @ eigenvectors.T
+        pipeline.add_resource(TransformationResource('whitening', DenseOperator(matrix)))
+
+    pipeline.run()
+    return pipeline
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_neyman_pearson_test_of_stack_matches_single_realizations(setup, planet_counts, streaming) -> None:
+    """It gives the same test results for a stack of realizations as for each realization on its own."""
+    data = _get_noisy_data(planet_counts[-1], 5)
+    r_batch = _run_neyman_pearson_test(setup, data, streaming=streaming)
+
+    assert len(r_batch) == 5
+
+    for index in range(5):
+        r_single = _run_neyman_pearson_test(setup, data[index])
+
+        for key in ('test_statistic_h1', 'test_statistic_h0', 'threshold_xsi', 'model_length_xtx', 'p_value',
+                    'detection_probability', 'dimensions'):
+            assert getattr(r_batch[index], key) == pytest.approx(getattr(r_single, key), rel=1e-5), key
+
+
+def test_energy_detector_test_of_stack_matches_single_realizations(setup, planet_counts) -> None:
+    """It registers the results of a stack of realizations as a single resource with the results of each realization."""
+    data = _get_noisy_data(planet_counts[-1], 3)
+    pipeline = _run_energy_detector_test(setup, planet_counts, data)
+    r_batch = pipeline.get_resource('test')
+
+    assert isinstance(r_batch, test_result_batch.TestResultBatch) and len(r_batch) == 3
+    assert pipeline.get_resource('test_0') is None
+
+    for index in range(3):
+        r_single = _run_energy_detector_test(setup, planet_counts, data[index]).get_resource('test')
+
+        for key in ('test_statistic_h1', 'test_statistic_h0', 'threshold_xsi', 'model_length_xtx', 'p_value',
+                    'detection_probability', 'dimensions'):
+            assert getattr(r_batch[index], key) == pytest.approx(getattr(r_single, key), rel=1e-5), key
+
+
+def test_calibrated_threshold_of_whitened_noise_matches_chi_squared_distribution(setup, planet_counts) -> None:
+    """It calibrates the threshold and the detection probability of the analytic distributions for white noise."""
+    sed, x_position, y_position, counts = planet_counts
+    data = _get_noisy_data(counts, 2)
+
+    # The planet is dimmed so that its detection probability is neither zero nor one
+    planet_counts = (0.17 * sed, x_position, y_position, counts)
+    r_test = _run_energy_detector_test(
+        setup, planet_counts, data[0], whitening=True, n_calibration_samples=200000, calibration_batch_size=70000
+    ).get_resource('test')
+    r_batch = _run_energy_detector_test(
+        setup, planet_counts, data, whitening=True, n_calibration_samples=200000, calibration_batch_size=70000
+    ).get_resource('test')
+    threshold = ncx2.ppf(0.99, df=r_test.dimensions, nc=0)
+    lower, upper = r_test.threshold_xsi_interval
+
+    assert r_test.threshold_xsi == pytest.approx(threshold, rel=5e-3)
+    assert lower < threshold < upper
+    assert 0.1 < r_test.detection_probability < 0.9
+    assert r_test.detection_probability == pytest.approx(
+        ncx2.sf(r_test.threshold_xsi, df=r_test.dimensions, nc=r_test.model_length_xtx), abs=5e-3
+    )
+    assert r_test.p_value is None
+    assert r_batch[1].threshold_xsi == pytest.approx(r_test.threshold_xsi, rel=1e-6)
+    assert r_batch[1].detection_probability == pytest.approx(r_test.detection_probability)
+
+
+@pytest.mark.parametrize('bounds', [False, True])
+def test_analytical_jacobian_matches_finite_differences(setup, planet_counts, bounds) -> None:
+    """It gives the Jacobian of the residuals with respect to the internal variables of lmfit, including the scaling
+    of the columns of bounded parameters."""
+    sed, x_position, y_position, counts = planet_counts
+    phringe = setup.get_resource('setup').phringe
+    hfov_max = phringe.get_field_of_view()[-1].item() / 2
+    target = counts.permute(0, 2, 1).reshape(-1, len(sed)).numpy()
+    module = MLSEDEstimationModule('setup', 'data', 'planets_est', bounds=bounds)
+    params = module._get_parameters(1.1 * sed.numpy() + 1e3, 0.9 * x_position, 1.1 * y_position, hfov_max)
+
+    def get_residuals(variables):
+        for param, variable in zip(params.values(), variables):
+            param.value = param.from_internal(variable)
+        return module._get_residuals(params, target, phringe, lambda data: data).ravel()
+
+    # The internal variables of lmfit and the derivatives of the parameter values with respect to them
+    variables = np.array([param.setup_bounds() for param in params.values()])
+    grad_scale = np.array([param.scale_gradient(variable) for param, variable in zip(params.values(), variables)])
+
+    get_residuals(variables)
+    jacobian = module._get_jacobian(params, target, phringe, lambda data: data) * grad_scale
+
+    for index, step in enumerate(1e-6 * np.maximum(np.abs(variables), 1e-3)):
+        shift = np.zeros_like(variables)
+        shift[index] = step
+        column = (get_residuals(variables + shift) - get_residuals(variables - shift)) / (2 * step)
+
+        assert np.allclose(jacobian[:, index], column, rtol=1e-4, atol=1e-4 * np.abs(column).max()), index
+
+
+def test_analytical_jacobian_gives_same_fit_as_finite_differences(setup, planet_counts) -> None:
+    """It gives the same SED as the fit with the Jacobian calculated by lmfit with finite differences."""
+    pipeline = _get_pipeline(setup, _get_noisy_data(planet_counts[-1], 1)[0])
+
+    for analytical_jacobian in (False, True):
+        pipeline.add_module(MLSEDEstimationModule(
+            n_setup_in='setup',
+            n_data_in='data',
+            n_planets_in='planets',
+            n_planets_out=f'estimate_{analytical_jacobian}',
+            analytical_jacobian=analytical_jacobian
+        ))
+
+    pipeline.run()
+    sed = pipeline.get_resource('estimate_False').collection[0].sed
+    sed_analytical = pipeline.get_resource('estimate_True').collection[0].sed
+
+    assert np.linalg.norm(sed_analytical - sed) <= 1e-3 * np.linalg.norm(sed)
+
+
+def test_batch_estimation_matches_estimation_of_single_realizations(setup, planet_counts) -> None:
+    """It estimates the same SED and position for each realization of a stack as for the realization on its own."""
+    data = _get_noisy_data(planet_counts[-1], 3)
+    pipeline = _get_pipeline(setup, data)
+    pipeline.add_module(MLSEDBatchEstimationModule(
+        n_setup_in='setup',
+        n_data_in='data',
+        n_planets_in='planets',
+        n_planets_out='estimates',
+        batch_size=2
+    ))
+    pipeline.run()
+    r_estimates = pipeline.get_resource('estimates')
+
+    assert len(r_estimates.collection) == 3
+
+    for index, r_estimate in enumerate(r_estimates.collection):
+        pipeline = _get_pipeline(setup, data[index])
+        pipeline.add_module(MLSEDEstimationModule(
+            n_setup_in='setup',
+            n_data_in='data',
+            n_planets_in='planets',
+            n_planets_out='estimate',
+            solver='torch'
+        ))
+        pipeline.run()
+        r_single = pipeline.get_resource('estimate').collection[0]
+
+        assert np.allclose(r_estimate.sed, r_single.sed, rtol=1e-6, atol=1e-6 * np.abs(r_single.sed).max())
+        assert np.allclose(r_estimate.std, r_single.std, rtol=1e-6)
+        assert r_estimate.pos_x == pytest.approx(r_single.pos_x, rel=1e-6)
+        assert r_estimate.pos_y == pytest.approx(r_single.pos_y, rel=1e-6)
@@ -0,0 +1,67 @@
+"""Test cases for the linear operators."""
+import pickle
+
+import numpy as np
+import torch
+
+from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util.operators import BlockDiagonalOperator, DenseOperator, IdentityOperator, compose_operators
+
+
+def test_operators_match_explicit_matrix_products() -> None:
+    """It applies dense and block diagonal matrices to tensors, arrays and batches."""
+    torch.manual_seed(0)
+    data = torch.randn(5, 2, 3, 7, dtype=torch.float64)
+    blocks = torch.randn(2, 3, 3, dtype=torch.float64)
+    block_diagonal = BlockDiagonalOperator(blocks)
+    dense = DenseOperator(block_diagonal.get_matrix())
+
+    expected = torch.einsum('kml, bklt->bkmt', blocks, data)
+
+    assert torch.allclose(block_diagonal.apply_batch(data), expected)
+    assert torch.allclose(dense.apply_batch(data), expected)
+    assert torch.allclose(dense.apply(data[0]), expected[0])
+    assert np.allclose(dense(data[0].numpy()), expected[0].numpy())
+
+
+def test_composed_operators_apply_transformations_in_order() -> None:
+    """It gives the same result as applying the transformations one after the other."""
+    torch.manual_seed(0)
+    data = torch.randn(2, 3, 7, dtype=torch.float64)
+    first = BlockDiagonalOperator(torch.randn(2, 3, 3, dtype=torch.float64))
+    second = BlockDiagonalOperator(torch.randn(2, 3, 3, dtype=torch.float64))
+    third = DenseOperator(torch.randn(6, 6, dtype=torch.float64))
+
+    composed = first.compose(second).compose(IdentityOperator()).compose(third)
+
+    assert isinstance(first.compose(second), BlockDiagonalOperator)
+    assert isinstance(composed, DenseOperator)
+    assert torch.allclose(composed(data), third(second(first(data))))
+
+
+def test_fused_operators_transform_templates_like_data() -> None:
+    """It applies a fused chain of transformations to each template like to a single data set."""
+    torch.manual_seed(0)
+    templates = torch.randn(2, 3, 7, 4, 5, dtype=torch.float64)
+    operators = [
+        DenseOperator(torch.randn(6, 6, dtype=torch.float64)),
+        BlockDiagonalOperator(torch.randn(2, 3, 3, dtype=torch.float64))
+    ]
+    fused = compose_operators(operators)
+    expected = torch.stack(
+        [torch.stack([operators[1](operators[0](templates[..., i, j])) for j in range(5)], dim=-1) for i in range(4)],
+        dim=-2
+    )
+
+    assert isinstance(compose_operators([]), IdentityOperator)
+    assert torch.allclose(fused.apply_to_templates(templates), expected)
+    assert torch.allclose(operators[1].apply_to_templates(templates), operators[1].apply_batch(
+        templates.permute(3, 4, 0, 1, 2)).permute(2, 3, 4, 0, 1))
+
+
+def test_transformation_resource_can_be_pickled() -> None:
+    """It restores the transformation of a pickled resource."""
+    r_transformation = TransformationResource('zca', DenseOperator(torch.eye(6)))
+    r_transformation = pickle.loads(pickle.dumps(r_transformation))
+
+    assert torch.equal(r_transformation.transformation(torch.ones(2, 3, 4)), torch.ones(2, 3, 4))
@@ -0,0 +1,368 @@
+"""Test cases for the pipeline."""
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+import torch
+
+from lifesimmc.core.modules.base_module import BaseModule
+from lifesimmc.core.modules.generating.data_generation_module import DataGenerationModule
+from lifesimmc.core.modules.loading.setup_module import SetupModule
+from lifesimmc.core.pipeline import Pipeline
+from lifesimmc.core.resources.base_resource import BaseResource
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.spilled_resource import SpilledResource
+from lifesimmc.core.resources.transformation_resource import TransformationResource
+from lifesimmc.util.cache import LRUCache
+from lifesimmc.util.operators import DenseOperator
+from tests.conftest import get_preset
+
+
+class _ScaleModule(BaseModule):
+    """Module multiplying the data of a resource by a factor."""
+
+    def __init__(self, n_data_in: str, n_data_out: str, factor: float):
+        super().__init__()
+        self.n_data_in = n_data_in
+        self.n_data_out = n_data_out
+        self.factor = factor
+
+    def run(self, pipeline_resources: dict) -> tuple:
+        self.resources = pipeline_resources
+        r_data_in = self.get_resource_from_name(self.n_data_in)
+        r_data_out = DataResource(self.n_data_out)
+        r_data_out.set_data(self.factor * r_data_in.view())
+        return r_data_out,
+
+
+class _BarrierModule(_ScaleModule):
+    """Module that waits until a given number of modules run at the same time."""
+
+    def __init__(self, n_data_in: str, n_data_out: str, barrier: threading.Barrier):
+        super().__init__(n_data_in, n_data_out, factor=1)
+        self.barrier = barrier
+
+    def run(self, pipeline_resources: dict) -> tuple:
+        self.barrier.wait()
+        return super().run(pipeline_resources)
+
+
+class _TransformationModule(BaseModule):
+    """Module applying a transformation to the data of a resource."""
+
+    def __init__(self, n_data_in: str, n_transformation_in: str, n_data_out: str):
+        super().__init__()
+        self.n_data_in = n_data_in
+        self.n_transformation_in = n_transformation_in
+        self.n_data_out = n_data_out
+
+    def run(self, pipeline_resources: dict) -> tuple:
+        self.resources = pipeline_resources
+        transformation = self.get_resource_from_name(self.n_transformation_in).transformation
+        r_data_out = DataResource(self.n_data_out)
+        r_data_out.set_data(transformation(self.get_resource_from_name(self.n_data_in).view()))
+        return r_data_out,
+
+
+class _NoiseModule(BaseModule):
+    """Module seeding the random number generator if it has a seed and adding random noise to the data."""
+    uses_random_numbers = True
+
+    def __init__(self, n_data_in: str, n_data_out: str, seeded: bool, scale: float = 1):
+        super().__init__()
+        self.n_data_in = n_data_in
+        self.n_data_out = n_data_out
+        self.seeded = seeded
+        self.scale = scale
+        self.n_runs = 0
+
+    def run(self, pipeline_resources: dict) -> tuple:
+        self.resources = pipeline_resources
+        self.n_runs += 1
+
+        if self.seeded:
+            torch.manual_seed(self.seed)
+
+        r_data_out = DataResource(self.n_data_out)
+        r_data_out.set_data(self.get_resource_from_name(self.n_data_in).view() + self.scale * torch.rand(2, 3, 4))
+        return r_data_out,
+
+
+@dataclass
+class _ObjectResource(BaseResource):
+    """Resource holding an object of a class that is not registered as safe to load."""
+    value: object = None
+
+
+class _ObjectModule(BaseModule):
+    """Module wrapping the data of a resource in an object resource."""
+
+    def __init__(self, n_data_in: str, n_object_out: str):
+        super().__init__()
+        self.n_data_in = n_data_in
+        self.n_object_out = n_object_out
+
+    def run(self, pipeline_resources: dict) -> tuple:
+        self.resources = pipeline_resources
+        return _ObjectResource(self.n_object_out, value=self.get_resource_from_name(self.n_data_in)),
+
+
+def _get_pipeline(**kwargs) -> Pipeline:
+    """Return a pipeline with a chain of modules a -> b -> c -> d, where b is also used by the last module."""
+    pipeline = Pipeline(**kwargs)
+    r_data = DataResource('a')
+    r_data.set_data(torch.ones(2, 3, 4))
+    pipeline.add_resource(r_data)
+    pipeline.add_module(_ScaleModule(n_data_in='a', n_data_out='b', factor=2))
+    pipeline.add_module(_ScaleModule(n_data_in='b', n_data_out='c', factor=3))
+    pipeline.add_module(_ScaleModule(n_data_in='b', n_data_out='d', factor=4))
+    return pipeline
+
+
+def test_resources_are_evicted_after_their_last_use() -> None:
+    """It frees consumed resources that are not pinned and keeps the outputs of the run."""
+    pipeline = _get_pipeline(evict=True)
+    pipeline.pin('a')
+    pipeline.run()
+
+    assert set(pipeline._resources) == {'a', 'c', 'd'}
+    assert torch.equal(pipeline.get_resource('d').view(), torch.full((2, 3, 4), 8.))
+
+
+def test_evicted_resources_are_spilled_and_loaded_on_access(tmp_path) -> None:
+    """It spills evicted resources to disk and loads them again when they are accessed."""
+    pipeline = _get_pipeline(evict=True, spill_dir=tmp_path)
+    pipeline.run()
+
+    assert isinstance(pipeline._resources['b'], SpilledResource)
+    assert torch.equal(pipeline.get_resource('b').view(), torch.full((2, 3, 4), 2.))
+
+    pipeline.add_module(_ScaleModule(n_data_in='a', n_data_out='e', factor=5))
+    pipeline.run()
+
+    assert torch.equal(pipeline.get_resource('e').view(), torch.full((2, 3, 4), 5.))
+
+
+def test_resources_that_cannot_be_loaded_safely_are_not_spilled(tmp_path) -> None:
+    """It keeps evicted resources in memory if they hold objects of classes that are not registered as safe to load."""
+    pipeline = _get_pipeline(evict=True, spill_dir=tmp_path)
+    pipeline.add_module(_ObjectModule(n_data_in='c', n_object_out='f'))
+    pipeline.add_module(_ObjectModule(n_data_in='f', n_object_out='g'))
+    pipeline.run()
+
+    assert isinstance(pipeline._resources['c'], SpilledResource)
+    assert isinstance(pipeline._resources['f'], _ObjectResource)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.pt', 'b.pt', 'c.pt']
+
+
+def test_independent_modules_run_concurrently() -> None:
+    """It runs modules that do not depend on each other at the same time and the dependent modules afterwards."""
+    barrier = threading.Barrier(2, timeout=10)
+    pipeline = _get_pipeline(max_workers=2)
+    pipeline.add_module(_BarrierModule(n_data_in='a', n_data_out='e', barrier=barrier))
+    pipeline.add_module(_BarrierModule(n_data_in='a', n_data_out='f', barrier=barrier))
+
+    assert [[module.n_data_out for module in stage] for stage in pipeline.get_plan()] == [['b', 'e', 'f'], ['c', 'd']]
+
+    pipeline.run()
+
+    assert torch.equal(pipeline.get_resource('c').view(), torch.full((2, 3, 4), 6.))
+    assert torch.equal(pipeline.get_resource('f').view(), torch.ones(2, 3, 4))
+
+
+def test_missing_inputs_are_detected_before_running(capsys) -> None:
+    """It raises an error for inputs that are not available without running any module and prints dry run plans."""
+    pipeline = _get_pipeline()
+    pipeline.run(dry_run=True)
+
+    assert 'Stage 2:' in capsys.readouterr().out
+
+    pipeline.add_module(_ScaleModule(n_data_in='x', n_data_out='y', factor=1))
+
+    with pytest.raises(ValueError):
+        pipeline.run()
+
+    assert pipeline.get_resource('b') is None
+
+
+def test_dry_run_reports_sizes_that_depend_on_outputs_of_the_run_as_unknown(setup, capsys) -> None:
+    """It prints sizes that cannot be estimated before running as unknown instead of zero."""
+    preset = get_preset()
+    pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'))
+    pipeline.add_module(SetupModule(
+        n_setup_out='setup',
+        n_planets_out='planets',
+        scene=preset.scene,
+        instrument=preset._instrument,
+        observation=preset._observation
+    ))
+    pipeline.add_module(DataGenerationModule(n_setup_in='setup', n_data_out='data'))
+    pipeline.run(dry_run=True)
+    output = capsys.readouterr().out
+
+    assert 'data (unknown)' in output
+    assert 'Estimated peak memory of the resources: unknown (3 resources of unknown size)' in output
+
+    pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'))
+    pipeline.add_resource(setup.get_resource('setup'))
+    pipeline.add_module(DataGenerationModule(n_setup_in='setup', n_data_out='data'))
+    pipeline.run(dry_run=True)
+
+    assert 'unknown' not in capsys.readouterr().out
+
+
+def test_cached_outputs_are_reused_and_random_numbers_are_reproduced() -> None:
+    """It only reruns modules whose fingerprint changed and gives the same results as without cache."""
+    cache = LRUCache()
+    results = []
+
+    for scale, use_cache in ((1, False), (1, True), (2, True), (2, False)):
+        pipeline = _get_pipeline(seed=1, cache=cache if use_cache else None)
+        seeding_module = _NoiseModule(n_data_in='d', n_data_out='e', seeded=True)
+        noise_module = _NoiseModule(n_data_in='e', n_data_out='f', seeded=False, scale=scale)
+        pipeline.add_module(seeding_module)
+        pipeline.add_module(noise_module)
+        pipeline.run()
+        results.append((seeding_module.n_runs, noise_module.n_runs, pipeline.get_resource('f').view()))
+
+    assert [result[:2] for result in results] == [(1, 1), (1, 1), (0, 1), (1, 1)]
+    assert torch.equal(results[0][2], results[1][2])
+    assert torch.equal(results[2][2], results[3][2])
+
+
+def test_cached_outputs_depend_on_operators_and_not_on_functions() -> None:
+    """It fingerprints operators by their matrices and never caches outputs of resources holding functions."""
+    cache = LRUCache()
+    matrices = [torch.eye(100), torch.eye(100)]
+    matrices[1][50, 50] = 2
+    results = []
+
+    for matrix in matrices:
+        pipeline = Pipeline(cache=cache)
+        r_data = DataResource('a')
+        r_data.set_data(torch.ones(10, 10, 4))
+        pipeline.add_resource(r_data)
+        pipeline.add_resource(TransformationResource('zca', DenseOperator(matrix)))
+        pipeline.add_module(_TransformationModule(n_data_in='a', n_transformation_in='zca', n_data_out='b'))
+        pipeline.run()
+        results.append(pipeline.get_resource('b').view())
+
+    assert not torch.equal(results[0], results[1])
+    assert len(cache._entries) == 2
+
+    for _ in range(2):
+        pipeline = Pipeline(cache=cache)
+        r_data = DataResource('a')
+        r_data.set_batch_function(lambda start, stop: torch.ones(stop - start, 2, 3, 4), n_realizations=2)
+        pipeline.add_resource(r_data)
+        pipeline.add_module(_ScaleModule(n_data_in='a', n_data_out='b', factor=2))
+        pipeline.run()
+
+    assert len(cache._entries) == 2
+
+
+def test_outputs_of_setup_resources_are_cached_and_checkpointed(setup, tmp_path, capsys) -> None:
+    """It fingerprints a setup resource despite the references of PHRINGE objects to each other."""
+    cache = LRUCache()
+    results = []
+
+    for _ in range(2):
+        pipeline = Pipeline(seed=1, grid_size=10, device=torch.device('cpu'), cache=cache, checkpoint_dir=tmp_path)
+        pipeline.add_resource(setup.get_resource('setup'))
+        pipeline.add_module(DataGenerationModule(n_setup_in='setup', n_data_out='data'))
+        pipeline.run()
+        results.append(pipeline.get_resource('data').view())
+
+    assert 'from checkpoint' in capsys.readouterr().out
+    assert len(cache._entries) == 1
+    assert torch.equal(results[0], results[1])
+
+
+def test_profile_report_records_every_module(tmp_path) -> None:
+    """It records the resource usage of each module and writes a profiler trace per module."""
+    pipeline = _get_pipeline(trace_dir=tmp_path)
+    pipeline.run()
+    report = pipeline.get_profile_report()
+
+    assert [record['module'] for record in report] == ['_ScaleModule'] * 3
+    assert report[0]['output_bytes'] == {'b': 2 * 3 * 4 * 4}
+    assert all(record['wall_time'] >= 0 and not record['cached'] for record in report)
+    assert json.loads(pipeline.get_profile_report(format='json'))[2]['device'] == str(pipeline.device)
+    assert len(list(tmp_path.glob('*.json'))) == 3
+
+
+def test_profile_report_records_resident_set_size_per_module() -> None:
+    """It records the increase of the resident set size during each module instead of the peak of the process."""
+    pipeline = _get_pipeline(profile=True)
+    allocating_module = _ScaleModule(n_data_in='c', n_data_out='e', factor=1)
+    run = allocating_module.run
+
+    def run_with_temporary_memory(pipeline_resources):
+        memory = np.ones(200 * 1024 ** 2 // 8)
+        time.sleep(0.1)
+        del memory
+        return run(pipeline_resources)
+
+    allocating_module.run = run_with_temporary_memory
+    pipeline.add_module(allocating_module)
+    pipeline.add_module(_ScaleModule(n_data_in='e', n_data_out='f', factor=1))
+    pipeline.run()
+    report = pipeline.get_profile_report()
+
+    assert report[3]['peak_rss_increase'] > 150 * 1024 ** 2
+    assert report[3]['rss_increase'] < 50 * 1024 ** 2
+    assert report[4]['peak_rss_increase'] < 50 * 1024 ** 2
+
+
+def test_interrupted_pipeline_resumes_from_checkpoints(tmp_path) -> None:
+    """It restores the outputs of completed modules and only runs the remaining modules."""
+    results = []
+
+    for fail in (True, False, False):
+        pipeline = _get_pipeline(seed=1, checkpoint_dir=tmp_path)
+        seeding_module = _NoiseModule(n_data_in='d', n_data_out='e', seeded=True)
+        noise_module = _NoiseModule(n_data_in='e', n_data_out='f', seeded=False)
+        pipeline.add_module(seeding_module)
+        pipeline.add_module(noise_module)
+
+        if fail:
+            noise_module.run = None
+
+            with pytest.raises(TypeError):
+                pipeline.run()
+        else:
+            pipeline.run()
+            results.append((seeding_module.n_runs, noise_module.n_runs, pipeline.get_resource('f').view()))
+
+    reference = _get_pipeline(seed=1)
+    reference.add_module(_NoiseModule(n_data_in='d', n_data_out='e', seeded=True))
+    reference.add_module(_NoiseModule(n_data_in='e', n_data_out='f', seeded=False))
+    reference.run()
+
+    assert [result[:2] for result in results] == [(0, 1), (0, 0)]
+    assert torch.equal(results[0][2], reference.get_resource('f').view())
+    assert torch.equal(results[1][2], reference.get_resource('f').view())
+
+
+def test_checkpoints_are_loaded_safely(tmp_path) -> None:
+    """It only checkpoints outputs that can be loaded safely and runs modules again whose checkpoints are corrupt."""
+    results = []
+
+    for _ in range(2):
+        pipeline = _get_pipeline(seed=1, checkpoint_dir=tmp_path)
+        noise_module = _NoiseModule(n_data_in='d', n_data_out='e', seeded=True)
+        pipeline.add_module(noise_module)
+        pipeline.add_module(_ObjectModule(n_data_in='e', n_object_out='f'))
+        pipeline.run()
+        results.append((noise_module.n_runs, pipeline.get_resource('f').value.view()))
+
+        assert len(list(tmp_path.glob('*.pt'))) == 4
+
+        for path in tmp_path.glob('*.pt'):
+            path.write_bytes(b'PK\x03\x04')
+
+    assert results[0][0] == results[1][0] == 1
+    assert torch.equal(results[0][1], results[1][1])
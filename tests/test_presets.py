@@ -0,0 +1,52 @@
+"""Test cases for the presets."""
+import pickle
+
+import numpy as np
+import pytest
+
+from tests.conftest import get_preset
+
+
+def test_preset_can_be_pickled() -> None:
+    """It restores the parameters, instrument and observation of a pickled preset, which gives the same results."""
+    preset = get_preset()
+    restored = pickle.loads(pickle.dumps(preset))
+
+    assert restored.scene._phringe is None and restored._pipelines is None
+    assert restored._instrument.spectral_resolving_power == preset._instrument.spectral_resolving_power
+    assert restored._observation.total_integration_time == preset._observation.total_integration_time
+
+    preset.run()
+    restored.run()
+
+    assert np.allclose(restored.get_matched_filter(), preset.get_matched_filter())
+
+
+def test_matched_filter_has_one_map_per_repetition() -> None:
+    """It returns the matched filter maps of all repetitions, which are the same with the serial and thread backend."""
+    maps = []
+
+    for backend in ('serial', 'thread'):
+        preset = get_preset(num_reps=3, backend=backend, num_workers=2)
+        preset.run()
+        maps.append(preset.get_matched_filter())
+
+    assert maps[0].shape == (3, 10, 10)
+    assert not np.allclose(maps[0][0], maps[0][1])
+    assert np.allclose(maps[0], maps[1])
+
+
+def test_process_backend_gives_the_same_results_as_serial_backend() -> None:
+    """It performs the requested analyses in worker processes, which gives the same results as the serial backend."""
+    analyses = ('significance', 'matched_filter')
+    serial = get_preset(num_reps=2, analyses=analyses)
+    process = get_preset(num_reps=2, backend='process', num_workers=2, analyses=analyses)
+    serial.run()
+    process.run()
+
+    assert all(set(result) == set(analyses) for result in process._results)
+    assert np.allclose(process.get_detection_significance(), serial.get_detection_significance())
+    assert np.allclose(process.get_matched_filter(), serial.get_matched_filter())
+
+    with pytest.raises(RuntimeError, match='sed'):
+        process.extract_sed()
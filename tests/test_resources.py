@@ -0,0 +1,148 @@
+"""Test cases for the resources."""
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from scipy.stats import chi2, ncx2, norm
+
+from lifesimmc.core.resources import test_result_batch
+from lifesimmc.core.resources.base_resource import get_bytes_copied
+from lifesimmc.core.resources.data_resource import DataResource
+from lifesimmc.core.resources.template_resource import TemplateResource
+
+
+def test_streaming_templates_match_stored_templates() -> None:
+    """It yields the same templates in tiles whether they are stored or generated on demand."""
+    data = torch.rand(2, 3, 4, 5, 5)
+    grid_coordinates = torch.zeros(2, 5, 5)
+
+    r_stored = TemplateResource(name='stored', grid_coordinates=grid_coordinates)
+    r_stored.set_data(data)
+
+    r_streaming = TemplateResource(name='streaming', grid_coordinates=grid_coordinates)
+    r_streaming.set_tile_function(lambda start, stop: data[..., start:stop, :], tile_size=2)
+
+    assert r_streaming.is_streaming and not r_stored.is_streaming
+    assert [tile.shape[-2] for tile in r_streaming.get_tiles()] == [2, 2, 1]
+    assert torch.equal(torch.cat(list(r_stored.get_tiles(tile_size=2)), dim=-2), data)
+    assert torch.equal(r_streaming.get_data(), data)
+
+
+def test_template_norms_and_gram_are_cached_until_templates_are_set() -> None:
+    """It computes the norms and Gram matrices once and clears them when new templates are set."""
+    data = torch.rand(2, 3, 4, 5, 5, dtype=torch.float64)
+    r_template = TemplateResource(name='templates', grid_coordinates=torch.zeros(2, 5, 5), tile_size=2)
+    r_template.set_tile_function(lambda start, stop: data[..., start:stop, :], tile_size=2)
+
+    gram = r_template.get_gram()
+    norms = r_template.get_norms()
+
+    assert r_template.has_gram and r_template.get_norms() is norms
+    assert torch.allclose(norms, torch.linalg.vector_norm(data, dim=(0, 1, 2)))
+    assert torch.allclose(gram[1, 2], torch.einsum('kjt, kmt->jm', data[..., 1, 2], data[..., 1, 2]))
+
+    r_template.set_data(2 * data)
+
+    assert not r_template.has_gram
+    assert torch.allclose(r_template.get_norms(), 2 * norms)
+
+
+def test_streaming_data_matches_stored_data() -> None:
+    """It yields the same realizations in batches whether they are stored or generated on demand."""
+    data = torch.rand(7, 2, 3, 4)
+
+    r_stored = DataResource(name='stored')
+    r_stored.set_data(data)
+
+    r_streaming = DataResource(name='streaming')
+    r_streaming.set_batch_function(lambda start, stop: data[start:stop], n_realizations=7, batch_size=3)
+
+    assert r_streaming.is_streaming and not r_stored.is_streaming
+    assert [batch.shape[0] for batch in r_streaming.get_batches()] == [3, 3, 1]
+    assert torch.equal(torch.cat(list(r_stored.get_batches(batch_size=2))), data)
+    assert torch.equal(r_streaming.view(), data)
+
+
+def test_views_are_not_copied_and_in_place_modifications_are_detected() -> None:
+    """It only counts copies made with clone and raises an error after a view has been modified in place."""
+    r_data = DataResource(name='data')
+    r_data.set_data(torch.zeros(2, 3, 4))
+    bytes_copied = get_bytes_copied()
+
+    r_data.view()
+    r_data.clone().add_(1)
+    assert get_bytes_copied() - bytes_copied == 2 * 3 * 4 * 4
+
+    r_data.view().add_(1)
+    with pytest.raises(RuntimeError):
+        r_data.view()
+
+
+@pytest.mark.parametrize('resource', [
+    DataResource(name='data'),
+    TemplateResource(name='templates', grid_coordinates=torch.zeros(2, 4, 4))
+])
+def test_data_and_templates_are_protected_after_unpickling(resource) -> None:
+    """It protects the data of data and template resources against in-place modifications after unpickling."""
+    resource.set_data(torch.zeros(2, 3, 4, 4))
+    resource.view().add_(1)
+    with pytest.raises(RuntimeError, match='modified in place'):
+        resource.clone()
+
+    resource = pickle.loads(pickle.dumps(resource))
+
+    assert torch.equal(resource.view(), torch.ones(2, 3, 4, 4))
+    resource.view().add_(1)
+    with pytest.raises(RuntimeError, match='modified in place'):
+        resource.view()
+
+
+def test_test_result_batches_match_single_test_results(tmp_path) -> None:
+    """It computes the same p-values and detection probabilities as the single tests and restores saved results."""
+    rng = np.random.default_rng(0)
+    test_h1 = rng.chisquare(10, size=1000) + 5
+    r_batch = test_result_batch.TestResultBatch.from_energy_detector(
+        name='test',
+        test_statistic_h1=test_h1,
+        test_statistic_h0=test_h1 - 5,
+        model_length_xtx=5,
+        dimensions=10,
+        probability_false_alarm=0.01
+    )
+
+    assert len(r_batch) == 1000 and r_batch.test_statistic_h1.dtype == np.float32
+    assert r_batch[3].p_value == pytest.approx(chi2.sf(test_h1[3], df=10))
+    assert r_batch[3].detection_probability == pytest.approx(ncx2.sf(chi2.ppf(0.99, df=10), df=10, nc=5), rel=1e-6)
+    assert np.array_equal(r_batch.get_detections(), test_h1.astype(np.float32) > r_batch.threshold_xsi)
+
+    r_batch = test_result_batch.TestResultBatch.concatenate(
+        'test',
+        [r_batch, test_result_batch.TestResultBatch.from_test_resources('single', [r_batch[0], r_batch[1]])]
+    )
+    r_batch.save_npz(tmp_path / 'test.npz')
+    r_loaded = test_result_batch.TestResultBatch.load_npz(tmp_path / 'test.npz')
+
+    assert len(r_loaded) == 1002 and r_loaded.dimensions == 10 and r_loaded.probability_false_alarm == 0.01
+    assert all(np.array_equal(r_loaded.get_columns()[key], value) for key, value in r_batch.get_columns().items())
+
+
+def test_neyman_pearson_batches_match_single_test_results() -> None:
+    """It evaluates the Neyman-Pearson test of all realizations like the test of a single realization."""
+    rng = np.random.default_rng(0)
+    model = rng.normal(size=50)
+    data = rng.normal(size=(200, 50)) + model
+    xtx = model @ model
+    r_batch = test_result_batch.TestResultBatch.from_neyman_pearson(
+        name='test',
+        test_statistic_h1=data @ model,
+        test_statistic_h0=data @ model - xtx,
+        model_length_xtx=xtx,
+        dimensions=50,
+        probability_false_alarm=0.01
+    )
+    threshold_xsi = np.sqrt(xtx) * norm.ppf(0.99)
+
+    assert r_batch[7].test_statistic_h0 == pytest.approx((data[7] - model) @ model, rel=1e-5)
+    assert r_batch[7].p_value == pytest.approx(norm.sf(data[7] @ model / np.sqrt(xtx)))
+    assert r_batch[7].detection_probability == pytest.approx(1 - norm.cdf((threshold_xsi - xtx) / np.sqrt(xtx)))
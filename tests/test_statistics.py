@@ -0,0 +1,46 @@
+"""Test cases for the statistics utilities."""
+import numpy as np
+import pytest
+import torch
+from scipy.stats import chi2, ncx2
+
+from lifesimmc.util.statistics import TailQuantileEstimator, sample_energy_statistics
+
+
+def test_tail_quantile_estimator_matches_sorted_samples() -> None:
+    """It gives the same quantile as sorting all samples and a confidence interval around it."""
+    torch.manual_seed(0)
+    samples = torch.randn(100000, dtype=torch.float64)
+    estimator = TailQuantileEstimator(probability=1e-3, n_samples=len(samples))
+
+    for batch in samples.split(7000):
+        estimator.add(batch)
+
+    lower, upper = estimator.get_confidence_interval()
+
+    assert estimator.get_quantile() == torch.sort(samples, descending=True).values[100].item()
+    assert lower < estimator.get_quantile() < upper
+    assert len(estimator._largest) < 200
+
+    with pytest.raises(ValueError):
+        TailQuantileEstimator(probability=1e-3, n_samples=100)
+
+
+def test_energy_statistics_of_white_noise_follow_chi_squared_distribution() -> None:
+    """It draws the energy of white noise with the number of data points as degrees of freedom."""
+    torch.manual_seed(0)
+    statistics = sample_energy_statistics(torch.eye(6, dtype=torch.float64), n_time_steps=20, n_samples=200000)
+
+    assert statistics.mean().item() == pytest.approx(120, rel=1e-2)
+    assert np.quantile(statistics.numpy(), 0.99) == pytest.approx(chi2.ppf(0.99, df=120), rel=1e-2)
+
+
+def test_energy_statistics_of_model_in_white_noise_follow_non_central_chi_squared_distribution() -> None:
+    """It draws the energy of a model in white noise with the energy of the model as non-centrality."""
+    torch.manual_seed(0)
+    model = 0.5 * torch.randn(6, 20, dtype=torch.float64)
+    statistics = sample_energy_statistics(torch.eye(6, dtype=torch.float64), 20, 200000, model=model)
+    non_centrality = (model ** 2).sum().item()
+
+    assert statistics.mean().item() == pytest.approx(120 + non_centrality, rel=1e-2)
+    assert np.quantile(statistics.numpy(), 0.99) == pytest.approx(ncx2.ppf(0.99, 120, non_centrality), rel=1e-2)
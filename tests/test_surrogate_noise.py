@@ -0,0 +1,69 @@
+"""Test cases for the surrogate noise module."""
+import pickle
+
+import torch
+
+from lifesimmc.core.modules.generating.surrogate_noise_module import SurrogateNoiseModule, SurrogateNoiseSampler
+from lifesimmc.core.resources.data_resource import DataResource
+
+
+def _get_noise_resource(rank: int = None, n_samples: int = 20000) -> tuple[DataResource, torch.Tensor]:
+    """Return a streaming resource of realizations of a model fitted to samples of a synthetic covariance and the
+    covariance of the model."""
+    torch.manual_seed(0)
+    factor = torch.randn(6, 2, dtype=torch.float64)
+    covariance = factor @ factor.T + torch.diag(torch.rand(6, dtype=torch.float64) + 0.5)
+    samples = torch.linalg.cholesky(covariance) @ torch.randn(6, n_samples, dtype=torch.float64) + 3
+
+    module = SurrogateNoiseModule('setup', 'noise', n_realizations=7, rank=rank, batch_size=3)
+    mean, factor, diagonal = module._fit_noise_model(samples)
+    sampler = SurrogateNoiseSampler(
+        mean=mean,
+        factor=factor,
+        diagonal=diagonal,
+        base_seed=1,
+        batch_size=3,
+        n_realizations=7,
+        shape=(2, 3, 5000)
+    )
+
+    r_noise = DataResource('noise')
+    r_noise.set_batch_function(sampler, n_realizations=7, batch_size=3)
+
+    # Covariance of the fitted model, which is the sample covariance for the full model
+    covariance = factor @ factor.T + (torch.diag(diagonal[:, 0] ** 2) if diagonal is not None else 0)
+
+    return r_noise, covariance
+
+
+def test_surrogate_noise_is_reproducible_and_can_be_pickled() -> None:
+    """It returns the same realizations on every access, for any batch, and after pickling."""
+    r_noise, _ = _get_noise_resource()
+    noise = r_noise.view()
+
+    assert noise.shape == (7, 2, 3, 5000)
+    assert torch.equal(r_noise.view(), noise)
+    assert torch.equal(r_noise.get_batch(2, 5), noise[2:5])
+    assert torch.equal(pickle.loads(pickle.dumps(r_noise)).get_batch(4, 7), noise[4:7])
+
+
+def test_surrogate_noise_has_fitted_covariance() -> None:
+    """It samples realizations with the fitted covariance, with the full and a low-rank model."""
+    for rank in (None, 2):
+        r_noise, covariance = _get_noise_resource(rank=rank)
+        samples = r_noise.view().reshape(7, 6, -1).transpose(0, 1).reshape(6, -1)
+
+        assert torch.allclose(samples.mean(dim=-1), torch.full((6,), 3, dtype=torch.float64), atol=0.05)
+        assert torch.allclose(torch.cov(samples), covariance, atol=0.05 * covariance.diag().max())
+
+
+def test_surrogate_noise_of_singular_covariance_falls_back_to_eigendecomposition() -> None:
+    """It factorizes covariances estimated from fewer samples than channels."""
+    torch.manual_seed(0)
+    samples = torch.randn(6, 4, dtype=torch.float64)
+
+    _, factor, diagonal = SurrogateNoiseModule('setup', 'noise', n_realizations=1)._fit_noise_model(samples)
+
+    assert diagonal is None
+    assert torch.linalg.cholesky_ex(torch.cov(samples)).info > 0
+    assert torch.allclose(factor @ factor.T, torch.cov(samples))
@@ -0,0 +1,19 @@
+"""Test cases for the template store."""
+import torch
+
+from lifesimmc.util.template_store import TemplateStore
+
+
+def test_template_store_saves_tiles_and_loads_memory_mapped_templates(tmp_path) -> None:
+    """It restores the templates from their tiles and does not change the stored file when they are modified."""
+    store = TemplateStore(tmp_path)
+    templates = torch.rand(1, 3, 4, 5, 5)
+
+    assert store.load('key') is None
+
+    loaded = store.save('key', (templates[..., i:i + 2, :] for i in range(0, 5, 2)), n_rows=5)
+    loaded[0, 0, 0, 0, 0] = -1
+
+    assert 'key' in store
+    assert [path.name for path in tmp_path.iterdir()] == ['key.npy']
+    assert torch.equal(TemplateStore(tmp_path).load('key'), templates)